@@ -1,9 +1,16 @@
 # Import external modules
-import os
+import io, os, statistics, threading, time
 from pathlib import Path
 
 # Import self-made modules
-from utils import OcrService, PROCESSED_OCR_IMAGES ,define_directories, load_env_file, is_a_file_an_image, save_results_to_file, natural_sort_files
+from utils import OcrService, define_directories, load_env_file, is_a_file_an_image, is_processed_image, save_results_to_file, natural_sort_files, run_concurrently
+from rate_limiter import rate_limited_call
+from run_manifest import RunManifest, hash_bytes, hash_request
+from response_cache import ResponseCache
+from image_pipeline import read_image_bytes
+from telemetry import RunTelemetry
+from results_store import ResultsStore
+from page_bundles import BUNDLE_SIZE, build_bundle, bundle_name, group_pages
 
 # Import Azure SDK modules
 from azure.core.credentials import AzureKeyCredential
@@ -11,8 +18,23 @@ from azure.ai.documentintelligence import DocumentIntelligenceClient
 from azure.ai.documentintelligence.models import AnalyzeDocumentRequest
 from azure.core.exceptions import HttpResponseError
 
-# Define the OCR service being used
+# Define the OCR service being used and its model
 SERVICE = OcrService.AZURE
+MODEL_NAME = "prebuilt-read"
+
+# Analyze operations running on Azure's side at the same time. Every operation is submitted as soon as a slot
+# is free and its poller checks its status in the background, so the waits overlap (1 analyses one image at a time).
+MAX_PENDING_OPERATIONS = 8
+
+# Bounds of the interval between two status checks of an operation, in seconds
+MIN_POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 5.0
+
+# Send the pages as multi-page documents of up to BUNDLE_SIZE pages instead of one request per page
+BUNDLE = False
+
+# Format of the bundled documents ('TIFF' keeps the pages lossless, 'PDF' stores them as high-quality JPEG)
+BUNDLE_FORMAT = 'TIFF'
 
 # Load environment variables
 load_env_file()
@@ -26,15 +48,42 @@ if not api_key or not endpoint:
     print("DOCUMENTINTELLIGENCE_API_KEY or DOCUMENTINTELLIGENCE_ENDPOINT is not set in the .env file.")
     exit(1)
 
+class AdaptivePollInterval:
+    '''
+    Polling interval of the analyze operations, adapted to the operations completed so far.
+    New operations check their status every quarter of the median analysis time, so a typical operation
+    is checked about four times: often for fast single-page scans, rarely for slow ones.
+    A Retry-After header sent by Azure takes precedence over this interval.
+    '''
+    def __init__(self, min_interval: float = MIN_POLL_INTERVAL, max_interval: float = MAX_POLL_INTERVAL):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.durations = []
+        self.lock = threading.Lock()
+
+    def record(self, duration: float):
+        with self.lock:
+            self.durations.append(duration)
+
+    def current(self) -> float:
+        with self.lock:
+            if not self.durations:
+                return self.min_interval
+            return min(max(statistics.median(self.durations) / 4, self.min_interval), self.max_interval)
+
 # THE BELOW CODE IS ADAPTED FROM AZURE DOCUMENT INTELLIGENCE GUIDELINE:
 # https://github.com/Azure-Samples/document-intelligence-code-samples/blob/main/Python(v4.0)/Read_model/sample_analyze_read.py
 
-def analyse_read():
+def analyse_read(resume: bool = True, use_cache: bool = True, max_pending: int = MAX_PENDING_OPERATIONS, bundle: bool = BUNDLE, bundle_size: int = BUNDLE_SIZE):
     """
     Function to analyse images using Azure Document Intelligence service.
     It connects to the Azure service, retrieves images from a specified directory,
     and sends them to the Azure Document Intelligence API for text recognition.
     The results are saved to a file in a specified results directory.
+    With resume, images completed by a previous run (see run_manifest.json) are skipped.
+    With use_cache, an image analysed before with the same model is answered from the response cache.
+    Up to max_pending analyze operations run at the same time, their results are saved as they complete.
+    With bundle, up to bundle_size pages are sent as one multi-page document and every page is saved to its own result file.
     """
     # Create a Document Intelligence client
     print("Connecting to Azure Document Intelligence service...\n")
@@ -46,38 +95,128 @@ def analyse_read():
     images_dir, image_files, results_dir = define_directories(SERVICE)
 
     # Only process images in PROCESSED_OCR_IMAGES and sort them naturally
-    image_files = [f for f in image_files if Path(f).name in PROCESSED_OCR_IMAGES]
+    image_files = [f for f in image_files if is_processed_image(f)]
     image_files = natural_sort_files(image_files)
 
     if not image_files:
         print(f"No images found in {images_dir}.")
         return
 
+    # Images completed by a previous run with the same model and image content are skipped
+    manifest = RunManifest(results_dir / 'run_manifest.json')
+    prompt_hash = hash_request({"model": MODEL_NAME})
+    response_cache = ResponseCache() if use_cache else None
+    telemetry = RunTelemetry(results_dir, SERVICE, MODEL_NAME, 'bundle' if bundle else 'sync' if max_pending <= 1 else 'fan-out')
+    poll_interval = AdaptivePollInterval()
+    results_store = ResultsStore()
+
     print('---------- Azure service analysis started ----------')
 
-    for image_path in image_files:
-        # Check if the file is an image
-        if not is_a_file_an_image(image_path):
-            print(f"\nSkipping {Path(image_path).name}, not a supported image format.")
-            continue
+    def analyse_document(document_bytes: bytes, stats: dict | None) -> tuple[list[list[str]], bool]:
+        '''
+        Analyse one image or multi-page document, answered from the response cache if it was analysed before.
+        Returns:
+            tuple: (lines of text of every page, in page order, whether the response came from the cache)
+        '''
+        cache_key = ResponseCache.make_key('azure', MODEL_NAME, prompt_hash, hash_bytes(document_bytes))
+        cached = response_cache.get(cache_key) if response_cache else None
+        if cached:
+            return cached["pages"], True
+
+        # A fresh stream is created for every attempt, so a rate-limited request can be resent.
+        submitted = time.perf_counter()
+        poller = rate_limited_call(
+            'azure', MODEL_NAME,
+            lambda: document_intelligence_client.begin_analyze_document(
+                MODEL_NAME, io.BytesIO(document_bytes), polling_interval=poll_interval.current()
+            ),
+            stats=stats,
+        )
+        # The analysis runs on Azure's side after the submission, its polling is part of the request latency
+        with telemetry.measure('request_latency'):
+            result = poller.result()
+        poll_interval.record(time.perf_counter() - submitted)
+
+        # Collect all lines of text of every page, by page number
+        pages = [[] for _ in result.pages]
+        for page in result.pages:
+            pages[page.page_number - 1] = [line.content for line in page.lines or []]
+
+        if response_cache:
+            response_cache.put(cache_key, {"pages": pages})
+        return pages, False
+
+    def save_result(image_path, lines: list[str], cached: bool, latency: float | None):
+        # Save recognised text to file
+        text = '\n'.join(lines)
+        result_file = save_results_to_file(SERVICE, text, Path(image_path).stem, results_dir)
+        results_store.append(SERVICE, MODEL_NAME, prompt_hash, Path(image_path).name, result_file.name, text, latency=latency, cached=cached)
+        return {"image": Path(image_path).name, "result_file": result_file, "cached": cached}
 
+    def analyse_image(image_path):
         print(f"\nAnalysing {Path(image_path).name} by Azure service...")
 
-        # Open the image file and send it to the Azure Document Intelligence service
-        with open(image_path, 'rb') as f:
-            poller = document_intelligence_client.begin_analyze_document(
-                "prebuilt-read", f
+        # Send the image to the Azure Document Intelligence service, or answer it from the response cache
+        with telemetry.measure('image_load_time'):
+            image_bytes = read_image_bytes(image_path)
+        pages, cached = analyse_document(image_bytes, telemetry.current())
+        if cached:
+            print(f"Using cached response for {Path(image_path).name}.")
+        lines = [line for page_lines in pages for line in page_lines]
+        return save_result(image_path, lines, cached, (telemetry.current() or {}).get('request_latency'))
+
+    def analyse_bundle(bundle_paths: list):
+        # Send the pages as one document, then save and record every page as its own image
+        print(f"\nAnalysing {bundle_name(bundle_paths)} by Azure service...")
+        stats, start = {}, time.perf_counter()
+        try:
+            document_bytes = build_bundle(bundle_paths, BUNDLE_FORMAT)
+            encode_time = time.perf_counter() - start
+            pages, cached = analyse_document(document_bytes, stats)
+            if cached:
+                print(f"Using cached response for {bundle_name(bundle_paths)}.")
+            if len(pages) != len(bundle_paths):
+                raise RuntimeError(f"{len(pages)} page(s) returned for a document of {len(bundle_paths)} page(s)")
+            error = None
+        except Exception as e:
+            encode_time, error = None, e
+        latency = None if error or cached else time.perf_counter() - start - encode_time
+
+        def save_page(image_path):
+            if error is not None:
+                raise error
+            return save_result(image_path, pages[bundle_paths.index(image_path)], cached, latency)
+
+        for image_path in bundle_paths:
+            telemetry.track(
+                image_path, lambda image_path: manifest.run_image(image_path, image_keys[image_path], save_page),
+                **{**stats, 'encode_time': encode_time, 'request_latency': latency},
             )
-            result = poller.result()
 
-        # Collect all lines of text
-        lines = []
-        for page in result.pages:
-            for line in page.lines:
-                lines.append(line.content)
+    image_keys = {}
+    for image_path in image_files:
+        # Check if the file is an image
+        if not is_a_file_an_image(image_path):
+            print(f"\nSkipping {Path(image_path).name}, not a supported image format.")
+            continue
 
-        # Save recognised text to file
-        save_results_to_file(SERVICE, '\n'.join(lines), Path(image_path).stem, results_dir)
+        image_key = RunManifest.make_key(SERVICE, MODEL_NAME, prompt_hash, hash_bytes(read_image_bytes(image_path)))
+        if resume and manifest.is_completed(image_key):
+            print(f"\nSkipping {Path(image_path).name}, already completed in a previous run.")
+            continue
+        image_keys[image_path] = image_key
+
+    # Every worker submits an operation and waits for its poller, so at most max_pending operations are in flight
+    if bundle:
+        run_concurrently(analyse_bundle, group_pages(list(image_keys), 'azure', bundle_size), max_pending)
+    else:
+        run_concurrently(
+            lambda image_path: telemetry.track(image_path, lambda image_path: manifest.run_image(image_path, image_keys[image_path], analyse_image)),
+            list(image_keys), max_pending,
+        )
+
+    telemetry.summarise()
+    results_store.close()
 
     print('\n---------- Azure service analysis finished ----------')
 
@@ -0,0 +1,175 @@
+# Import external modules
+import hashlib, json, re, time
+from pathlib import Path
+
+# Import OpenAI SDK modules
+from openai.types import CompletionUsage
+
+# Seconds between two status checks of a batch job (batches usually finish within an hour, at most 24 hours)
+BATCH_POLL_INTERVAL = 60
+
+# Both providers bill batch requests at half of the synchronous price
+BATCH_PRICE_MULTIPLIER = 0.5
+
+# Maximum size of one batch job. Anthropic accepts up to 256 MB per batch and OpenAI up to 200 MB per input file,
+# every request carries its few-shot example images, so large runs are split into several jobs.
+BATCH_MAX_BYTES = 190 * 1024 * 1024
+
+# THE BELOW CODE FOLLOWS THE PROVIDERS' BATCH PROCESSING GUIDELINES:
+# https://docs.anthropic.com/en/docs/build-with-claude/batch-processing
+# https://platform.openai.com/docs/guides/batch
+
+def make_custom_id(image_path) -> str:
+    # Both providers only accept letters, digits, '_' and '-' (at most 64 characters) in a custom id
+    stem = Path(image_path).stem
+    custom_id = re.sub(r'[^A-Za-z0-9_-]', '-', stem)
+    if custom_id == stem and len(custom_id) <= 64:
+        return custom_id
+    # Replacing or truncating characters can map two stems to one id, a hash of the stem keeps them apart
+    return f"{custom_id[:55]}-{hashlib.sha256(stem.encode('utf-8')).hexdigest()[:8]}"
+
+def split_requests_by_size(requests: dict, max_bytes: int = BATCH_MAX_BYTES) -> list[dict]:
+    '''
+    Split batch requests into chunks whose serialised size stays under max_bytes.
+    Args:
+        requests (dict): Request parameters by custom id.
+        max_bytes (int): Maximum serialised size of one chunk.
+    Returns:
+        list[dict]: The chunks, each mapping custom ids to request parameters.
+    '''
+    chunks, chunk, chunk_bytes = [], {}, 0
+    for custom_id, params in requests.items():
+        size = len(json.dumps(params))
+        if chunk and chunk_bytes + size > max_bytes:
+            chunks.append(chunk)
+            chunk, chunk_bytes = {}, 0
+        chunk[custom_id] = params
+        chunk_bytes += size
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def load_pending_batches(state_path: Path, prompt_hash: str, custom_ids: list[str]) -> list[str] | None:
+    '''
+    Return the ids of batch jobs submitted by an interrupted run for exactly the same prompt and images,
+    so that they are polled again instead of being submitted (and paid for) twice.
+    '''
+    if not state_path.exists():
+        return None
+    state = json.loads(state_path.read_text(encoding='utf-8'))
+    if state.get('prompt_hash') != prompt_hash or state.get('custom_ids') != sorted(custom_ids):
+        return None
+    return state['batch_ids']
+
+def save_pending_batches(state_path: Path, prompt_hash: str, custom_ids: list[str], batch_ids: list[str]):
+    state = {'prompt_hash': prompt_hash, 'custom_ids': sorted(custom_ids), 'batch_ids': batch_ids}
+    state_path.write_text(json.dumps(state, indent=2), encoding='utf-8')
+
+def run_claude_batch(client, requests: dict, state_path: Path, prompt_hash: str, read_usage, poll_interval: float = BATCH_POLL_INTERVAL) -> dict:
+    '''
+    Send requests through the Claude Message Batches API and wait for their results.
+    Args:
+        client (Anthropic): The Claude client.
+        requests (dict): Messages API parameters by custom id.
+        state_path (Path): File recording the submitted batch ids, so an interrupted run can resume polling.
+        prompt_hash (str): Hash of the prompt shared by the requests.
+        read_usage (callable): Converts the usage object of a response to a dict of token counts.
+        poll_interval (float): Seconds between two status checks.
+    Returns:
+        dict: By custom id, either {'text', <token counts>} or {'error'}.
+    '''
+    batch_ids = load_pending_batches(state_path, prompt_hash, list(requests))
+    if batch_ids:
+        print(f"Resuming Claude batch job(s) {', '.join(batch_ids)} from a previous run...")
+    else:
+        batch_ids = []
+        for chunk in split_requests_by_size(requests):
+            batch = client.messages.batches.create(
+                requests=[{"custom_id": custom_id, "params": params} for custom_id, params in chunk.items()]
+            )
+            batch_ids.append(batch.id)
+            print(f"Submitted Claude batch job {batch.id} with {len(chunk)} request(s).")
+        save_pending_batches(state_path, prompt_hash, list(requests), batch_ids)
+
+    results = {}
+    for batch_id in batch_ids:
+        # Poll until the batch has ended (all requests succeeded, errored, were canceled or expired)
+        batch = client.messages.batches.retrieve(batch_id)
+        while batch.processing_status != 'ended':
+            counts = batch.request_counts
+            print(f"Batch {batch_id} {batch.processing_status}: {counts.succeeded} succeeded, {counts.errored} errored, {counts.processing} processing...")
+            time.sleep(poll_interval)
+            batch = client.messages.batches.retrieve(batch_id)
+
+        for entry in client.messages.batches.results(batch_id):
+            if entry.result.type == 'succeeded':
+                message = entry.result.message
+                results[entry.custom_id] = {"text": message.content[0].text, **read_usage(message.usage)}
+            else:
+                error = getattr(entry.result, 'error', None)
+                results[entry.custom_id] = {"error": f"batch request {entry.result.type}" + (f": {error}" if error else "")}
+
+    state_path.unlink(missing_ok=True)
+    return results
+
+def run_gpt_batch(client, requests: dict, state_path: Path, prompt_hash: str, read_usage, poll_interval: float = BATCH_POLL_INTERVAL) -> dict:
+    '''
+    Send requests through the OpenAI Batch API and wait for their results.
+    Args:
+        client (OpenAI): The OpenAI client.
+        requests (dict): Chat Completions API parameters by custom id.
+        state_path (Path): File recording the submitted batch ids, so an interrupted run can resume polling.
+        prompt_hash (str): Hash of the prompt shared by the requests.
+        read_usage (callable): Converts the usage object of a response to a dict of token counts.
+        poll_interval (float): Seconds between two status checks.
+    Returns:
+        dict: By custom id, either {'text', <token counts>} or {'error'}.
+    '''
+    batch_ids = load_pending_batches(state_path, prompt_hash, list(requests))
+    if batch_ids:
+        print(f"Resuming OpenAI batch job(s) {', '.join(batch_ids)} from a previous run...")
+    else:
+        batch_ids = []
+        for chunk in split_requests_by_size(requests):
+            # The requests are uploaded as a JSONL file, one request per line
+            lines = [
+                json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body})
+                for custom_id, body in chunk.items()
+            ]
+            input_file = client.files.create(file=("batch_input.jsonl", '\n'.join(lines).encode('utf-8')), purpose="batch")
+            batch = client.batches.create(input_file_id=input_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+            batch_ids.append(batch.id)
+            print(f"Submitted OpenAI batch job {batch.id} with {len(chunk)} request(s).")
+        save_pending_batches(state_path, prompt_hash, list(requests), batch_ids)
+
+    results = {}
+    for batch_id in batch_ids:
+        # Poll until the batch reaches a final status
+        batch = client.batches.retrieve(batch_id)
+        while batch.status in ('validating', 'in_progress', 'finalizing', 'cancelling'):
+            counts = batch.request_counts
+            progress = f": {counts.completed} completed, {counts.failed} failed of {counts.total}" if counts else ""
+            print(f"Batch {batch_id} {batch.status}{progress}...")
+            time.sleep(poll_interval)
+            batch = client.batches.retrieve(batch_id)
+
+        # Expired or cancelled batches still return the requests that finished in time
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get('response') or {}
+                if response.get('status_code') == 200:
+                    body = response['body']
+                    usage = CompletionUsage.model_validate(body['usage']) if body.get('usage') else None
+                    results[entry['custom_id']] = {"text": body['choices'][0]['message']['content'], **read_usage(usage)}
+                else:
+                    results[entry['custom_id']] = {"error": f"batch request failed: {entry.get('error') or response.get('body')}"}
+        if batch.status != 'completed':
+            print(f"\033[93mWARNING: Batch {batch_id} ended with status '{batch.status}'.\033[0m")
+
+    state_path.unlink(missing_ok=True)
+    return results
@@ -0,0 +1,240 @@
+# Import external modules
+import itertools, json, sys, threading, time
+from datetime import datetime, timedelta, timezone
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Import self-made modules
+from rate_limiter import estimate_request_tokens
+
+# A local stand-in for the Claude Message Batches API and the OpenAI Batch API, used to try the
+# bulk mode of claude_analyse_read / gpt_analyse_read (batch=True) without spending any tokens.
+# Start it with `python batch_stand_in_server.py [port]` and point the SDKs to it in the .env file:
+#   ANTHROPIC_BASE_URL=http://127.0.0.1:8765
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1
+# Every request is answered with a placeholder transcription inside <answer> tags.
+
+DEFAULT_PORT = 8765
+
+# Number of status checks answered with "in progress" before a batch ends, so the polling loop is exercised
+POLLS_BEFORE_END = 1
+
+def stand_in_answer(custom_id: str) -> str:
+    return f"Let's think step by step.\n<answer>stand-in transcription of {custom_id}</answer>"
+
+def now_iso(delta: timedelta = timedelta()) -> str:
+    return (datetime.now(timezone.utc) + delta).isoformat().replace('+00:00', 'Z')
+
+class BatchStandInState:
+    '''
+    In-memory batches and files of the stand-in server.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.claude_batches = {}
+        self.gpt_batches = {}
+        self.files = {}
+
+    def new_id(self, prefix: str) -> str:
+        return f"{prefix}_standin{next(self.ids):06d}"
+
+state = BatchStandInState()
+
+def claude_batch_object(batch: dict, base_url: str) -> dict:
+    ended = batch['polls'] > POLLS_BEFORE_END
+    count = len(batch['requests'])
+    return {
+        "id": batch['id'],
+        "type": "message_batch",
+        "processing_status": "ended" if ended else "in_progress",
+        "request_counts": {"processing": 0 if ended else count, "succeeded": count if ended else 0, "errored": 0, "canceled": 0, "expired": 0},
+        "created_at": batch['created_at'],
+        "expires_at": batch['expires_at'],
+        "ended_at": now_iso() if ended else None,
+        "archived_at": None,
+        "cancel_initiated_at": None,
+        "results_url": f"{base_url}/v1/messages/batches/{batch['id']}/results" if ended else None,
+    }
+
+def claude_batch_results(batch: dict) -> bytes:
+    lines = []
+    for request in batch['requests']:
+        params = request['params']
+        text = stand_in_answer(request['custom_id'])
+        message = {
+            "id": state.new_id('msg'),
+            "type": "message",
+            "role": "assistant",
+            "model": params.get('model', ''),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {
+                "input_tokens": estimate_request_tokens('claude', params.get('messages', []), params.get('system', '')),
+                "output_tokens": len(text) // 4,
+            },
+        }
+        lines.append(json.dumps({"custom_id": request['custom_id'], "result": {"type": "succeeded", "message": message}}))
+    return '\n'.join(lines).encode('utf-8')
+
+def gpt_batch_object(batch: dict) -> dict:
+    return {
+        "id": batch['id'],
+        "object": "batch",
+        "endpoint": batch['endpoint'],
+        "input_file_id": batch['input_file_id'],
+        "completion_window": batch['completion_window'],
+        "status": batch['status'],
+        "output_file_id": batch.get('output_file_id'),
+        "error_file_id": None,
+        "created_at": batch['created_at'],
+        "completed_at": int(time.time()) if batch['status'] == 'completed' else None,
+        "request_counts": {"total": batch['total'], "completed": batch['total'] if batch['status'] == 'completed' else 0, "failed": 0},
+    }
+
+def gpt_batch_output(input_content: bytes) -> bytes:
+    lines = []
+    for line in input_content.decode('utf-8').splitlines():
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        body = request['body']
+        text = stand_in_answer(request['custom_id'])
+        prompt_tokens = estimate_request_tokens('gpt', body.get('messages', []))
+        completion = {
+            "id": state.new_id('chatcmpl'),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get('model', ''),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(text) // 4, "total_tokens": prompt_tokens + len(text) // 4},
+        }
+        lines.append(json.dumps({
+            "id": state.new_id('batch_req'),
+            "custom_id": request['custom_id'],
+            "response": {"status_code": 200, "request_id": state.new_id('req'), "body": completion},
+            "error": None,
+        }))
+    return '\n'.join(lines).encode('utf-8')
+
+class BatchStandInHandler(BaseHTTPRequestHandler):
+    def base_url(self) -> str:
+        return f"http://{self.headers.get('Host', f'127.0.0.1:{self.server.server_port}')}"
+
+    def read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def send(self, status: int, payload, content_type: str = 'application/json'):
+        data = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def not_found(self):
+        self.send(404, {"type": "error", "error": {"type": "not_found_error", "message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        path = self.path.split('?')[0]
+        body = self.read_body()
+        with state.lock:
+            if path == '/v1/messages/batches':
+                requests = json.loads(body)['requests']
+                batch = {'id': state.new_id('msgbatch'), 'requests': requests, 'polls': 0, 'created_at': now_iso(), 'expires_at': now_iso(timedelta(days=1))}
+                state.claude_batches[batch['id']] = batch
+                return self.send(200, claude_batch_object(batch, self.base_url()))
+
+            if path == '/v1/files':
+                # The JSONL input file is uploaded as multipart/form-data
+                message = BytesParser(policy=HTTP).parsebytes(
+                    f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode('utf-8') + body
+                )
+                fields = {part.get_param('name', header='content-disposition'): part for part in message.iter_parts()}
+                content = fields['file'].get_payload(decode=True)
+                file_object = {
+                    "id": state.new_id('file'),
+                    "object": "file",
+                    "bytes": len(content),
+                    "created_at": int(time.time()),
+                    "filename": fields['file'].get_filename() or 'upload.jsonl',
+                    "purpose": fields['purpose'].get_content().strip() if 'purpose' in fields else 'batch',
+                    "status": "processed",
+                }
+                state.files[file_object['id']] = {'object': file_object, 'content': content}
+                return self.send(200, file_object)
+
+            if path == '/v1/batches':
+                params = json.loads(body)
+                input_file = state.files.get(params['input_file_id'])
+                if input_file is None:
+                    return self.not_found()
+                batch = {
+                    'id': state.new_id('batch'),
+                    'endpoint': params['endpoint'],
+                    'input_file_id': params['input_file_id'],
+                    'completion_window': params['completion_window'],
+                    'status': 'validating',
+                    'polls': 0,
+                    'created_at': int(time.time()),
+                    'total': len([line for line in input_file['content'].splitlines() if line.strip()]),
+                }
+                state.gpt_batches[batch['id']] = batch
+                return self.send(200, gpt_batch_object(batch))
+        self.not_found()
+
+    def do_GET(self):
+        parts = self.path.split('?')[0].strip('/').split('/')
+        with state.lock:
+            # /v1/messages/batches/{id} and /v1/messages/batches/{id}/results
+            if parts[:3] == ['v1', 'messages', 'batches'] and len(parts) >= 4 and parts[3] in state.claude_batches:
+                batch = state.claude_batches[parts[3]]
+                if len(parts) == 5 and parts[4] == 'results':
+                    return self.send(200, claude_batch_results(batch), 'application/binary')
+                batch['polls'] += 1
+                return self.send(200, claude_batch_object(batch, self.base_url()))
+
+            # /v1/batches/{id}
+            if parts[:2] == ['v1', 'batches'] and len(parts) == 3 and parts[2] in state.gpt_batches:
+                batch = state.gpt_batches[parts[2]]
+                batch['polls'] += 1
+                if batch['polls'] > POLLS_BEFORE_END and batch['status'] != 'completed':
+                    output = gpt_batch_output(state.files[batch['input_file_id']]['content'])
+                    output_id = state.new_id('file')
+                    state.files[output_id] = {'object': {"id": output_id}, 'content': output}
+                    batch['output_file_id'] = output_id
+                    batch['status'] = 'completed'
+                elif batch['status'] == 'validating':
+                    batch['status'] = 'in_progress'
+                return self.send(200, gpt_batch_object(batch))
+
+            # /v1/files/{id}/content
+            if parts[:2] == ['v1', 'files'] and len(parts) == 4 and parts[3] == 'content' and parts[2] in state.files:
+                return self.send(200, state.files[parts[2]]['content'], 'application/octet-stream')
+        self.not_found()
+
+    def log_message(self, format, *args):
+        print(f"[stand-in] {self.command} {self.path} -> {args[1] if len(args) > 1 else ''}")
+
+def serve(port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    '''
+    Start the stand-in batch server in a background thread.
+    Args:
+        port (int): Port to listen on (0 picks a free port).
+    Returns:
+        ThreadingHTTPServer: The running server, stop it with shutdown().
+    '''
+    server = ThreadingHTTPServer(('127.0.0.1', port), BatchStandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    server = ThreadingHTTPServer(('127.0.0.1', port), BatchStandInHandler)
+    print(f"Batch stand-in server listening on http://127.0.0.1:{port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
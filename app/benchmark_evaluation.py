@@ -0,0 +1,262 @@
+# Import external modules
+import argparse, io, json, platform, random, subprocess, tempfile, time
+from contextlib import redirect_stdout
+from enum import StrEnum
+from pathlib import Path
+
+# Import self-made modules
+import measure_errors
+import text_normalization
+from measure_errors import average_nld, collect_levenshtein_distances, evaluate_services, get_average_normalized_levenshtein, render_average_nld_chart, summary_matrix
+from text_normalization import normalize_text
+
+# Benchmark of the evaluation path of measure_errors.py on synthetic corpora.
+# Every configuration generates Java-like ground truths and noisy OCR outputs in a temporary directory,
+# times the load, normalise, score and render stages separately and writes a JSON report,
+# which can be compared with the report of another commit:
+#   python benchmark_evaluation.py --exams 10 100 1000 --services 1 10
+#   python benchmark_evaluation.py --compare ../results/benchmarks/<other report>.json
+
+BENCHMARK_DIR = Path(__file__).resolve().parent.parent / 'results' / 'benchmarks'
+
+# Default configurations: every number of exams is combined with every number of services
+DEFAULT_EXAMS = (10, 100, 1000)
+DEFAULT_SERVICES = (1, 10)
+
+# Share of the exams whose ground truth is also split into two parts (exam_<n>_1.txt, exam_<n>_2.txt)
+SPLIT_RATIO = 0.2
+
+# Probability of a character error in the synthetic OCR outputs (the rate of every service is drawn up to it)
+MAX_NOISE_RATE = 0.15
+
+# Lines of the synthetic Java programs
+MIN_LINES, MAX_LINES = 20, 80
+
+# Every stage runs this many times, the fastest run is reported
+REPEAT = 3
+
+SEED = 42
+
+STAGES = ('load', 'normalize', 'score', 'score_cached', 'render')
+
+JAVA_NAMES = ('count', 'total', 'index', 'value', 'result', 'list', 'node', 'sum', 'max', 'size', 'left', 'right')
+JAVA_TYPES = ('int', 'double', 'String', 'boolean', 'long', 'char')
+JAVA_LINES = (
+    '{type} {name} = {number};',
+    '{name} = {name2} + {number};',
+    'for (int i = 0; i < {name}.length; i++) {{',
+    'while ({name} != null && {name2} > {number}) {{',
+    'if ({name} >= {name2}) {{',
+    'System.out.println("{name} = " + {name});',
+    'return {name} * {name2};',
+    '{name}.add({name2});',
+    '}} else {{',
+    '}}',
+)
+
+def synthetic_java(rng: random.Random) -> str:
+    # A Java-like method of MIN_LINES to MAX_LINES lines, indented by its brackets
+    lines, depth = [f'public static int {rng.choice(JAVA_NAMES)}({rng.choice(JAVA_TYPES)} {rng.choice(JAVA_NAMES)}) {{'], 1
+    for _ in range(rng.randint(MIN_LINES, MAX_LINES)):
+        line = rng.choice(JAVA_LINES).format(type=rng.choice(JAVA_TYPES), name=rng.choice(JAVA_NAMES), name2=rng.choice(JAVA_NAMES), number=rng.randint(0, 999))
+        if line.startswith('}') and depth > 1:
+            depth -= 1
+        lines.append('    ' * depth + line)
+        if line.endswith('{'):
+            depth += 1
+    lines.extend('    ' * level + '}' for level in range(depth - 1, -1, -1))
+    return '\n'.join(lines)
+
+def noisy_copy(text: str, noise_rate: float, rng: random.Random) -> str:
+    # Substitute, drop or insert characters at noise_rate, and change some indentation like a transcription would
+    output = []
+    for char in text:
+        roll = rng.random()
+        if roll < noise_rate / 3:
+            output.append(rng.choice('abcdefghijklmnopqrstuvwxyz(){};=+'))
+        elif roll < noise_rate * 2 / 3:
+            continue
+        elif roll < noise_rate:
+            output.append(char + rng.choice('abcdefghijklmnopqrstuvwxyz '))
+        elif char == '\n' and rng.random() < 0.1:
+            output.append('\n  ')
+        else:
+            output.append(char)
+    return ''.join(output)
+
+def generate_corpus(root: Path, exams: int, services: list[str], seed: int = SEED) -> dict:
+    '''
+    Write a synthetic ground truth directory and one results folder per service.
+    Args:
+        root (Path): Directory to write to (ground_truth/ and results/<service>/testing/).
+        exams (int): Number of exams.
+        services (list[str]): Names of the services.
+        seed (int): Seed of the random generator, the same seed gives the same corpus.
+    Returns:
+        dict: Number of ground truth and result files, and their total size in bytes.
+    '''
+    rng = random.Random(seed)
+    gt_dir = root / 'ground_truth'
+    gt_dir.mkdir(parents=True)
+    results_dirs = {service: root / 'results' / service / measure_errors.RESULTS_SUBDIR for service in services}
+    for results_dir in results_dirs.values():
+        results_dir.mkdir(parents=True)
+    noise_rates = {service: rng.uniform(0.01, MAX_NOISE_RATE) for service in services}
+
+    stats = {'gt_files': 0, 'result_files': 0, 'bytes': 0}
+    def write(path: Path, text: str, kind: str):
+        path.write_text(text, encoding='utf-8')
+        stats[kind] += 1
+        stats['bytes'] += len(text)
+
+    for exam in range(1, exams + 1):
+        gt_text = synthetic_java(rng)
+        texts = {f'exam_{exam}': gt_text}
+        if rng.random() < SPLIT_RATIO:
+            lines = gt_text.split('\n')
+            half = len(lines) // 2
+            texts[f'exam_{exam}_1'], texts[f'exam_{exam}_2'] = '\n'.join(lines[:half]), '\n'.join(lines[half:])
+        for name, text in texts.items():
+            write(gt_dir / f'{name}.txt', text, 'gt_files')
+            for service in services:
+                write(results_dirs[service] / f'{service}_{name}_comp.txt', noisy_copy(text, noise_rates[service], rng), 'result_files')
+    return stats
+
+def best_time(stage, repeat: int = REPEAT, reset=None) -> float:
+    # Fastest of repeat runs of stage, reset runs before every run and is not timed
+    times = []
+    for _ in range(repeat):
+        if reset is not None:
+            reset()
+        start = time.perf_counter()
+        stage()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def benchmark_configuration(exams: int, service_count: int, repeat: int = REPEAT, max_workers: int = measure_errors.MAX_WORKERS) -> dict:
+    '''
+    Time every stage of the evaluation on one synthetic corpus.
+    Stages:
+        load: reading every ground truth and result file.
+        normalize: normalising every text with the default profile.
+        score: evaluate_services without the NLD cache (reading, normalising and scoring every file).
+        score_cached: evaluate_services with a warm NLD cache.
+        render: the summary matrix and table, the per-service tables and the average NLD chart.
+    Returns:
+        dict: The configuration, the corpus size and the seconds of every stage.
+    '''
+    services = list(StrEnum('BenchmarkService', {f'SERVICE_{i}': f'bench_{i}' for i in range(1, service_count + 1)}))
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        corpus = generate_corpus(root, exams, services)
+        gt_dir, results_root, cache_path = root / 'ground_truth', root / 'results', root / 'results' / '.nld_cache.json'
+        files = sorted(gt_dir.glob('*.txt')) + sorted(results_root.glob('*/*/*.txt'))
+        # Normalised files are memoised by content, the memo is cleared so every run starts cold
+        clear_memo = text_normalization.normalized_files.clear
+
+        texts = [f.read_text(encoding='utf-8') for f in files]
+        timings = {'load': best_time(lambda: [f.read_text(encoding='utf-8') for f in files], repeat)}
+        timings['normalize'] = best_time(lambda: [normalize_text(text) for text in texts], repeat)
+
+        def evaluate(use_cache: bool):
+            # The NLD cache statistics printed by every run are left out of the benchmark output
+            with redirect_stdout(io.StringIO()):
+                return evaluate_services(services, gt_dir, results_root, max_workers=max_workers, use_cache=use_cache, cache_path=cache_path)
+        timings['score'] = best_time(lambda: evaluate(False), repeat, clear_memo)
+        evaluate(True)
+        timings['score_cached'] = best_time(lambda: evaluate(True), repeat, clear_memo)
+
+        gt_grouped, evaluation = evaluate(True)
+        graph_path = root / 'avg_levenshtein_distance.png'
+        def render():
+            gt_files, nld_matrix, _ = summary_matrix(gt_grouped, evaluation, services)
+            ld_table, _, _ = collect_levenshtein_distances(gt_grouped, evaluation, services)
+            output_lines = []
+            for service in services:
+                get_average_normalized_levenshtein(service, output_lines, set(gt_files), ld_table)
+            render_average_nld_chart([str(service) for service in services], average_nld(nld_matrix), graph_path)
+        # The chart is only drawn again when the previous one is removed
+        timings['render'] = best_time(render, repeat, lambda: graph_path.unlink(missing_ok=True))
+
+    return {'exams': exams, 'services': service_count, **corpus, 'seconds': {stage: round(timings[stage], 6) for stage in STAGES}}
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, cwd=Path(__file__).resolve().parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_reports(report: dict, other: dict):
+    # Print the time ratio of every stage of the configurations found in both reports (above 1 is slower than the other report)
+    others = {(entry['exams'], entry['services']): entry for entry in other['results']}
+    print(f"\nCompared with {other.get('commit') or 'the other report'} (ratio > 1 is slower):")
+    print(f"| Exams | Services | {' | '.join(STAGES)} |")
+    print(f"|{'|'.join([':---:'] * (len(STAGES) + 2))}|")
+    for entry in report['results']:
+        previous = others.get((entry['exams'], entry['services']))
+        if previous is None:
+            continue
+        ratios = [
+            f"{entry['seconds'][stage] / previous['seconds'][stage]:.2f}" if previous['seconds'].get(stage) else '-'
+            for stage in STAGES
+        ]
+        print(f"| {entry['exams']} | {entry['services']} | {' | '.join(ratios)} |")
+
+def run_benchmark(exam_counts, service_counts, repeat: int = REPEAT, output: Path | None = None, compare: Path | None = None) -> dict:
+    '''
+    Benchmark every (exams, services) configuration and write the JSON report.
+    Args:
+        exam_counts (iterable): Numbers of exams.
+        service_counts (iterable): Numbers of services.
+        repeat (int): Runs of every stage, the fastest one is reported.
+        output (Path | None): The report file, results/benchmarks/evaluation_<commit>_<time>.json if not given.
+        compare (Path | None): A previous report to compare with.
+    Returns:
+        dict: The report.
+    '''
+    # matplotlib is imported lazily by the first chart, it is imported here so that one-off cost is not counted
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'max_workers': measure_errors.MAX_WORKERS,
+        'repeat': repeat,
+        'results': [],
+    }
+    print(f"| Exams | Services | Files | {' | '.join(f'{stage} (s)' for stage in STAGES)} |")
+    print(f"|{'|'.join([':---:'] * (len(STAGES) + 3))}|")
+    for exams in exam_counts:
+        for service_count in service_counts:
+            entry = benchmark_configuration(exams, service_count, repeat)
+            report['results'].append(entry)
+            seconds = ' | '.join(f"{entry['seconds'][stage]:.4f}" for stage in STAGES)
+            print(f"| {exams} | {service_count} | {entry['gt_files'] + entry['result_files']} | {seconds} |")
+
+    if output is None:
+        output = BENCHMARK_DIR / f"evaluation_{commit or 'unknown'}_{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding='utf-8')
+    print(f"\nBenchmark report written to {output}")
+
+    if compare is not None:
+        compare_reports(report, json.loads(Path(compare).read_text(encoding='utf-8')))
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the evaluation of measure_errors.py on synthetic corpora.')
+    parser.add_argument('--exams', type=int, nargs='+', default=DEFAULT_EXAMS, help='numbers of exams (10 to 10000)')
+    parser.add_argument('--services', type=int, nargs='+', default=DEFAULT_SERVICES, help='numbers of services (1 to 100)')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='runs of every stage, the fastest one is reported')
+    parser.add_argument('--output', type=Path, help='report file (default: results/benchmarks/evaluation_<commit>_<time>.json)')
+    parser.add_argument('--compare', type=Path, help='previous report to compare with')
+    args = parser.parse_args()
+    if not all(10 <= exams <= 10_000 for exams in args.exams) or not all(1 <= count <= 100 for count in args.services):
+        parser.error('use 10 to 10000 exams and 1 to 100 services')
+    run_benchmark(args.exams, args.services, args.repeat, args.output, args.compare)
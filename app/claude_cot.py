@@ -9,6 +9,16 @@ SERVICE = OcrService.PSEUDO50
 MODEL_NAME = "claude-3-5-sonnet-latest"
 # MODEL_NAME = "claude-opus-4-0"
 
+# Maximum number of images analysed concurrently (1 = one request at a time, e.g. 8 to send 8 requests in parallel,
+# paced by the quotas of rate_limiter.RATE_LIMITS)
+MAX_WORKERS = 1
+
+# Send all images as one asynchronous batch job (half price, results usually within an hour)
+BATCH = False
+
+# Set to True to stream the responses and stop the generation at the closing </answer> tag (not used by batch jobs)
+STREAM = False
+
 system_prompt = "You are a perfect OCR assistant for extracting text from images without producing hallucinations, and perfect at handling text insertion."
 
 complex_prompt = """
@@ -85,4 +95,4 @@ message_list.append({
 })
 
 # claude_analyse_read(SERVICE, MODEL_NAME, 1024, 0.0, message_list, "", -1)
-claude_analyse_read(SERVICE, MODEL_NAME, 1024, 0.0, message_list, system_prompt, -2)
+claude_analyse_read(SERVICE, MODEL_NAME, 1024, 0.0, message_list, system_prompt, -2, max_workers=MAX_WORKERS, batch=BATCH, stream=STREAM)
@@ -1,4 +1,5 @@
-import os
+import io, os, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from PIL import Image
 import glob
@@ -26,48 +27,184 @@ IMAGES_TO_BE_COMPRESSED = [
     'exam_152.png',
 ]
 
-def compress_images():
+# Set to True to compress every image in the raw directory instead of IMAGES_TO_BE_COMPRESSED
+COMPRESS_ALL_RAW_IMAGES = False
+
+# Number of worker processes, each compresses one image at a time (1 compresses the images serially)
+MAX_WORKERS = os.cpu_count() or 1
+
+# Largest image each provider accepts, in bytes of the encoded file.
+# Claude's 5 MB limit applies to the base64 payload, which is 4/3 of the file size.
+PROVIDER_BYTE_BUDGETS = {
+    'claude': 5 * 1024 * 1024 * 3 // 4,
+    'gpt': 20 * 1024 * 1024,
+    'mistral': 50 * 1024 * 1024,
+    'azure': 500 * 1024 * 1024,
+}
+
+# The compressed images are shared by every runner, so they must fit the smallest budget of these providers
+TARGET_PROVIDERS = ('claude', 'gpt', 'mistral', 'azure')
+
+# Bounds of the JPEG quality search, and how far an image may be downscaled when even the lowest quality does not fit
+JPEG_MIN_QUALITY = 40
+JPEG_MAX_QUALITY = 95
+DOWNSCALE_FACTOR = 0.85
+MAX_DOWNSCALE_STEPS = 4
+
+def encode(img: Image.Image, format: str, **params) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, format, **params)
+    return buffer.getvalue()
+
+def encode_jpeg_to_budget(img: Image.Image, max_bytes: int) -> bytes | None:
+    '''
+    Binary search the highest JPEG quality whose encoding fits in max_bytes.
+    Args:
+        img (Image.Image): The RGB image to encode.
+        max_bytes (int): The byte budget.
+    Returns:
+        bytes | None: The encoded image, or None if even JPEG_MIN_QUALITY does not fit.
+    '''
+    best = None
+    low, high = JPEG_MIN_QUALITY, JPEG_MAX_QUALITY
+    while low <= high:
+        quality = (low + high) // 2
+        data = encode(img, 'JPEG', quality=quality)
+        if len(data) <= max_bytes:
+            best, low = quality, quality + 1
+        else:
+            high = quality - 1
+    if best is None:
+        return None
+    # optimize only shrinks the Huffman tables, so it is applied once to the chosen quality
+    return encode(img, 'JPEG', quality=best, optimize=True)
+
+def encode_to_budget(img: Image.Image, suffix: str, max_bytes: int) -> tuple[bytes, str]:
+    '''
+    Encode an image in memory so it lands just under max_bytes at the best possible quality.
+    PNG sources stay lossless when they fit, otherwise the highest JPEG quality that fits is used,
+    and the image is only downscaled when even JPEG_MIN_QUALITY is too large.
+    Args:
+        img (Image.Image): The image to encode.
+        suffix (str): Suffix of the source file ('.png', '.jpg' or '.jpeg').
+        max_bytes (int): The byte budget.
+    Returns:
+        tuple[bytes, str]: The encoded image and the suffix of its format.
+    '''
+    if suffix == '.png':
+        data = encode(img, 'PNG', optimize=True)
+        if len(data) <= max_bytes:
+            return data, suffix
+        suffix = '.jpg'
+
+    img = img.convert('RGB')
+    for _ in range(MAX_DOWNSCALE_STEPS + 1):
+        data = encode_jpeg_to_budget(img, max_bytes)
+        if data is not None:
+            return data, suffix
+        img = img.resize((max(1, int(img.width * DOWNSCALE_FACTOR)), max(1, int(img.height * DOWNSCALE_FACTOR))), Image.LANCZOS)
+    # Out of downscale steps, return the smallest encoding tried
+    return encode(img, 'JPEG', quality=JPEG_MIN_QUALITY, optimize=True), suffix
+
+def compress_image_to_bytes(image_path: str, max_size: tuple = (1200, 1200), max_bytes: int | None = None) -> tuple[bytes, str]:
+    '''
+    Decode, downscale and encode one raw image in memory.
+    Args:
+        image_path (str): Path to the raw image.
+        max_size (tuple): Max width, height.
+        max_bytes (int | None): The byte budget, defaults to the smallest budget of TARGET_PROVIDERS.
+    Returns:
+        tuple[bytes, str]: The encoded image and the suffix of its format.
+    '''
+    if max_bytes is None:
+        max_bytes = min(PROVIDER_BYTE_BUDGETS[provider] for provider in TARGET_PROVIDERS)
+    image_file = Path(image_path)
+    with Image.open(image_file) as img:
+        img.thumbnail(max_size, Image.LANCZOS)
+        data, suffix = encode_to_budget(img, image_file.suffix.lower(), max_bytes)
+    # Check final size
+    if len(data) > max_bytes:
+        print(f"Warning: {image_file.stem}_comp{suffix} is still over {max_bytes / 1024 / 1024:.2f} MB after compression.")
+    return data, suffix
+
+def write_compressed_image(out_path: Path, data: bytes):
+    out_path.write_bytes(data)
+    # Remove the output of an earlier run saved in the other format, so the runners only see one version
+    for stale_suffix in {'.png', '.jpg', '.jpeg'} - {out_path.suffix}:
+        out_path.with_suffix(stale_suffix).unlink(missing_ok=True)
+
+def compress_image(image_path: str, compressed_dir: Path, max_size: tuple = (1200, 1200), max_bytes: int | None = None):
+    '''
+    Downscale and re-encode one image into the compressed directory, only writing the final file.
+    Defined at module level so it can run in a worker process.
+    Args:
+        image_path (str): Path to the raw image.
+        compressed_dir (Path): Directory the compressed image is written to.
+        max_size (tuple): Max width, height.
+        max_bytes (int | None): The byte budget, defaults to the smallest budget of TARGET_PROVIDERS.
+    Returns:
+        Path: The path of the compressed image.
+    '''
+    data, suffix = compress_image_to_bytes(image_path, max_size, max_bytes)
+    out_path = compressed_dir / (Path(image_path).stem + '_comp' + suffix)
+    write_compressed_image(out_path, data)
+    return out_path
+
+def timed_compress_image(image_path: str, compressed_dir: Path):
+    # Returns the outcome instead of raising, so one broken scan does not stop the pool
+    start = time.perf_counter()
+    try:
+        return compress_image(image_path, compressed_dir), None, time.perf_counter() - start
+    except Exception as e:
+        return None, e, time.perf_counter() - start
+
+def compress_images(max_workers: int = MAX_WORKERS):
+    '''
+    Compress the raw images, spreading them over max_workers processes.
+    Args:
+        max_workers (int): Number of worker processes (1 compresses the images serially).
+    Returns:
+        None
+    '''
     images_dir = Path(__file__).resolve().parent.parent / 'images' / 'raw'
     compressed_dir = Path(__file__).resolve().parent.parent / 'images' / 'compressed'
     compressed_dir.mkdir(parents=True, exist_ok=True)
 
-    # Process all images in the raw directory
-    # Uncomment the next line to process all images in the raw directory
-    # image_files = glob.glob(str(images_dir / '*'))
-
-    # Only process images listed in IMAGES_TO_BE_COMPRESSED
-    image_files = [str(images_dir / name) for name in IMAGES_TO_BE_COMPRESSED if (images_dir / name).exists()]
-    
-    max_size = (1200, 1200)  # Max width, height
-    max_bytes = 5 * 1024 * 1024  # 5 MB
-    
-    for image_path in image_files:
-        image_file = Path(image_path)
-        if not image_file.suffix.lower() in ['.png', '.jpg', '.jpeg']:
-            continue
-        try:
-            img = Image.open(image_file)
-            img.thumbnail(max_size, Image.LANCZOS)
-            out_path = compressed_dir / (image_file.stem + '_comp' + image_file.suffix)
-            # For JPEG, use quality option; for PNG, use optimize
-            if image_file.suffix.lower() in ['.jpg', '.jpeg']:
-                img.save(out_path, 'JPEG', quality=40, optimize=True)
-            elif image_file.suffix.lower() == '.png':
-                # Save as PNG first
-                img.save(out_path, 'PNG', optimize=True)
-                # If still too large, convert to JPEG
-                if out_path.stat().st_size > max_bytes:
-                    out_path_jpg = out_path.with_suffix('.jpg')
-                    img = img.convert('RGB')
-                    img.save(out_path_jpg, 'JPEG', quality=40, optimize=True)
-                    out_path.unlink()  # Remove PNG
-                    out_path = out_path_jpg
-            # Check final size
-            if out_path.stat().st_size > max_bytes:
-                print(f"Warning: {out_path.name} is still over 5 MB after compression.")
-            print(f"Compressed {image_file.name} -> {out_path}")
-        except Exception as e:
-            print(f"Failed to compress {image_file.name}: {e}")
+    if COMPRESS_ALL_RAW_IMAGES:
+        # Process all images in the raw directory
+        image_files = sorted(glob.glob(str(images_dir / '*')))
+    else:
+        # Only process images listed in IMAGES_TO_BE_COMPRESSED
+        image_files = [str(images_dir / name) for name in IMAGES_TO_BE_COMPRESSED if (images_dir / name).exists()]
+    image_files = [path for path in image_files if Path(path).suffix.lower() in ['.png', '.jpg', '.jpeg']]
+    if not image_files:
+        print(f"No images to compress in {images_dir}")
+        return
+
+    total = len(image_files)
+    start = time.perf_counter()
+    failed = 0
+
+    def report(done, image_path, out_path, error, seconds):
+        nonlocal failed
+        if error is None:
+            print(f"[{done}/{total}] Compressed {Path(image_path).name} -> {out_path} ({seconds:.2f}s)")
+        else:
+            failed += 1
+            print(f"[{done}/{total}] Failed to compress {Path(image_path).name}: {error}")
+
+    if max_workers <= 1 or total == 1:
+        for done, image_path in enumerate(image_files, start=1):
+            report(done, image_path, *timed_compress_image(image_path, compressed_dir))
+    else:
+        with ProcessPoolExecutor(max_workers=min(max_workers, total)) as executor:
+            futures = {executor.submit(timed_compress_image, image_path, compressed_dir): image_path for image_path in image_files}
+            # Report in completion order, so progress shows as soon as any worker finishes
+            for done, future in enumerate(as_completed(futures), start=1):
+                report(done, futures[future], *future.result())
+
+    elapsed = time.perf_counter() - start
+    print(f"Compressed {total - failed}/{total} images in {elapsed:.1f}s ({elapsed / total:.2f}s per image, {min(max_workers, total)} worker(s))")
 
 if __name__ == "__main__":
     compress_images()
@@ -0,0 +1,125 @@
+# Import external modules
+import itertools, os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from rapidfuzz.distance import Levenshtein as RapidLevenshtein
+
+# Import self-made modules
+from text_normalization import java_tokens
+
+# Counts of every (ground truth, OCR result) pair, in this order. The operations turn the ground truth into the OCR result:
+# an insertion is a character the OCR added, a deletion a character it missed.
+EDIT_FIELDS = (
+    'substitutions', 'deletions', 'insertions', 'gt_chars',
+    'token_substitutions', 'token_deletions', 'token_insertions', 'gt_tokens',
+)
+
+# Number of worker processes computing the alignments (1 computes them in the main process)
+MAX_WORKERS = os.cpu_count() or 1
+
+# Pairs sent to the workers at once, so the texts of all pairs are never held in memory together
+CHUNK_SIZE = 1000
+
+EDIT_TAGS = {'replace': 0, 'delete': 1, 'insert': 2}
+
+def count_edit_operations(gt_text: str, ocr_text: str) -> tuple[int, ...]:
+    '''
+    Align an OCR result with its ground truth, at character and at Java token level.
+    Defined at module level so it can run in a worker process.
+    Args:
+        gt_text (str): The normalised ground truth.
+        ocr_text (str): The normalised OCR result.
+    Returns:
+        tuple[int, ...]: The counts of EDIT_FIELDS.
+    '''
+    counts = [0] * len(EDIT_FIELDS)
+    for offset, (gt_sequence, ocr_sequence) in ((0, (gt_text, ocr_text)), (4, (java_tokens(gt_text), java_tokens(ocr_text)))):
+        # The edit operations of a minimal alignment, so substitutions + deletions + insertions is the Levenshtein Distance
+        for tag, _, _ in RapidLevenshtein.editops(gt_sequence, ocr_sequence).as_list():
+            counts[offset + EDIT_TAGS[tag]] += 1
+        counts[offset + 3] = len(gt_sequence)
+    return tuple(counts)
+
+def tag_label(tag) -> str:
+    # e.g., HandwritingLegibility.GOOD -> HandwritingLegibility: good
+    return f"{type(tag).__name__}: {tag}"
+
+def collect_edit_operations(pairs, services: list, image_tags: dict, max_workers: int = MAX_WORKERS) -> tuple[list[str], np.ndarray]:
+    '''
+    Sum the edit operations of every pair per service, overall and per image tag, in a single streaming pass.
+    Args:
+        pairs (iterable): (service, exam_<num>, normalised ground truth, normalised OCR result) tuples, read lazily.
+        services (list): The services, in row order.
+        image_tags (dict): {exam_<num>.png: set of tags}, as in utils.image_tags.
+        max_workers (int): Number of worker processes.
+    Returns:
+        tuple: (row labels, starting with 'All exams' followed by the tag labels,
+            counts array of shape (services, rows, EDIT_FIELDS) plus the number of exams as last field).
+    '''
+    tag_labels = sorted({tag_label(tag) for tags in image_tags.values() for tag in tags})
+    rows = {label: i for i, label in enumerate(['All exams'] + tag_labels)}
+    service_rows = {service: i for i, service in enumerate(services)}
+    totals = np.zeros((len(services), len(rows), len(EDIT_FIELDS) + 1), dtype=np.int64)
+
+    executor = ProcessPoolExecutor(max_workers=max_workers) if max_workers > 1 else None
+    try:
+        pairs = iter(pairs)
+        while chunk := list(itertools.islice(pairs, CHUNK_SIZE)):
+            gt_texts = [gt_text for _, _, gt_text, _ in chunk]
+            ocr_texts = [ocr_text for _, _, _, ocr_text in chunk]
+            if executor is not None:
+                counts = executor.map(count_edit_operations, gt_texts, ocr_texts, chunksize=max(1, len(chunk) // (max_workers * 4)))
+            else:
+                counts = map(count_edit_operations, gt_texts, ocr_texts)
+            for (service, base, _, _), pair_counts in zip(chunk, counts):
+                pair_rows = [0] + [rows[tag_label(tag)] for tag in image_tags.get(f'{base}.png', ())]
+                totals[service_rows[service], pair_rows] += (*pair_counts, 1)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return list(rows), totals
+
+def error_rates(totals: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Character Error Rate and Java token Word Error Rate (edits over the ground truth length), NaN without any ground truth
+    fields = {field: totals[..., i] for i, field in enumerate(EDIT_FIELDS)}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cer = (fields['substitutions'] + fields['deletions'] + fields['insertions']) / fields['gt_chars']
+        wer = (fields['token_substitutions'] + fields['token_deletions'] + fields['token_insertions']) / fields['gt_tokens']
+    exams = totals[..., -1]
+    return np.where(exams > 0, cer, np.nan), np.where(exams > 0, wer, np.nan)
+
+def format_error_breakdown(row_labels: list[str], totals: np.ndarray, services: list) -> list[str]:
+    '''
+    Build the Markdown report of collect_edit_operations.
+    Returns:
+        list[str]: The Markdown lines.
+    '''
+    cer, wer = error_rates(totals)
+    output_lines = ["# OCR Error Breakdown\n\n"]
+    output_lines.append(
+        "Edit operations turning the ground truth into the OCR result, summed over the exams of the summary. "
+        "CER is the character edits over the ground truth characters, WER the Java token edits over the ground truth tokens.\n\n"
+    )
+    output_lines.append("## Edit Operations by Service\n\n")
+    output_lines.append("| Service | Exams | Substitutions | Deletions | Insertions | GT Characters | CER | Token Substitutions | Token Deletions | Token Insertions | GT Tokens | WER |\n")
+    output_lines.append(f"|{'|'.join([':---:'] * 12)}|\n")
+    for i, service in enumerate(services):
+        counts = totals[i, 0]
+        if not counts[-1]:
+            output_lines.append(f"| {service} | 0 |{' - |' * 10}\n")
+            continue
+        chars = ' | '.join(str(value) for value in counts[0:4])
+        tokens = ' | '.join(str(value) for value in counts[4:8])
+        output_lines.append(f"| {service} | {counts[-1]} | {chars} | {cer[i, 0]:.4f} | {tokens} | {wer[i, 0]:.4f} |\n")
+    output_lines.append("\n")
+
+    # Only the tags of at least one evaluated exam
+    tag_rows = [j for j in range(1, len(row_labels)) if totals[:, j, -1].any()]
+    output_lines.append("## CER / WER by Image Tag\n\n")
+    output_lines.append(f"| Image Tag | Exams | {' | '.join(str(service) for service in services)} |\n")
+    output_lines.append(f"|{'|'.join([':---:'] * (len(services) + 2))}|\n")
+    for j in tag_rows:
+        cells = ["-" if np.isnan(cer[i, j]) else f"{cer[i, j]:.3f} / {wer[i, j]:.3f}" for i in range(len(services))]
+        output_lines.append(f"| {row_labels[j]} | {totals[:, j, -1].max()} | {' | '.join(cells)} |\n")
+    output_lines.append("\n")
+    return output_lines
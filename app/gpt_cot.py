@@ -9,6 +9,16 @@ SERVICE = OcrService.PSEUDO49
 # MODEL_NAME = "gpt-4o-mini"
 MODEL_NAME = "gpt-4.1"
 
+# Maximum number of images analysed concurrently (1 = one request at a time, e.g. 8 to send 8 requests in parallel,
+# paced by the quotas of rate_limiter.RATE_LIMITS)
+MAX_WORKERS = 1
+
+# Send all images as one asynchronous batch job (half price, results usually within an hour)
+BATCH = False
+
+# Set to True to stream the responses and stop the generation at the closing </answer> tag (not used by batch jobs)
+STREAM = False
+
 # system_prompt = "You are a perfect OCR assistant for extracting text from images without producing hallucinations."
 system_prompt = ""
 
@@ -94,4 +104,4 @@ messages.append({
 # with open('explaination.txt', 'w', encoding='utf-8') as f:
 #     f.write(f"{example_data[5]['explanation']}\n")
 
-gpt_analyse_read(SERVICE, MODEL_NAME, 1024, 0.0, messages, -1)
+gpt_analyse_read(SERVICE, MODEL_NAME, 1024, 0.0, messages, -1, max_workers=MAX_WORKERS, batch=BATCH, stream=STREAM)
@@ -0,0 +1,102 @@
+# Import external modules
+import threading, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+# Import self-made modules
+from compress_images import MAX_WORKERS, compress_image_to_bytes, write_compressed_image
+
+RAW_IMAGES_DIR = Path(__file__).resolve().parent.parent / 'images' / 'raw'
+COMPRESSED_IMAGES_DIR = Path(__file__).resolve().parent.parent / 'images' / 'compressed'
+
+# Encoded images prepared by the pipeline, by the path of the compressed file they stand for
+prepared_images = {}
+prepared_images_lock = threading.Lock()
+
+# Writes the prepared images to the compressed directory in the background.
+# Its threads are joined when the interpreter exits, so every started write completes.
+persist_executor = ThreadPoolExecutor(max_workers=1)
+
+def read_image_bytes(image_path) -> bytes:
+    '''
+    Return the content of an image, from memory if the pipeline prepared it, otherwise from disk.
+    Args:
+        image_path (str | Path): Path to the (compressed) image.
+    Returns:
+        bytes: The encoded image.
+    '''
+    data = prepared_images.get(str(image_path))
+    return data if data is not None else Path(image_path).read_bytes()
+
+def is_prepared_image(image_path) -> bool:
+    return str(image_path) in prepared_images
+
+def persist_image(out_path: Path, data: bytes):
+    try:
+        write_compressed_image(out_path, data)
+    except OSError as e:
+        print(f"\033[93mWARNING: Failed to save {out_path.name}: {e}\033[0m")
+
+def find_raw_image(compressed_name: str) -> Path | None:
+    # exam_1_comp.png was compressed from images/raw/exam_1.<png/jpg/jpeg>
+    stem = Path(compressed_name).stem.removesuffix('_comp')
+    for suffix in ('.png', '.jpg', '.jpeg'):
+        raw_path = RAW_IMAGES_DIR / (stem + suffix)
+        if raw_path.exists():
+            return raw_path
+    return None
+
+def prepare_images(compressed_names, persist: bool = True, max_workers: int = MAX_WORKERS) -> list[str]:
+    '''
+    Decode, resize and encode the raw scans of the given compressed images once, in memory,
+    so the runners send them without writing and re-reading images/compressed first.
+    Images without a raw scan fall back to their compressed file on disk.
+    Args:
+        compressed_names (iterable): Names of the compressed images (e.g., PROCESSED_OCR_IMAGES).
+        persist (bool): Also write the compressed images to images/compressed, in the background.
+        max_workers (int): Number of images encoded at the same time. Threads are used rather than
+            processes, as the runner scripts cannot be re-imported by worker processes.
+    Returns:
+        list[str]: Paths of the prepared images (a PNG may have been encoded as JPEG to fit the byte budget).
+    '''
+    jobs, image_files = {}, []
+    for name in compressed_names:
+        # Images prepared by an earlier call are reused
+        stem = Path(name).stem
+        prepared = [path for path in prepared_images if Path(path).stem == stem]
+        if prepared:
+            image_files.extend(prepared)
+            continue
+
+        raw_path = find_raw_image(name)
+        if raw_path is None:
+            if (COMPRESSED_IMAGES_DIR / name).exists():
+                image_files.append(str(COMPRESSED_IMAGES_DIR / name))
+            else:
+                print(f"\033[93mWARNING: No raw scan or compressed image found for {name}.\033[0m")
+            continue
+        jobs[raw_path] = name
+
+    if not jobs:
+        return image_files
+
+    print(f"Preparing {len(jobs)} image(s) in memory from {RAW_IMAGES_DIR}...")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+        futures = {executor.submit(compress_image_to_bytes, raw_path): raw_path for raw_path in jobs}
+        for future in as_completed(futures):
+            raw_path = futures[future]
+            try:
+                data, suffix = future.result()
+            except Exception as e:
+                print(f"Failed to compress {raw_path.name}: {e}")
+                continue
+            out_path = COMPRESSED_IMAGES_DIR / (raw_path.stem + '_comp' + suffix)
+            with prepared_images_lock:
+                prepared_images[str(out_path)] = data
+            image_files.append(str(out_path))
+            if persist:
+                COMPRESSED_IMAGES_DIR.mkdir(parents=True, exist_ok=True)
+                persist_executor.submit(persist_image, out_path, data)
+    print(f"Prepared {len(jobs)} image(s) in {time.perf_counter() - start:.1f}s")
+    return image_files
@@ -0,0 +1,276 @@
+# Import external modules
+import argparse, json, random, re, sys, time
+from markdown import markdown
+from bs4 import BeautifulSoup
+
+# Import self-made modules
+from response_cache import RESPONSE_CACHE_DIR
+
+# Plain text of the markdown returned by Mistral OCR, the same as rendering it with markdown() and reading the text
+# of the HTML with BeautifulSoup. The paragraphs, headings, indented code blocks, code spans and line breaks of the
+# OCR are converted directly, with the block and inline rules of Python-Markdown and without building an HTML document.
+# Markdown with any other construct (lists, quotes, links, raw HTML, entities, emphasis, escapes...) goes through
+# markdown() and BeautifulSoup. tests/test_markdown_text.py checks that both conversions give the same text on the
+# edge cases, `python markdown_text.py` on the cached responses and random Java-like pages (with the Markdown and
+# beautifulsoup4 versions of requirements.txt).
+
+TAB_LENGTH = 4
+
+# Block rules of Python-Markdown (markdown.blockprocessors)
+BLANK_LINE_RE = re.compile(r'(?<=\n) +\n')
+HEADING_RE = re.compile(r'(?:^|\n)(?P<level>#{1,6})(?P<header>(?:\\.|[^\\])*?)#*(?:\n|$)')
+UNSUPPORTED_BLOCK_RES = (
+    re.compile(r'^.*?\n[=-]+[ ]*(\n|$)', re.MULTILINE),  # Setext heading (matched at the start of the block)
+    re.compile(r'^[ ]{0,3}\d+\.[ ]+(.*)'),  # Ordered list (matched at the start of the block)
+    re.compile(r'^[ ]{0,3}[*+-][ ]+(.*)'),  # Unordered list (matched at the start of the block)
+)
+UNSUPPORTED_BLOCK_SEARCH_RES = (
+    re.compile(r'^[ ]{0,3}(?=(?P<atomicgroup>(-+[ ]{0,2}){3,}|(_+[ ]{0,2}){3,}|(\*+[ ]{0,2}){3,}))(?P=atomicgroup)[ ]*$', re.MULTILINE),  # Horizontal rule
+    re.compile(r'(^|\n)[ ]{0,3}>[ ]?(.*)'),  # Block quote
+    re.compile(r'^[ ]{0,3}\[([^\[\]]*)\]:[ ]*\n?[ ]*([^\s]+)[ ]*(?:\n[ ]*)?((["\'])(.*)\4[ ]*|\((.*)\)[ ]*)?$', re.MULTILINE),  # Link reference
+)
+
+# Raw HTML blocks, comments and processing instructions, and backslash escapes, searched in the whole markdown
+UNSUPPORTED_SOURCE_RE = re.compile(r'(?:^|\n)[ ]*<[A-Za-z/!?]|<!|<\?|\\[\\`*_{}\[\]()>#+\-.!]')
+
+# Inline rules of Python-Markdown (markdown.inlinepatterns)
+BACKTICK_RE = re.compile(r'(?:(?<!\\)((?:\\{2})+)(?=`+)|(?<!\\)(`+)(.+?)(?<!`)\2(?!`))', re.DOTALL)
+STANDALONE_STARS_RE = re.compile(r'(?:^|(?<=\s))\*{1,3}(?=\s|$)', re.DOTALL)
+UNSUPPORTED_INLINE_RES = (
+    re.compile(r'(<(\/?[a-zA-Z][^<>@ ]*( [^<>]*)?|!--(?:(?!<!--|-->).)*--|[?](?:(?!<[?]|[?]>).)*[?]|!\[CDATA\[(?:(?!<!\[CDATA\[|\]\]>).)*\]\])>)', re.DOTALL),  # Raw HTML and autolinks
+    re.compile(r'<([^<> !]+@[^@<> ]+)>', re.DOTALL),  # Automatic email link
+    re.compile(r'&[#a-zA-Z0-9]'),  # HTML entity, also without a semicolon as BeautifulSoup reads them
+    re.compile(r'\]\('),  # Inline link or image
+    re.compile(r'(?<!\w)_'),  # Underscore opening emphasis
+)
+
+# Placeholder of a code span while the inline rules are checked, as in Python-Markdown
+PLACEHOLDER = '\x02klzzwxh:%04d\x03'
+INLINE_ELEMENT_RE = re.compile(r'(  \n|\x02klzzwxh:\d{4}\x03)')
+
+# BeautifulSoup reads a text node made only of these characters as a single space or line break
+ASCII_SPACES = ' \n\t\x0c\r'
+
+class UnsupportedMarkdown(Exception):
+    '''Raised by the direct conversion for markdown it does not convert.'''
+
+def reference_markdown_to_text(markdown_text: str) -> str:
+    # Render the markdown as HTML and extract the text of the document
+    html = markdown(markdown_text)
+    soup = BeautifulSoup(html, features="html.parser")
+    return soup.get_text()
+
+def detab(block: str) -> tuple[str, str]:
+    # Remove one indentation from the lines of a code block, up to the first line that is not indented (returned apart)
+    lines = block.split('\n')
+    code_lines = []
+    for line in lines:
+        if line.startswith(' ' * TAB_LENGTH):
+            code_lines.append(line[TAB_LENGTH:])
+        elif not line.strip():
+            code_lines.append('')
+        else:
+            break
+    return '\n'.join(code_lines), '\n'.join(lines[len(code_lines):])
+
+def inline_text(text: str) -> str:
+    '''
+    Text of a paragraph or heading after the inline rules: code spans are kept as they are (stripped),
+    two spaces at the end of a line are removed with the line break, everything else is plain text.
+    Blank text between these elements is read as BeautifulSoup reads it.
+    Raises:
+        UnsupportedMarkdown: If any other inline rule could match.
+    '''
+    code_spans = {}
+
+    def stash(match: re.Match) -> str:
+        placeholder = PLACEHOLDER % len(code_spans)
+        code_spans[placeholder] = match.group(3).strip()
+        return placeholder
+
+    masked = BACKTICK_RE.sub(stash, text)
+    if any(pattern.search(masked) for pattern in UNSUPPORTED_INLINE_RES):
+        raise UnsupportedMarkdown
+    # Stand-alone runs of up to three asterisks are plain text, any two others could open and close emphasis.
+    # Line breaks are replaced before emphasis, so an asterisk before the two spaces of a line break is not stand-alone.
+    elements_masked = INLINE_ELEMENT_RE.sub('\x02', masked)
+    if elements_masked.count('*') - sum(len(stars) for stars in STANDALONE_STARS_RE.findall(elements_masked)) >= 2:
+        raise UnsupportedMarkdown
+
+    # Text nodes between the code spans and line breaks, followed by the text of the element after them
+    pieces = INLINE_ELEMENT_RE.split(masked)
+    texts = []
+    for i in range(0, len(pieces), 2):
+        node = pieces[i]
+        if i and pieces[i - 1] == '  \n':
+            # The text after a line break starts on a new line, only the line break is kept if it is blank
+            node = f"\n{node}" if node.strip() else '\n'
+        if node and not node.strip(ASCII_SPACES):
+            node = '\n' if '\n' in node else ' '
+        texts.append(node)
+        if i + 1 < len(pieces):
+            texts.append(code_spans.get(pieces[i + 1], ''))
+    return ''.join(texts)
+
+def parse_blocks(blocks: list[str], elements: list[list[str]]):
+    '''
+    Convert the blocks in the order of the block processors of Python-Markdown.
+    Args:
+        blocks (list[str]): The blocks of markdown, separated by blank lines.
+        elements (list[list[str]]): Filled with ['code' or 'text', text] for every block element.
+    Raises:
+        UnsupportedMarkdown: If a block needs a processor other than empty lines, code blocks, headings or paragraphs.
+    '''
+    while blocks:
+        block = blocks.pop(0)
+        after_code = bool(elements) and elements[-1][0] == 'code'
+
+        # Blank lines, kept at the end of a preceding code block
+        if not block or block.startswith('\n'):
+            if block[1:]:
+                blocks.insert(0, block[1:])
+            if after_code:
+                elements[-1][1] += '\n' if block else '\n\n'
+            continue
+
+        # Indented code block, continuing the preceding code block across blank lines
+        if block.startswith(' ' * TAB_LENGTH):
+            code, rest = detab(block)
+            if after_code:
+                elements[-1][1] = f"{elements[-1][1]}\n{code.rstrip()}\n"
+            else:
+                elements.append(['code', f"{code.rstrip()}\n"])
+            if rest:
+                blocks.insert(0, rest)
+            continue
+
+        # ATX heading on any line of the block, the lines before it are a block of their own
+        heading = HEADING_RE.search(block)
+        if heading:
+            before, after = block[:heading.start()], block[heading.end():]
+            if before:
+                parse_blocks([before], elements)
+            elements.append(['text', inline_text(heading.group('header').strip())])
+            if after:
+                blocks.insert(0, after)
+            continue
+
+        if any(pattern.match(block) for pattern in UNSUPPORTED_BLOCK_RES) or any(pattern.search(block) for pattern in UNSUPPORTED_BLOCK_SEARCH_RES):
+            raise UnsupportedMarkdown
+
+        # Paragraph
+        if block.strip():
+            elements.append(['text', inline_text(block.lstrip())])
+
+def fast_markdown_to_text(markdown_text: str) -> str | None:
+    '''
+    Convert markdown to plain text without rendering it as HTML.
+    Args:
+        markdown_text (str): Markdown of an OCR page.
+    Returns:
+        str | None: The text, as reference_markdown_to_text returns it, or None if the markdown uses an unsupported construct.
+    '''
+    source = markdown_text
+    if not source.strip():
+        return ''
+    if UNSUPPORTED_SOURCE_RE.search(source):
+        return None
+
+    # Whitespace normalisation of Python-Markdown
+    source = source.replace('\x02', '').replace('\x03', '')
+    source = source.replace('\r\n', '\n').replace('\r', '\n') + '\n\n'
+    source = BLANK_LINE_RE.sub('\n', source.expandtabs(TAB_LENGTH))
+
+    elements = []
+    try:
+        parse_blocks(source.split('\n\n'), elements)
+    except UnsupportedMarkdown:
+        return None
+    # Block elements are separated by a line break, code blocks end with exactly one
+    return '\n'.join(f"{text.rstrip()}\n" if kind == 'code' else text for kind, text in elements)
+
+def markdown_to_text(markdown_text: str) -> str:
+    '''
+    Plain text of the markdown of an OCR page, converted directly when possible.
+    Args:
+        markdown_text (str): Markdown of an OCR page.
+    Returns:
+        str: The same text as reference_markdown_to_text.
+    '''
+    text = fast_markdown_to_text(markdown_text)
+    return text if text is not None else reference_markdown_to_text(markdown_text)
+
+
+# Equivalence check of the direct conversion against markdown() + BeautifulSoup
+
+# Fragments of the random pages: Java lines, OCR noise and markdown
+JAVA_LINES = [
+    'public class Main {', 'public static void main(String[] args) {', 'int total = 0;', 'for (int i = 0; i < n; i++) {',
+    'total += values[i];', '}', 'System.out.println("Total: " + total);', 'return total;', '// count the words',
+    'if (a > b && c != d) {', 'String name = scanner.nextLine();', 'x = y * 2;', 'private int count_words(String s) {',
+    'List<Integer> list = new ArrayList<>();', 'while (left <= right) {', 'int mid = (left + right) / 2;', 'else {',
+]
+MARKDOWN_FRAGMENTS = [
+    '# ', '## ', '```', '```java', '`', '*', '**', '_', '    ', '\t', '  ', '> ', '- ', '1. ', '[', ']', '(', ')', '<', '>',
+    '&', ';', '\\', '#', '---', '!', '=', '\n', '\n\n', 'a', 'int', ' ',
+]
+
+def random_page(rng: random.Random) -> str:
+    # Java-like page written as the OCR does, with random indentation, code fences and markdown fragments
+    lines = []
+    for _ in range(rng.randint(1, 25)):
+        line = ' ' * rng.choice([0, 0, 0, 2, 4, 8]) + rng.choice(JAVA_LINES)
+        if rng.random() < 0.3:
+            position = rng.randint(0, len(line))
+            line = line[:position] + ''.join(rng.choices(MARKDOWN_FRAGMENTS, k=rng.randint(1, 3))) + line[position:]
+        lines.append(line)
+        if rng.random() < 0.15:
+            lines.append('')
+    if rng.random() < 0.4:
+        lines = ['```java'] + lines + ['```']
+    if rng.random() < 0.3:
+        lines.insert(0, f"{'#' * rng.randint(1, 3)} Exam {rng.randint(1, 100)}")
+    return '\n'.join(lines)
+
+def cached_pages() -> list[str]:
+    # Markdown of the Mistral OCR responses in the response cache
+    pages = []
+    for path in RESPONSE_CACHE_DIR.glob('*/*.json'):
+        try:
+            response = json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            continue
+        if isinstance(response, dict) and isinstance(response.get('pages'), list):
+            pages.extend(page['markdown'] for page in response['pages'] if isinstance(page, dict) and isinstance(page.get('markdown'), str))
+    return pages
+
+def check_equivalence(pages: list[str]) -> bool:
+    '''
+    Convert every page with both conversions, print the differences, the share converted directly and the timings.
+    Returns:
+        bool: Whether all pages gave the same text.
+    '''
+    start = time.perf_counter()
+    fast_texts = [fast_markdown_to_text(page) for page in pages]
+    fast_time = time.perf_counter() - start
+    start = time.perf_counter()
+    reference_texts = [reference_markdown_to_text(page) for page in pages]
+    reference_time = time.perf_counter() - start
+
+    mismatches = [i for i, text in enumerate(fast_texts) if text is not None and text != reference_texts[i]]
+    for i in mismatches[:10]:
+        print(f"\033[91mERROR: Different text for {pages[i]!r}:\n  direct:    {fast_texts[i]!r}\n  reference: {reference_texts[i]!r}\033[0m")
+    direct = sum(text is not None for text in fast_texts)
+    print(f"{len(pages)} page(s), {direct} converted directly ({direct / max(len(pages), 1):.0%}), {len(mismatches)} difference(s)")
+    print(f"Direct conversion: {fast_time:.3f}s, markdown() + BeautifulSoup: {reference_time:.3f}s")
+    return not mismatches
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check that markdown_to_text gives the same text as markdown() + BeautifulSoup.")
+    parser.add_argument('--pages', type=int, default=5000, help="Number of random Java-like pages")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the random pages")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    pages = cached_pages() + [random_page(rng) for _ in range(args.pages)]
+    sys.exit(0 if check_equivalence(pages) else 1)
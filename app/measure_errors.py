@@ -1,80 +1,371 @@
-import Levenshtein, re
+import Levenshtein, glob, hashlib, json, os, re
+from concurrent.futures import ProcessPoolExecutor
+from enum import StrEnum
 from pathlib import Path
-from utils import OcrService
-import matplotlib.pyplot as plt
+import numpy as np
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein as RapidLevenshtein
+from utils import OcrService, image_tags
+from error_breakdown import collect_edit_operations, format_error_breakdown
+from text_normalization import normalize_file, normalize_text
+from results_store import RESULTS_STORE_PATH, ResultsStore
+from significance import CONFIDENCE_LEVEL, SIGNIFICANCE_LEVEL, bootstrap_confidence_interval, compare_with_best, format_confidence_interval, format_p_value
 
 MAX_COUNTER = 3
 
-def normalize_text_for_comparison(text):
+GROUND_TRUTH_DIR = Path(__file__).resolve().parent.parent / 'ground_truth'
+RESULTS_ROOT = Path(__file__).resolve().parent.parent / 'results'
+
+# Sub-folder of results/<service> holding the result files of the summary ('validating' or 'testing')
+RESULTS_SUBDIR = 'testing'
+
+# Number of worker processes computing the distances (1 computes them in the main process)
+MAX_WORKERS = os.cpu_count() or 1
+
+# Threads used by the batched RapidFuzz scoring (-1 uses all cores)
+BATCH_WORKERS = -1
+
+# Below this number of result files to score, starting the worker processes costs more than it saves
+MIN_FILES_FOR_POOL = 200
+
+# Persistent cache of the scores of (ground truth, OCR result) pairs, keyed by the hashes of their normalised texts,
+# so a rerun only scores new or modified files. The oldest entries are dropped beyond NLD_CACHE_MAX_ENTRIES.
+NLD_CACHE_PATH = RESULTS_ROOT / '.nld_cache.json'
+NLD_CACHE_MAX_ENTRIES = 500_000
+NLD_CACHE_VERSION = 1
+
+# Normalisation applied to the ground truths and results before scoring (see text_normalization.NORMALIZATION_PROFILES)
+NORMALIZATION_PROFILE = 'whitespace'
+
+# Read the results from the results store written by the runners instead of the text files.
+# The store holds the latest result of every image, whichever sub-folder its text file was moved to,
+# so it is off by default; services without any row in the store are always read from their text files.
+USE_RESULTS_STORE = False
+
+# Render the average NLD chart below the summary table (False writes the tables only, without importing matplotlib)
+RENDER_CHART = True
+
+GT_FILE_PATTERN = re.compile(r'(exam_\d+)(?:_\d+)?\.txt$')
+
+def normalize_text_for_comparison(text, profile: str = NORMALIZATION_PROFILE):
     """
     Normalize text by removing indentation whitespaces, line breaks, and redundant spaces.
     This preserves word spacing but removes formatting differences.
+    Other profiles of text_normalization can be selected with profile.
     """
-    # Split into lines and strip leading/trailing whitespace from each line
-    lines = text.split('\n')
-    # Remove leading whitespace (indentation) from each line and normalize spaces within each line
-    stripped_lines = [re.sub(r'\s+', ' ', line.strip()) for line in lines]
-    # Join lines with single spaces, removing empty lines
-    normalized = ' '.join(line for line in stripped_lines if line)
-    return normalized
-
-def collect_levenshtein_distances():
-    # Collect Levenshtein distances for all services and ground truth files
-    gt_dir = Path(__file__).resolve().parent.parent / 'ground_truth'
-    # Only include ground truth files that match the pattern exam_<number>.txt or exam_<number1>_<number2>.txt
-    all_gt_files = sorted([f for f in gt_dir.glob('*.txt') if re.match(r'exam_\d+(?:_\d+)?\.txt$', f.name)], key=lambda s: [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s.name)])
-    services = list(OcrService)
-    # Group files by exam_<num1>
+    return normalize_text(text, profile)
+
+def natural_key(name: str):
+    return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', name)]
+
+def compute_nld(gt_text_normalized: str, ocr_text_normalized: str) -> tuple[float, int]:
+    '''
+    Compute the Normalised Levenshtein Distance (NLD) score and the Levenshtein Distance (LD) of two normalised texts.
+    Two empty texts are a perfect match.
+    Returns:
+        tuple[float, int]: (NLD, LD)
+    '''
+    if not gt_text_normalized and not ocr_text_normalized:
+        return 1.0, 0
+    lev_dist = Levenshtein.distance(gt_text_normalized, ocr_text_normalized)
+    return 1 - lev_dist / max(len(gt_text_normalized), len(ocr_text_normalized)), lev_dist
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+def load_nld_cache(cache_path: Path = NLD_CACHE_PATH) -> dict:
+    '''
+    Load the scores of previously evaluated pairs.
+    Returns:
+        dict: {ground truth hash + OCR hash: [NLD, LD]} (empty if the cache is missing, corrupted or outdated).
+    '''
+    try:
+        cache = json.loads(Path(cache_path).read_text(encoding='utf-8'))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return cache.get('scores', {}) if cache.get('version') == NLD_CACHE_VERSION else {}
+
+def save_nld_cache(scores: dict, cache_path: Path = NLD_CACHE_PATH):
+    # Dictionaries keep their insertion order, used entries are moved to the end so the oldest ones are dropped first
+    if len(scores) > NLD_CACHE_MAX_ENTRIES:
+        scores = dict(list(scores.items())[-NLD_CACHE_MAX_ENTRIES:])
+    cache_path = Path(cache_path)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file first, so an interrupted run never leaves a half-written cache
+    tmp_path = cache_path.with_suffix('.tmp')
+    tmp_path.write_text(json.dumps({'version': NLD_CACHE_VERSION, 'scores': scores}), encoding='utf-8')
+    os.replace(tmp_path, cache_path)
+
+def batch_nld(gt_texts: list[str], ocr_texts: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Score aligned (ground truth, OCR result) pairs with one multi-threaded RapidFuzz call.
+    Args:
+        gt_texts (list[str]): Normalised ground truths.
+        ocr_texts (list[str]): Normalised OCR results, aligned with gt_texts.
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (NLD, LD) of every pair, with the same values as compute_nld.
+    '''
+    if not gt_texts:
+        return np.empty(0), np.empty(0, dtype=np.int64)
+    lev_dist = process.cpdist(gt_texts, ocr_texts, scorer=RapidLevenshtein.distance, workers=BATCH_WORKERS).astype(np.int64)
+    max_len = np.maximum([len(text) for text in gt_texts], [len(text) for text in ocr_texts])
+    # Two empty texts are a perfect match
+    nld = 1 - lev_dist / np.maximum(max_len, 1)
+    nld[max_len == 0] = 1.0
+    return nld, lev_dist
+
+def max_distance_to_beat(best_nld: float, max_len: int, strict: bool) -> int:
+    '''
+    Return the largest Levenshtein Distance whose NLD beats best_nld for texts of max_len characters
+    (strictly when strict, otherwise a tie is enough), or -1 if no distance can.
+    '''
+    # Start just above the real-valued bound and step down, using the same formula as compute_nld
+    lev_dist = min(int((1 - best_nld) * max_len) + 1, max_len)
+    while lev_dist >= 0:
+        nld = 1 - lev_dist / max_len
+        if nld > best_nld or (not strict and nld == best_nld):
+            break
+        lev_dist -= 1
+    return lev_dist
+
+def score_splits(ocr_text_normalized: str, candidates: list[tuple[int, str, str]], seed: tuple[float, int] | None = None) -> dict:
+    '''
+    Score the ground truth splits of one result file, abandoning the splits that cannot beat the current best.
+    The distance is bounded by the score needed to beat the best split so far, so the computation stops early,
+    and a split whose length difference alone is over that bound is skipped without computing anything.
+    Defined at module level so it can run in a worker process.
+    Args:
+        ocr_text_normalized (str): The normalised OCR result.
+        candidates (list[tuple[int, str, str]]): (split position, cache key, normalised ground truth) of the unscored splits, in order.
+        seed (tuple[float, int] | None): (NLD, split position) of the best split already scored (from the cache).
+    Returns:
+        dict: {cache key: (NLD, LD)} of the splits scored exactly. The splits that cannot be the first best are left out.
+    '''
+    scores = {}
+    best = seed
+    for position, key, gt_text_normalized in candidates:
+        max_len = max(len(gt_text_normalized), len(ocr_text_normalized))
+        if best is None or max_len == 0:
+            nld, lev_dist = compute_nld(gt_text_normalized, ocr_text_normalized)
+        else:
+            # A split before the current best wins a tie, a split after it must be strictly better
+            cutoff = max_distance_to_beat(best[0], max_len, strict=position > best[1])
+            # The distance is at least the length difference of the texts
+            if cutoff < 0 or abs(len(gt_text_normalized) - len(ocr_text_normalized)) > cutoff:
+                continue
+            lev_dist = Levenshtein.distance(gt_text_normalized, ocr_text_normalized, score_cutoff=cutoff)
+            if lev_dist > cutoff:
+                continue
+            nld = 1 - lev_dist / max_len
+        scores[key] = (nld, lev_dist)
+        if best is None or nld > best[0] or (nld == best[0] and position < best[1]):
+            best = (nld, position)
+    return scores
+
+def load_stored_results(services, use_store: bool = USE_RESULTS_STORE, store_path: Path = RESULTS_STORE_PATH) -> dict[str, dict[str, str]]:
+    # The latest text of every result file of the services in the results store (empty when the store is not used)
+    if not use_store:
+        return {}
+    store = ResultsStore(store_path)
+    try:
+        return store.latest_results(services)
+    finally:
+        store.close()
+
+def load_ground_truths(gt_dir: Path = GROUND_TRUTH_DIR, profile: str = NORMALIZATION_PROFILE) -> dict[str, list[tuple[str, str]]]:
+    '''
+    Read and normalise every ground truth file once.
+    Only files matching exam_<number>.txt or exam_<number1>_<number2>.txt are included.
+    Returns:
+        dict: {exam_<num1>: [(ground truth file name, normalised text), ...]} in natural order.
+    '''
+    gt_files = sorted([f for f in Path(gt_dir).glob('*.txt') if GT_FILE_PATTERN.match(f.name)], key=lambda f: natural_key(f.name))
     gt_grouped = {}
-    for f in all_gt_files:
-        m = re.match(r'(exam_\d+)(?:_\d+)?\.txt$', f.name)
-        if m:
-            base = m.group(1)
-            gt_grouped.setdefault(base, []).append(f)
-
-    ld_table = {}  # {exam_<num1>: {service: (NLD, LD, result_file_name)}}
-    avg_nld = {service: [] for service in services}
-    for base, files in gt_grouped.items():
-        ld_table[base + '.txt'] = {}
-        for service in services:
-            # results_dir = Path(__file__).resolve().parent.parent / 'results' / service / 'validating'
-            results_dir = Path(__file__).resolve().parent.parent / 'results' / service / 'testing'
-            pattern = f'{service}_{base}_comp.txt'
-            result_file = results_dir / pattern
-            best_nld = ''
-            best_ld = ''
-            best_result_file = ''
-            for gt_file in files:
-                with open(gt_file, 'r', encoding='utf-8') as fgt:
-                    gt_text = fgt.read()
-                if not result_file.exists():
-                    continue
-                with open(result_file, 'r', encoding='utf-8') as f:
-                    ocr_text = f.read()
-                
-                # Normalize texts for comparison (remove indentation and line breaks)
-                gt_text_normalized = normalize_text_for_comparison(gt_text)
-                ocr_text_normalized = normalize_text_for_comparison(ocr_text)
-                
-                if not gt_text_normalized and not ocr_text_normalized:
-                    nld = 1.0
-                    lev_dist = 0
-                else:
-                    lev_dist = Levenshtein.distance(gt_text_normalized, ocr_text_normalized)
-                    nld = 1 - lev_dist / max(len(gt_text_normalized), len(ocr_text_normalized))
-                if best_nld == '' or (isinstance(nld, float) and nld > best_nld):
-                    best_nld = nld
-                    best_ld = lev_dist
-                    best_result_file = result_file.name
-            if best_nld != '':
-                avg_nld[service].append(best_nld)
-            # Store tuple (NLD, LD, result_file_name) or ('', '', '')
-            if best_nld != '':
-                ld_table[base + '.txt'][service] = (best_nld, best_ld, best_result_file)
+    for gt_file in gt_files:
+        base = GT_FILE_PATTERN.match(gt_file.name).group(1)
+        gt_grouped.setdefault(base, []).append((gt_file.name, normalize_file(gt_file, profile)))
+    return gt_grouped
+
+def evaluate_services(services, gt_dir: Path = GROUND_TRUTH_DIR, results_root: Path = RESULTS_ROOT, results_subdir: str = RESULTS_SUBDIR, max_workers: int = MAX_WORKERS, use_cache: bool = True, cache_path: Path = NLD_CACHE_PATH, profile: str = NORMALIZATION_PROFILE, use_store: bool = USE_RESULTS_STORE, store_path: Path = RESULTS_STORE_PATH):
+    '''
+    Compute the distances of every (service x exam x split) result file in one pass.
+    Every ground truth and result file is read and normalised exactly once, pairs scored by a previous run
+    are read from the NLD cache, and the remaining distances are computed over max_workers processes.
+    Args:
+        services (list): The services to evaluate.
+        gt_dir (Path): The ground truth directory.
+        results_root (Path): The directory holding one results folder per service.
+        results_subdir (str): Sub-folder of results/<service> holding the result files ('' for the service folder itself).
+        max_workers (int): Number of worker processes (1 computes the distances in the main process).
+        use_cache (bool): Read and update the NLD cache.
+        cache_path (Path): Location of the NLD cache.
+        profile (str): The normalisation profile (scores are cached by normalised text, so profiles never mix).
+        use_store (bool): Read the results of the services found in the results store with one query.
+        store_path (Path): Location of the results store.
+    Returns:
+        tuple: (ground truths as returned by load_ground_truths,
+            {service: {exam_<num>: [(result file name, ground truth file name, LD, NLD), ...]}}).
+            Every result file has one entry, in natural order, with the ground truth split it matches best
+            (exams without ground truth have an empty list).
+    '''
+    gt_grouped = load_ground_truths(gt_dir, profile)
+    gt_hashes = {gt_name: text_hash(gt_text) for splits in gt_grouped.values() for gt_name, gt_text in splits}
+
+    # Read and normalise every result file of every service
+    stored_results = load_stored_results(services, use_store, store_path)
+    jobs = []  # (service, exam_<num>, result file name, normalised OCR text, OCR hash)
+    for service in services:
+        result_pattern = re.compile(rf'{re.escape(service)}_(exam_\d+)(?:_\d+)?_comp\.txt$')
+        if service in stored_results:
+            results = list(stored_results[service].items())
+        else:
+            results_dir = Path(results_root) / service / results_subdir
+            # Service names contain glob characters (e.g. '[ex]'), so the name is escaped
+            results = [(result_file.name, result_file) for result_file in results_dir.glob(f'{glob.escape(service)}_*.txt')]
+        for result_name, source in sorted(results, key=lambda result: natural_key(result[0])):
+            m = result_pattern.match(result_name)
+            if m:
+                ocr_text_normalized = normalize_text(source, profile) if isinstance(source, str) else normalize_file(source, profile)
+                jobs.append((service, m.group(1), result_name, ocr_text_normalized, text_hash(ocr_text_normalized)))
+
+    # Only score the pairs that are not in the cache, the best cached split seeds the bound of the others
+    scores = load_nld_cache(cache_path) if use_cache else {}
+    cached_pairs = 0
+    tasks = []  # (normalised OCR text, unscored splits, best cached split)
+    for _, base, _, ocr_text_normalized, ocr_hash in jobs:
+        candidates, seed = [], None
+        for position, (gt_name, gt_text_normalized) in enumerate(gt_grouped.get(base, [])):
+            key = gt_hashes[gt_name] + ocr_hash
+            if key in scores:
+                # Mark the entry as recently used
+                scores[key] = scores.pop(key)
+                cached_pairs += 1
+                if seed is None or scores[key][0] > seed[0]:
+                    seed = (scores[key][0], position)
             else:
-                ld_table[base + '.txt'][service] = ('', '', '')
-    # Calculate averages
-    avg_row = {service: (sum(avg_nld[service])/len(avg_nld[service]) if avg_nld[service] else 0) for service in services}
+                candidates.append((position, key, gt_text_normalized))
+        if candidates:
+            tasks.append((ocr_text_normalized, candidates, seed))
+
+    # Result files with a single unscored split and nothing to beat are scored in one batched call
+    single_tasks = [task for task in tasks if len(task[1]) == 1 and task[2] is None]
+    split_tasks = [task for task in tasks if not (len(task[1]) == 1 and task[2] is None)]
+    nld, lev_dist = batch_nld([candidates[0][2] for _, candidates, _ in single_tasks], [ocr_text for ocr_text, _, _ in single_tasks])
+    computed = [{candidates[0][1]: (float(nld[i]), int(lev_dist[i]))} for i, (_, candidates, _) in enumerate(single_tasks)]
+
+    # The other result files are matched against their splits, in worker processes when there are enough of them
+    if max_workers > 1 and len(split_tasks) >= MIN_FILES_FOR_POOL:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            computed += list(executor.map(score_splits, *zip(*split_tasks), chunksize=max(1, len(split_tasks) // (max_workers * 4))))
+    else:
+        computed += [score_splits(*task) for task in split_tasks]
+    # Only exact scores are kept, the abandoned splits are bounded and would be wrong in the cache
+    new_pairs = sum(len(task_scores) for task_scores in computed)
+    pruned_pairs = sum(len(candidates) for _, candidates, _ in tasks) - new_pairs
+    for task_scores in computed:
+        scores.update(task_scores)
+    if use_cache:
+        print(f"NLD cache: {cached_pairs} pair(s) already scored, {new_pairs} new pair(s) scored, {pruned_pairs} pruned.")
+        if new_pairs:
+            save_nld_cache(scores, cache_path)
+
+    # Keep the first best ground truth split of every result file
+    evaluation = {service: {} for service in services}
+    for service, base, result_name, _, ocr_hash in jobs:
+        entries = evaluation[service].setdefault(base, [])
+        best = None
+        for gt_name, _ in gt_grouped.get(base, []):
+            key = gt_hashes[gt_name] + ocr_hash
+            # Splits without a score were pruned, they cannot be the first best
+            if key not in scores:
+                continue
+            nld, lev_dist = scores[key]
+            if best is None or nld > best[3]:
+                best = (result_name, gt_name, lev_dist, nld)
+        if best is not None:
+            entries.append(best)
+    return gt_grouped, evaluation
+
+def best_entry(entries: list[tuple], result_file_name: str | None = None) -> tuple | None:
+    # The first entry with the highest NLD, optionally restricted to one result file
+    best = None
+    for entry in entries:
+        if result_file_name is not None and entry[0] != result_file_name:
+            continue
+        if best is None or entry[3] > best[3]:
+            best = entry
+    return best
+
+def summary_matrix(gt_grouped: dict, evaluation: dict, services: list) -> tuple[list[str], np.ndarray, np.ndarray]:
+    '''
+    Arrange the summary scores (the unsplit result file of each exam against its best ground truth split)
+    as services x exams matrices.
+    Args:
+        gt_grouped (dict), evaluation (dict): The output of evaluate_services.
+        services (list): The services, in row order.
+    Returns:
+        tuple: (ground truth file names exam_<num1>.txt, NLD matrix, LD matrix), NaN where a service has no result.
+    '''
+    exams = list(gt_grouped)
+    nld_matrix = np.full((len(services), len(exams)), np.nan)
+    ld_matrix = np.full((len(services), len(exams)), np.nan)
+    for i, service in enumerate(services):
+        for j, base in enumerate(exams):
+            entry = best_entry(evaluation.get(service, {}).get(base, []), f'{service}_{base}_comp.txt')
+            if entry is not None:
+                nld_matrix[i, j], ld_matrix[i, j] = entry[3], entry[2]
+    return [base + '.txt' for base in exams], nld_matrix, ld_matrix
+
+def summary_pairs(gt_grouped: dict, evaluation: dict, services: list, results_root: Path = RESULTS_ROOT, results_subdir: str = RESULTS_SUBDIR, profile: str = NORMALIZATION_PROFILE, use_store: bool = USE_RESULTS_STORE, store_path: Path = RESULTS_STORE_PATH):
+    '''
+    Yield the (ground truth, OCR result) pairs of the summary one at a time, reading each result file when it is needed.
+    Args:
+        gt_grouped (dict), evaluation (dict): The output of evaluate_services.
+        services (list): The services.
+        results_root (Path), results_subdir (str), profile (str), use_store (bool), store_path (Path): As given to evaluate_services.
+    Yields:
+        tuple: (service, exam_<num>, normalised ground truth, normalised OCR result)
+    '''
+    stored_results = load_stored_results(services, use_store, store_path)
+    for service in services:
+        for base, splits in gt_grouped.items():
+            entry = best_entry(evaluation.get(service, {}).get(base, []), f'{service}_{base}_comp.txt')
+            if entry is not None:
+                if service in stored_results:
+                    ocr_text_normalized = normalize_text(stored_results[service][entry[0]], profile)
+                else:
+                    ocr_text_normalized = normalize_file(Path(results_root) / service / results_subdir / entry[0], profile)
+                yield service, base, dict(splits)[entry[1]], ocr_text_normalized
+
+def average_nld(nld_matrix: np.ndarray) -> np.ndarray:
+    # Average NLD of every service over its scored exams, 0 for a service without any result
+    scored = ~np.isnan(nld_matrix)
+    return np.where(scored.any(axis=1), np.nansum(nld_matrix, axis=1) / np.maximum(scored.sum(axis=1), 1), 0.0)
+
+def collect_levenshtein_distances(gt_grouped: dict | None = None, evaluation: dict | None = None, services: list | None = None):
+    '''
+    Build the summary table of every service against every ground truth exam.
+    Args:
+        gt_grouped (dict | None), evaluation (dict | None): The output of evaluate_services, computed if not given.
+        services (list | None): The services of the table, all OcrService members if not given.
+    Returns:
+        tuple: (ld_table {exam_<num1>.txt: {service: (NLD, LD, result_file_name)}}, average NLD by service, services)
+    '''
+    services = list(OcrService) if services is None else list(services)
+    if evaluation is None:
+        gt_grouped, evaluation = evaluate_services(services)
+    gt_files, nld_matrix, ld_matrix = summary_matrix(gt_grouped, evaluation, services)
+
+    # Store tuple (NLD, LD, result_file_name) or ('', '', '')
+    ld_table = {
+        gt_file: {
+            service: ('', '', '') if np.isnan(nld_matrix[i, j])
+            else (float(nld_matrix[i, j]), int(ld_matrix[i, j]), f'{service}_{gt_file.removesuffix(".txt")}_comp.txt')
+            for i, service in enumerate(services)
+        }
+        for j, gt_file in enumerate(gt_files)
+    }
+    avg_row = dict(zip(services, average_nld(nld_matrix).tolist()))
     return ld_table, avg_row, services
 
 def get_service_gt_files(service_name):
@@ -82,10 +373,10 @@ def get_service_gt_files(service_name):
     service = OcrService(service_name)
     results_dir = Path(__file__).resolve().parent.parent / 'results' / service
     gt_dir = Path(__file__).resolve().parent.parent / 'ground_truth'
-    result_files = list(results_dir.glob(f'{service}_*.txt'))
+    result_files = list(results_dir.glob(f'{glob.escape(service)}_*.txt'))
     gt_files = set()
     for result_file in result_files:
-        m = re.match(rf'{service}_(.*)_comp\.txt', result_file.name)
+        m = re.match(rf'{re.escape(service)}_(.*)_comp\.txt', result_file.name)
         if not m:
             continue
         base = m.group(1)
@@ -94,53 +385,27 @@ def get_service_gt_files(service_name):
             gt_files.add(gt_file)
     return gt_files
 
-def get_average_normalized_levenshtein(service_name: str, output_lines, summary_gt_files=None):
-    # Map service name to folder and file prefix
-    service = OcrService(service_name)
-    results_dir = Path(__file__).resolve().parent.parent / 'results' / service
-    gt_dir = Path(__file__).resolve().parent.parent / 'ground_truth'
-
-    # Group ground truth files by canonical (exam_<num>.txt)
-    gt_files_all = sorted([f for f in gt_dir.glob('*.txt') if re.match(r'exam_\d+(?:_\d+)?\.txt$', f.name)], key=lambda s: [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s.name)])
-    gt_grouped = {}
-    for f in gt_files_all:
-        m = re.match(r'(exam_\d+)(?:_\d+)?\.txt$', f.name)
-        if m:
-            base = m.group(1)
-            gt_grouped.setdefault(base, []).append(f)
-
-    # Find all result files for this service
-    result_files = list(results_dir.glob(f'{service}_*.txt'))
-    def natural_key(s):
-        return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s.name)]
-    result_files = sorted(result_files, key=natural_key)
-
-    # Build a mapping from canonical base (exam_<num>) to all result files for its splits
-    result_files_by_canonical = {}
-    for result_file in result_files:
-        m = re.match(rf'{service}_(exam_\d+(?:_\d+)?)_comp\.txt', result_file.name)
-        if not m:
-            continue
-        base = m.group(1)
-        # Canonical base is exam_<num>
-        canonical_base = re.match(r'(exam_\d+)', base).group(1)
-        result_files_by_canonical.setdefault(canonical_base, []).append(result_file)
-
-    # If summary_gt_files is provided, use only those canonical ground truths (exam_<num>.txt)
-    if summary_gt_files is not None:
-        canonical_gt_names = [re.match(r'(exam_\d+)', f).group(1) for f in summary_gt_files if re.match(r'exam_\d+\.txt$', f)]
-    else:
-        canonical_gt_names = sorted(result_files_by_canonical.keys(), key=lambda s: [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', s)])
+def get_average_normalized_levenshtein(service_name: str, output_lines, summary_gt_files=None, ld_table=None, evaluation=None):
+    '''
+    Append the per-service results table to output_lines.
+    Args:
+        service_name (str): The service.
+        output_lines (list): The Markdown lines to append to.
+        summary_gt_files (iterable | None): Ground truth files of the summary, to align the table with it.
+        ld_table (dict | None): The summary table of collect_levenshtein_distances, whose values are reused.
+        evaluation (dict | None): The evaluation of evaluate_services, used without ld_table.
+            Computed from the result files in results/<service> if not given.
+    '''
+    # Services of another enumeration (e.g., the synthetic services of benchmark_evaluation.py) are used as they are
+    service = service_name if isinstance(service_name, StrEnum) else OcrService(service_name)
 
     nld_list = []
     ld_list = []
     table_rows = []
 
-    # Use summary_gt_files and ld_table if provided to fill the per-service table
-    ld_table = None
-    if hasattr(get_average_normalized_levenshtein, 'ld_table'):
-        ld_table = getattr(get_average_normalized_levenshtein, 'ld_table')
     if summary_gt_files is not None and ld_table is not None:
+        # If summary_gt_files is provided, use only those canonical ground truths (exam_<num>.txt)
+        canonical_gt_names = [re.match(r'(exam_\d+)', f).group(1) for f in summary_gt_files if re.match(r'exam_\d+\.txt$', f)]
         # Use the summary's NLD, LD, and result file values for this service
         for canonical_base in canonical_gt_names:
             canonical_gt_name = canonical_base + '.txt'
@@ -153,44 +418,21 @@ def get_average_normalized_levenshtein(service_name: str, output_lines, summary_
                 nld_list.append(nld_val)
                 ld_list.append(ld_val)
     else:
+        if evaluation is None:
+            _, evaluation = evaluate_services([service], results_subdir='')
+        result_files_by_canonical = evaluation.get(service, {})
+        if summary_gt_files is not None:
+            canonical_gt_names = [re.match(r'(exam_\d+)', f).group(1) for f in summary_gt_files if re.match(r'exam_\d+\.txt$', f)]
+        else:
+            canonical_gt_names = sorted(result_files_by_canonical.keys(), key=natural_key)
         for canonical_base in canonical_gt_names:
-            # All result files for this canonical (splits)
-            split_result_files = result_files_by_canonical.get(canonical_base, [])
-            best_nld = None
-            best_ld = None
-            best_result_file = None
-            best_gt_file = None
-            # For each split result file, compare to all ground truths for this canonical
-            for result_file in split_result_files:
-                gt_files_to_compare = gt_grouped.get(canonical_base, [])
-                if not gt_files_to_compare:
-                    continue
-                with open(result_file, 'r', encoding='utf-8') as f:
-                    ocr_text = f.read()
-                for gt_file_candidate in gt_files_to_compare:
-                    with open(gt_file_candidate, 'r', encoding='utf-8') as fgt:
-                        gt_text = fgt.read()
-                    
-                    # Normalize texts for comparison (remove indentation and line breaks)
-                    gt_text_normalized = normalize_text_for_comparison(gt_text)
-                    ocr_text_normalized = normalize_text_for_comparison(ocr_text)
-                    
-                    if not gt_text_normalized and not ocr_text_normalized:
-                        nld = 0.0
-                        lev_dist = 0
-                    else:
-                        lev_dist = Levenshtein.distance(gt_text_normalized, ocr_text_normalized)
-                        nld = 1 - lev_dist / max(len(gt_text_normalized), len(ocr_text_normalized))
-                    if (best_nld is None) or (nld > best_nld):
-                        best_nld = nld
-                        best_ld = lev_dist
-                        best_result_file = result_file
-                        best_gt_file = gt_file_candidate
+            # Best match over all split result files and ground truths of this canonical exam
+            entry = best_entry(result_files_by_canonical.get(canonical_base, []))
             canonical_gt_name = canonical_base + '.txt'
-            if best_nld is not None:
-                nld_list.append(best_nld)
-                ld_list.append(best_ld)
-                table_rows.append((best_result_file.name, canonical_gt_name, best_ld, best_nld))
+            if entry is not None:
+                nld_list.append(entry[3])
+                ld_list.append(entry[2])
+                table_rows.append((entry[0], canonical_gt_name, entry[2], entry[3]))
             else:
                 # No result for this service/canonical ground truth, add a row with blanks
                 table_rows.append(("-", canonical_gt_name, '-', '-'))
@@ -223,44 +465,32 @@ def get_average_normalized_levenshtein(service_name: str, output_lines, summary_
             else:
                 output_lines.append(f"| {row[0]} | {row[1]} | {row[2]} | {row[3]} |\n")
         output_lines.append(f"| **Average** |  | **{avg_ld:.2f}** | **{avg_nld:.4f}** |\n")
+        # Bootstrap interval of the average NLD, over the exams in table order like the summary
+        nld_interval = bootstrap_confidence_interval([row[3] for row in table_rows if isinstance(row[3], float)])
+        output_lines.append(f"| **{CONFIDENCE_LEVEL:.0%} CI** |  |  | **{format_confidence_interval(nld_interval, 4)}** |\n")
         output_lines.append("\n")
 
-if __name__ == "__main__":
-    # Generate a summary table of Levenshtein distances for all OCR services
-    ld_table, avg_row, services = collect_levenshtein_distances()
-    output_lines = []
+def render_average_nld_chart(service_labels: list[str], avg_nld_values: np.ndarray, graph_path: Path) -> bool:
+    '''
+    Draw the bar chart of the average NLD by service, unless the chart already on disk was drawn from the same values.
+    matplotlib is only imported when a chart is drawn, with the headless Agg backend.
+    Args:
+        service_labels (list[str]): The bar labels.
+        avg_nld_values (np.ndarray): The average NLD of every service.
+        graph_path (Path): The PNG file to write.
+    Returns:
+        bool: True if the chart was drawn, False if the existing one was kept.
+    '''
+    # The hash of the chart inputs is stored next to the chart
+    hash_path = graph_path.with_suffix('.sha256')
+    chart_hash = hashlib.sha256(json.dumps([service_labels, avg_nld_values.tolist()]).encode('utf-8')).hexdigest()
+    if graph_path.exists() and hash_path.exists() and hash_path.read_text(encoding='utf-8').strip() == chart_hash:
+        return False
 
-    output_lines.append("# OCR Result Summary\n\n")
-    output_lines.append("## OCR Normalized Levenshtein Distance (NLD) Summary\n\n")
-    # Dynamic header
-    header = ["Ground Truth File"] + [
-        f"{service.upper()} NLD" if service == 'gpt' else f"{service.title().replace('_', ' ')} NLD" 
-        for service in services
-    ]
-    output_lines.append(f"| {' | '.join(header)} |\n")
-    output_lines.append(f"|{'|'.join([':---:' for _ in header])}|\n")
-    summary_gt_files = []
-    for gt_file in ld_table:
-        # Exclude if all services have missing NLD
-        if all((ld_table[gt_file][service][0] if isinstance(ld_table[gt_file][service], tuple) else ld_table[gt_file][service]) == '' for service in services):
-            continue
-        summary_gt_files.append(gt_file)
-        row = [gt_file]
-        for service in services:
-            val = ld_table[gt_file][service]
-            nld_val = val[0] if isinstance(val, tuple) else val
-            if nld_val == '':
-                row.append("-")
-            else:
-                row.append(f"{nld_val:.3f}")
-        output_lines.append(f"| {' | '.join(row)} |\n")
-    avg_row_fmt = [f"{avg_row[service]:.3f}" if avg_row[service] != 0 else "-" for service in services]
-    output_lines.append(f"| **Average** | {' | '.join(avg_row_fmt)} |\n\n")
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
 
-    # --- Generate and insert graph ---
-    # Prepare data for the graph
-    service_labels = [service.upper() if service == 'gpt' else service.title().replace('_', ' ') for service in services]
-    avg_nld_values = [avg_row[service] for service in services]
     plt.figure(figsize=(8, 6))
     bars = plt.bar(service_labels, avg_nld_values, color='skyblue')
     plt.ylabel('Average Normalized Levenshtein Distance (NLD)')
@@ -268,18 +498,66 @@ if __name__ == "__main__":
     plt.grid(axis='y', linestyle='--', alpha=0.6)
     plt.xticks(rotation=30, ha='right')
     # Set y-axis ticks to have a gap of 0.3
-    import numpy as np
     min_y = 0
-    max_y = max(avg_nld_values + [1.0])
+    max_y = max(avg_nld_values.max(initial=0), 1.0)
     plt.yticks(np.arange(min_y, max_y + 0.3, 0.3))
     for bar, value in zip(bars, avg_nld_values):
         plt.text(bar.get_x() + bar.get_width()/2, bar.get_height(), f'{value:.3f}', ha='center', va='bottom')
-    graph_path = Path(__file__).resolve().parent.parent / 'results' / 'avg_levenshtein_distance.png'
     plt.tight_layout()
     plt.savefig(graph_path)
     plt.close()
-    # Insert image below the summary table
-    output_lines.append(f'![Average Normalized Levenshtein Distance by OCR Service](avg_levenshtein_distance.png)\n\n')
+    hash_path.write_text(chart_hash, encoding='utf-8')
+    return True
+
+if __name__ == "__main__":
+    # Generate a summary table of Levenshtein distances for all OCR services
+    # Evaluate every result file once, the summary and the per-service tables are built from this single pass
+    services = list(OcrService)
+    gt_grouped, evaluation = evaluate_services(services)
+    gt_files, nld_matrix, ld_matrix = summary_matrix(gt_grouped, evaluation, services)
+    ld_table, avg_row, services = collect_levenshtein_distances(gt_grouped, evaluation)
+    avg_nld_values = average_nld(nld_matrix)
+    output_lines = []
+
+    output_lines.append("# OCR Result Summary\n\n")
+    output_lines.append("## OCR Normalized Levenshtein Distance (NLD) Summary\n\n")
+    # Dynamic header
+    header = ["Ground Truth File"] + [
+        f"{service.upper()} NLD" if service == 'gpt' else f"{service.title().replace('_', ' ')} NLD" 
+        for service in services
+    ]
+    output_lines.append(f"| {' | '.join(header)} |\n")
+    output_lines.append(f"|{'|'.join([':---:' for _ in header])}|\n")
+    # Exclude the ground truths that no service has a result for
+    summary_columns = np.flatnonzero(~np.isnan(nld_matrix).all(axis=0))
+    summary_gt_files = [gt_files[j] for j in summary_columns]
+    for j in summary_columns:
+        row = [gt_files[j]] + ["-" if np.isnan(nld_val) else f"{nld_val:.3f}" for nld_val in nld_matrix[:, j]]
+        output_lines.append(f"| {' | '.join(row)} |\n")
+    avg_row_fmt = [f"{value:.3f}" if value != 0 else "-" for value in avg_nld_values]
+    output_lines.append(f"| **Average** | {' | '.join(avg_row_fmt)} |\n")
+    # Bootstrap confidence intervals of the averages, and paired permutation tests against the best service
+    intervals = [bootstrap_confidence_interval(nld_matrix[i]) for i in range(len(services))]
+    output_lines.append(f"| **{CONFIDENCE_LEVEL:.0%} CI** | {' | '.join(format_confidence_interval(interval) for interval in intervals)} |\n")
+    best, p_values = compare_with_best(nld_matrix, avg_nld_values)
+    if best is not None:
+        p_row_fmt = ["best" if i == best else format_p_value(p_value) for i, p_value in enumerate(p_values)]
+        output_lines.append(f"| **p-value vs {header[best + 1].removesuffix(' NLD')}** | {' | '.join(p_row_fmt)} |\n")
+    output_lines.append("\n")
+    output_lines.append(
+        f"*{CONFIDENCE_LEVEL:.0%} CI: percentile bootstrap interval of the average NLD over the exams. "
+        f"p-value: paired permutation test of the per-exam NLD against the best service, over the exams scored by both "
+        f"(\\* below {SIGNIFICANCE_LEVEL}).*\n\n"
+    )
+
+    # --- Generate and insert graph ---
+    if RENDER_CHART:
+        service_labels = [service.upper() if service == 'gpt' else service.title().replace('_', ' ') for service in services]
+        graph_path = Path(__file__).resolve().parent.parent / 'results' / 'avg_levenshtein_distance.png'
+        if not render_average_nld_chart(service_labels, avg_nld_values, graph_path):
+            print(f"Average NLD unchanged, keeping {graph_path}")
+        # Insert image below the summary table
+        output_lines.append(f'![Average Normalized Levenshtein Distance by OCR Service](avg_levenshtein_distance.png)\n\n')
     # --- End graph ---
 
     # Check for differences in ground truth files between summary and each service
@@ -294,15 +572,17 @@ if __name__ == "__main__":
             if only_in_service:
                 print(f"Ground truth files in {service} but not in summary: {sorted(only_in_service)}")
 
-    # Pass ld_table to get_average_normalized_levenshtein for summary-aligned per-service tables
-    def get_avg_norm_lev_with_ld_table(service, output_lines, summary_gt_files, ld_table):
-        get_average_normalized_levenshtein.ld_table = ld_table
-        get_average_normalized_levenshtein(service, output_lines, summary_gt_files)
-        del get_average_normalized_levenshtein.ld_table
-
+    # Per-service tables reuse the summary's values, so they stay aligned with it
     for service in OcrService:
-        get_avg_norm_lev_with_ld_table(service, output_lines, summary_gt_set, ld_table)
+        get_average_normalized_levenshtein(service, output_lines, summary_gt_set, ld_table)
     results_path = Path(__file__).resolve().parent.parent / 'results' / 'results.md'
     with open(results_path, 'w', encoding='utf-8') as f:
         f.writelines(output_lines)
     print(f"Results written to {results_path}")
+
+    # Insertions, deletions and substitutions, CER and Java token WER of the same pairs, per service and image tag
+    row_labels, edit_totals = collect_edit_operations(summary_pairs(gt_grouped, evaluation, services), services, image_tags)
+    breakdown_path = results_path.with_name('error_breakdown.md')
+    with open(breakdown_path, 'w', encoding='utf-8') as f:
+        f.writelines(format_error_breakdown(row_labels, edit_totals, services))
+    print(f"Error breakdown written to {breakdown_path}")
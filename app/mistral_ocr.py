@@ -1,17 +1,41 @@
 # Import external modules
-import os, json, base64
+import asyncio, os, base64, time
 from pathlib import Path
-from markdown import markdown
-from bs4 import BeautifulSoup
+import httpx
 
 # Import self-made modules
-from utils import OcrService, PROCESSED_OCR_IMAGES, define_directories, load_env_file, is_a_file_an_image, save_results_to_file, natural_sort_files
+from utils import OcrService, define_directories, load_env_file, is_a_file_an_image, is_processed_image, save_results_to_file, natural_sort_files, get_image_media_type, run_concurrently
+from rate_limiter import rate_limited_call, rate_limited_call_async
+from run_manifest import RunManifest, hash_bytes, hash_request
+from response_cache import ResponseCache
+from image_pipeline import read_image_bytes
+from telemetry import RunTelemetry
+from results_store import ResultsStore
+from page_bundles import BUNDLE_MEDIA_TYPES, BUNDLE_SIZE, build_bundle, bundle_name, group_pages
+from markdown_text import markdown_to_text
 
 # Import Mistral AI modules
-from mistralai import Mistral, ImageURLChunk
+from mistralai import Mistral, DocumentURLChunk, ImageURLChunk
 
-# Define the OCR service being used
+# Define the OCR service being used and its model
 SERVICE = OcrService.MISTRAL
+MODEL_NAME = "mistral-ocr-latest"
+
+# Send the pages as multi-page PDF documents of up to BUNDLE_SIZE pages instead of one request per page
+# (Mistral OCR reads multi-page documents as PDF only)
+BUNDLE = False
+
+# Bundles analysed at the same time in the bundling mode
+MAX_PENDING_BUNDLES = 2
+
+# Send the images with asyncio over one pool of keep-alive connections instead of one request after the other
+ASYNC_RUNNER = True
+
+# Requests in flight at the same time with the asyncio runner (also the size of the connection pool)
+MAX_CONCURRENT_REQUESTS = 8
+
+# Seconds before a request of the asyncio runner times out
+REQUEST_TIMEOUT = 120
 
 # Load environment variables
 load_env_file()
@@ -28,12 +52,17 @@ if not api_key:
 # THE BELOW CODE IS ADAPTED FROM Mistral AI GUIDELINE:
 # https://colab.research.google.com/github/mistralai/cookbook/blob/main/mistral/ocr/structured_ocr.ipynb
 
-def analyse_read():
+def analyse_read(resume: bool = True, use_cache: bool = True, bundle: bool = BUNDLE, bundle_size: int = BUNDLE_SIZE, use_async: bool = ASYNC_RUNNER, max_concurrency: int = MAX_CONCURRENT_REQUESTS):
     """
     Function to analyse images using Mistral AI service.
     It connects to the Mistral service, retrieves images from a specified directory,
     and sends them to the Mistral API for text recognition.
     The results are saved to a file in a specified results directory.
+    With resume, images completed by a previous run (see run_manifest.json) are skipped.
+    With use_cache, an image analysed before with the same model is answered from the response cache.
+    With bundle, up to bundle_size pages are sent as one PDF document and every page is saved to its own result file.
+    With use_async (single images only), up to max_concurrency requests are sent at the same time with the async API
+    of the Mistral SDK, over one pool of keep-alive connections, and every result is reported as soon as it is saved.
     """
     # Create a Mistral client
     print("Connecting to Mistral AI service...\n")
@@ -43,47 +72,209 @@ def analyse_read():
     images_dir, image_files, results_dir = define_directories(SERVICE)
 
     # Only process images in PROCESSED_OCR_IMAGES and sort them naturally
-    image_files = [f for f in image_files if Path(f).name in PROCESSED_OCR_IMAGES]
+    image_files = [f for f in image_files if is_processed_image(f)]
     image_files = natural_sort_files(image_files)
 
     if not image_files:
         print(f"No images found in {images_dir}.")
         return
 
+    # Images completed by a previous run with the same model and image content are skipped
+    manifest = RunManifest(results_dir / 'run_manifest.json')
+    prompt_hash = hash_request({"model": MODEL_NAME})
+    response_cache = ResponseCache() if use_cache else None
+    telemetry = RunTelemetry(results_dir, SERVICE, MODEL_NAME, 'bundle' if bundle else 'async' if use_async else 'sync')
+    results_store = ResultsStore()
+
     print('---------- Mistral AI service analysis started ----------')
 
-    for image_path in image_files:
-        # Check if the file is an image
-        if not is_a_file_an_image(image_path):
-            print(f"\nSkipping {Path(image_path).name}, not a supported image format.")
-            continue
+    def prepare_document(document_bytes: bytes, data_url_chunk) -> tuple[str, dict | None, object]:
+        '''
+        Look up an image or PDF document in the response cache and encode it for the API if it is not cached.
+        Args:
+            document_bytes (bytes): The encoded image or document.
+            data_url_chunk (callable): Builds the request chunk from the base64 data URL of the document.
+        Returns:
+            tuple: (the response cache key, the cached OCR response or None, the request chunk or None if cached)
+        '''
+        cache_key = ResponseCache.make_key('mistral', MODEL_NAME, prompt_hash, hash_bytes(document_bytes))
+        cached = response_cache.get(cache_key) if response_cache else None
+        if cached:
+            return cache_key, cached, None
 
-        print(f"\nAnalysing {Path(image_path).name} by Mistral AI service...")
+        # Encode the document as base64 for API
+        with telemetry.measure('encode_time'):
+            document = data_url_chunk(base64.b64encode(document_bytes).decode('utf-8'))
+        return cache_key, None, document
 
-        # Encode image as base64 for API
-        encoded = base64.b64encode(Path(image_path).read_bytes()).decode()
-        base64_data_url = f"data:image/jpeg;base64,{encoded}"
+    def store_response(cache_key: str, ocr_response) -> dict:
+        # Convert the response to a dictionary, without serialising it as JSON
+        response_dict = ocr_response.model_dump(mode='json')
 
-        # Process image with OCR
-        image_response = client.ocr.process(
-            document=ImageURLChunk(image_url=base64_data_url),
-            model="mistral-ocr-latest"
+        if response_cache:
+            response_cache.put(cache_key, response_dict)
+        return response_dict
+
+    def analyse_document(document_bytes: bytes, data_url_chunk, stats: dict | None) -> tuple[dict, bool]:
+        '''
+        Process one image or PDF document with OCR, answered from the response cache if it was processed before.
+        Args:
+            document_bytes (bytes): The encoded image or document.
+            data_url_chunk (callable): Builds the request chunk from the base64 data URL of the document.
+            stats (dict | None): Filled by the rate limiter with the queue time, retries and request latency.
+        Returns:
+            tuple: (the OCR response as a dictionary, whether it came from the response cache)
+        '''
+        cache_key, cached, document = prepare_document(document_bytes, data_url_chunk)
+        if cached:
+            return cached, True
+
+        # Process the document with OCR, paced by the shared rate limiter
+        ocr_response = rate_limited_call(
+            'mistral', MODEL_NAME,
+            lambda: client.ocr.process(
+                document=document,
+                model=MODEL_NAME
+            ),
+            stats=stats,
         )
+        return store_response(cache_key, ocr_response), False
 
-        # Convert response to JSON
-        response_dict = json.loads(image_response.model_dump_json())
+    async def analyse_document_async(document_bytes: bytes, data_url_chunk, stats: dict | None, async_client: Mistral) -> tuple[dict, bool]:
+        # Same as analyse_document, the coroutine waits for the shared rate limiter without blocking the other requests.
+        # The cache reads and writes run in worker threads, so the disk never holds up the event loop.
+        cache_key, cached, document = await asyncio.to_thread(prepare_document, document_bytes, data_url_chunk)
+        if cached:
+            return cached, True
 
-        # Extract plain text from all pages' markdown
-        plain_text_pages = []
-        for page in response_dict.get('pages', []):
-            markdown_text = page.get('markdown', '')
-            html = markdown(markdown_text)
-            soup = BeautifulSoup(html, features="html.parser")
-            plain_text_pages.append(soup.get_text())
-        plain_text = '\n'.join(plain_text_pages)
+        ocr_response = await rate_limited_call_async(
+            'mistral', MODEL_NAME,
+            lambda: async_client.ocr.process_async(document=document, model=MODEL_NAME),
+            stats=stats,
+        )
+        return await asyncio.to_thread(store_response, cache_key, ocr_response), False
+
+    def page_plain_text(page: dict) -> str:
+        # Extract plain text from the markdown of a page
+        return markdown_to_text(page.get('markdown', ''))
 
+    def save_result(image_path, plain_text: str, cached: bool, latency: float | None):
         # Save recognised text to file
-        save_results_to_file(SERVICE, plain_text, Path(image_path).stem, results_dir)
+        result_file = save_results_to_file(SERVICE, plain_text, Path(image_path).stem, results_dir)
+        results_store.append(SERVICE, MODEL_NAME, prompt_hash, Path(image_path).name, result_file.name, plain_text, latency=latency, cached=cached)
+        return {"image": Path(image_path).name, "result_file": result_file, "cached": cached}
+
+    def analyse_image(image_path):
+        print(f"\nAnalysing {Path(image_path).name} by Mistral AI service...")
+
+        # Answer an image analysed before with the same model from the response cache
+        with telemetry.measure('image_load_time'):
+            image_bytes = read_image_bytes(image_path)
+        media_type = get_image_media_type(image_path)
+        response_dict, cached = analyse_document(
+            image_bytes, lambda encoded: ImageURLChunk(image_url=f"data:{media_type};base64,{encoded}"), telemetry.current()
+        )
+        if cached:
+            print(f"Using cached response for {Path(image_path).name}.")
+
+        # Extract plain text from all pages' markdown
+        plain_text = '\n'.join(page_plain_text(page) for page in response_dict.get('pages', []))
+        return save_result(image_path, plain_text, cached, (telemetry.current() or {}).get('request_latency'))
+
+    def analyse_bundle(bundle_paths: list):
+        # Send the pages as one PDF document, then save and record every page as its own image
+        print(f"\nAnalysing {bundle_name(bundle_paths)} by Mistral AI service...")
+        stats, start = {}, time.perf_counter()
+        try:
+            document_bytes = build_bundle(bundle_paths, 'PDF')
+            encode_time = time.perf_counter() - start
+            response_dict, cached = analyse_document(
+                document_bytes, lambda encoded: DocumentURLChunk(document_url=f"data:{BUNDLE_MEDIA_TYPES['PDF']};base64,{encoded}"), stats
+            )
+            if cached:
+                print(f"Using cached response for {bundle_name(bundle_paths)}.")
+            # Pages are numbered from 0 in document order
+            pages = {page.get('index'): page for page in response_dict.get('pages', [])}
+            if sorted(pages) != list(range(len(bundle_paths))):
+                raise RuntimeError(f"{len(pages)} page(s) returned for a document of {len(bundle_paths)} page(s)")
+            error = None
+        except Exception as e:
+            encode_time, error = None, e
+        latency = None if error or cached else time.perf_counter() - start - encode_time
+
+        def save_page(image_path):
+            if error is not None:
+                raise error
+            return save_result(image_path, page_plain_text(pages[bundle_paths.index(image_path)]), cached, latency)
+
+        for image_path in bundle_paths:
+            telemetry.track(
+                image_path, lambda image_path: manifest.run_image(image_path, image_keys[image_path], save_page),
+                **{**stats, 'encode_time': encode_time, 'request_latency': latency},
+            )
+
+    async def analyse_image_async(image_path, async_client: Mistral):
+        print(f"\nAnalysing {Path(image_path).name} by Mistral AI service...")
+
+        # Answer an image analysed before with the same model from the response cache
+        with telemetry.measure('image_load_time'):
+            image_bytes = await asyncio.to_thread(read_image_bytes, image_path)
+        media_type = get_image_media_type(image_path)
+        response_dict, cached = await analyse_document_async(
+            image_bytes, lambda encoded: ImageURLChunk(image_url=f"data:{media_type};base64,{encoded}"), telemetry.current(), async_client
+        )
+        if cached:
+            print(f"Using cached response for {Path(image_path).name}.")
+
+        # Extract plain text from all pages' markdown
+        plain_text = '\n'.join(page_plain_text(page) for page in response_dict.get('pages', []))
+        return await asyncio.to_thread(save_result, image_path, plain_text, cached, (telemetry.current() or {}).get('request_latency'))
+
+    async def analyse_images_async(image_paths: list):
+        # One pool of keep-alive connections shared by all requests, at most max_concurrency of them in flight
+        limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+        async with httpx.AsyncClient(limits=limits, timeout=REQUEST_TIMEOUT) as http_client:
+            async_client = Mistral(api_key=api_key, async_client=http_client)
+            semaphore = asyncio.Semaphore(max_concurrency)
+
+            async def run_image(image_path):
+                async with semaphore:
+                    record = await telemetry.track_async(
+                        image_path, lambda image_path: manifest.run_image_async(
+                            image_path, image_keys[image_path], lambda image_path: analyse_image_async(image_path, async_client)
+                        ),
+                    )
+                return image_path, record
+
+            # Report every image as soon as it finishes, whatever the order
+            tasks = [asyncio.create_task(run_image(image_path)) for image_path in image_paths]
+            for finished, task in enumerate(asyncio.as_completed(tasks), start=1):
+                image_path, record = await task
+                print(f"[{finished}/{len(tasks)}] {Path(image_path).name} {'done' if record is not None else 'failed'}")
+
+    image_keys = {}
+    for image_path in image_files:
+        # Check if the file is an image
+        if not is_a_file_an_image(image_path):
+            print(f"\nSkipping {Path(image_path).name}, not a supported image format.")
+            continue
+
+        image_key = RunManifest.make_key(SERVICE, MODEL_NAME, prompt_hash, hash_bytes(read_image_bytes(image_path)))
+        if resume and manifest.is_completed(image_key):
+            print(f"\nSkipping {Path(image_path).name}, already completed in a previous run.")
+            continue
+        image_keys[image_path] = image_key
+
+    if bundle:
+        run_concurrently(analyse_bundle, group_pages(list(image_keys), 'mistral', bundle_size), MAX_PENDING_BUNDLES)
+    elif use_async:
+        asyncio.run(analyse_images_async(list(image_keys)))
+    else:
+        for image_path in image_keys:
+            telemetry.track(image_path, lambda image_path: manifest.run_image(image_path, image_keys[image_path], analyse_image))
+
+    telemetry.summarise()
+    results_store.close()
 
     print('\n---------- Mistral AI service analysis finished ----------')
 
@@ -0,0 +1,76 @@
+# Import external modules
+import io
+from pathlib import Path
+from PIL import Image
+
+# Import self-made modules
+from compress_images import JPEG_MAX_QUALITY, PROVIDER_BYTE_BUDGETS
+from image_pipeline import read_image_bytes
+
+# Bundling mode of the Azure and Mistral runners: several exam pages are sent as one multi-page document,
+# so a run needs about BUNDLE_SIZE times fewer requests, and the text of every page is saved to its own result file.
+
+# Pages per document
+BUNDLE_SIZE = 10
+
+# Pages allowed per document (Azure S0 tier: 2000 pages, Mistral OCR: 1000 pages)
+PROVIDER_PAGE_LIMITS = {
+    'azure': 2000,
+    'mistral': 1000,
+}
+
+BUNDLE_MEDIA_TYPES = {
+    'PDF': 'application/pdf',
+    'TIFF': 'image/tiff',
+}
+
+def group_pages(image_paths: list, provider: str, bundle_size: int = BUNDLE_SIZE) -> list[list]:
+    '''
+    Split the images into consecutive bundles within the page and byte limits of the provider.
+    Args:
+        image_paths (list): Paths of the page images, in order.
+        provider (str): Provider key in PROVIDER_PAGE_LIMITS and compress_images.PROVIDER_BYTE_BUDGETS.
+        bundle_size (int): Maximum number of pages per bundle.
+    Returns:
+        list[list]: The bundles, each a list of image paths.
+    '''
+    max_pages = min(bundle_size, PROVIDER_PAGE_LIMITS[provider])
+    # The pages are re-encoded in the document, the size of the source images is used as an estimate
+    max_bytes = PROVIDER_BYTE_BUDGETS[provider]
+    bundles, bundle, bundle_bytes = [], [], 0
+    for image_path in image_paths:
+        size = len(read_image_bytes(image_path))
+        if bundle and (len(bundle) >= max_pages or bundle_bytes + size > max_bytes):
+            bundles.append(bundle)
+            bundle, bundle_bytes = [], 0
+        bundle.append(image_path)
+        bundle_bytes += size
+    if bundle:
+        bundles.append(bundle)
+    return bundles
+
+def build_bundle(image_paths: list, bundle_format: str = 'PDF') -> bytes:
+    '''
+    Pack page images into one multi-page document, one page per image in the given order.
+    Args:
+        image_paths (list): Paths of the page images.
+        bundle_format (str): 'PDF' (pages stored as JPEG at JPEG_MAX_QUALITY) or 'TIFF' (lossless, LZW compressed).
+    Returns:
+        bytes: The encoded document.
+    '''
+    if bundle_format not in BUNDLE_MEDIA_TYPES:
+        raise ValueError(f"Unsupported bundle format: {bundle_format}. Supported formats: {', '.join(BUNDLE_MEDIA_TYPES)}")
+    pages = []
+    for image_path in image_paths:
+        with Image.open(io.BytesIO(read_image_bytes(image_path))) as img:
+            pages.append(img.convert('RGB'))
+    buffer = io.BytesIO()
+    if bundle_format == 'PDF':
+        pages[0].save(buffer, format='PDF', save_all=True, append_images=pages[1:], quality=JPEG_MAX_QUALITY)
+    else:
+        pages[0].save(buffer, format='TIFF', save_all=True, append_images=pages[1:], compression='tiff_lzw')
+    return buffer.getvalue()
+
+def bundle_name(image_paths: list) -> str:
+    # e.g., exam_1_comp.png..exam_10_comp.png (10 pages)
+    return f"{Path(image_paths[0]).name}..{Path(image_paths[-1]).name} ({len(image_paths)} pages)"
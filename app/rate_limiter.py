@@ -0,0 +1,277 @@
+# Import external modules
+import asyncio, threading, time
+
+# Requests, input tokens and output tokens allowed per minute, per provider and model.
+# 'default' is used for models that are not listed. None means the quota is not enforced.
+# The values below are the entry-tier limits published by each provider (28/6/2025),
+# update them to match the tier of your own account.
+RATE_LIMITS = {
+    'claude': {
+        'default': {'rpm': 50, 'input_tpm': 40_000, 'output_tpm': 8_000},
+        'claude-opus-4-0': {'rpm': 50, 'input_tpm': 20_000, 'output_tpm': 4_000},
+        'claude-sonnet-4-0': {'rpm': 50, 'input_tpm': 20_000, 'output_tpm': 4_000},
+        'claude-3-7-sonnet-latest': {'rpm': 50, 'input_tpm': 20_000, 'output_tpm': 4_000},
+    },
+    # OpenAI counts input and output tokens against a single TPM quota
+    'gpt': {
+        'default': {'rpm': 500, 'input_tpm': 30_000, 'output_tpm': None},
+        'gpt-4o-mini': {'rpm': 500, 'input_tpm': 200_000, 'output_tpm': None},
+    },
+    # Azure Document Intelligence S0 tier allows 15 analyze requests per second
+    'azure': {
+        'default': {'rpm': 900, 'input_tpm': None, 'output_tpm': None},
+    },
+    'mistral': {
+        'default': {'rpm': 60, 'input_tpm': None, 'output_tpm': None},
+    },
+}
+
+# Rough image token estimates used before the real usage is known:
+# Claude resizes images to ~1.15 megapixels (at most ~1600 tokens), GPT high detail uses at most 6 tiles (~1105 tokens)
+IMAGE_TOKEN_CAP = {
+    'claude': 1600,
+    'gpt': 1105,
+}
+BYTES_PER_IMAGE_TOKEN = 500
+CHARS_PER_TEXT_TOKEN = 4
+
+class TokenBucket:
+    '''
+    A token bucket that refills continuously up to its per-minute capacity.
+    The balance may go negative when a request turns out to use more than was reserved,
+    which delays the following requests until the debt has been refilled.
+    '''
+    def __init__(self, capacity_per_minute: int):
+        self.capacity = capacity_per_minute
+        self.rate = capacity_per_minute / 60
+        self.tokens = capacity_per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        # A single request larger than the whole bucket only waits for a full bucket
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self.tokens -= amount
+
+class RateLimiter:
+    '''
+    Paces requests to one provider and model so that the requests, input tokens and
+    output tokens sent per minute stay within the configured quotas.
+    It is thread-safe, so all concurrent workers of a run share a single instance.
+    '''
+    def __init__(self, rpm: int | None = None, input_tpm: int | None = None, output_tpm: int | None = None):
+        self.buckets = {
+            name: TokenBucket(limit)
+            for name, limit in (('requests', rpm), ('input_tokens', input_tpm), ('output_tokens', output_tpm))
+            if limit
+        }
+        self.paused_until = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self, input_tokens: int = 0, output_tokens: int = 0) -> dict:
+        '''
+        Block until the request and its estimated tokens fit in the quotas, then reserve them.
+        Args:
+            input_tokens (int): Estimated input tokens of the request.
+            output_tokens (int): Estimated output tokens of the request (usually max_tokens).
+        Returns:
+            dict: The reservation, to be passed to settle() once the real usage is known.
+        '''
+        with self.condition:
+            while True:
+                reservation, wait = self.try_acquire(input_tokens, output_tokens)
+                if reservation is not None:
+                    return reservation
+                self.condition.wait(timeout=wait)
+
+    def try_acquire(self, input_tokens: int = 0, output_tokens: int = 0) -> tuple[dict | None, float]:
+        '''
+        Reserve the request and its estimated tokens if they fit in the quotas now, without blocking.
+        Returns:
+            tuple: (the reservation, 0) or (None, seconds to wait before trying again).
+        '''
+        reservation = {'requests': 1, 'input_tokens': input_tokens, 'output_tokens': output_tokens}
+        with self.condition:
+            now = time.monotonic()
+            for bucket in self.buckets.values():
+                bucket.refill(now)
+            wait = max(
+                [self.paused_until - now] + [bucket.wait_time(reservation[name]) for name, bucket in self.buckets.items()]
+            )
+            if wait > 0:
+                return None, wait
+            for name, bucket in self.buckets.items():
+                bucket.consume(reservation[name])
+            return reservation, 0.0
+
+    def settle(self, reservation: dict, input_tokens: int | None = None, output_tokens: int | None = None):
+        '''
+        Correct a reservation with the usage reported by the API, refunding over-estimates
+        and charging under-estimates. None keeps the estimate for that quota.
+        '''
+        actual = {'input_tokens': input_tokens, 'output_tokens': output_tokens}
+        with self.condition:
+            for name, value in actual.items():
+                if value is None or name not in self.buckets:
+                    continue
+                self.buckets[name].consume(value - reservation[name])
+                reservation[name] = value
+            self.condition.notify_all()
+
+    def pause(self, seconds: float):
+        # Stop all dispatch for a while, e.g. after the provider answered with HTTP 429
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(provider: str, model: str) -> RateLimiter:
+    '''
+    Return the rate limiter shared by every request to the given provider and model.
+    Args:
+        provider (str): Provider key in RATE_LIMITS (e.g., 'claude', 'gpt', 'azure', 'mistral').
+        model (str): The model name.
+    Returns:
+        RateLimiter: The shared rate limiter.
+    '''
+    with _rate_limiters_lock:
+        if (provider, model) not in _rate_limiters:
+            provider_limits = RATE_LIMITS.get(provider, {})
+            limits = provider_limits.get(model, provider_limits.get('default', {}))
+            _rate_limiters[(provider, model)] = RateLimiter(**limits)
+        return _rate_limiters[(provider, model)]
+
+def estimate_request_tokens(provider: str, messages: list[dict], system_prompt: str = '') -> int:
+    '''
+    Estimate the input tokens of a chat request from the byte size of its images and the length of its text.
+    Args:
+        provider (str): 'claude' or 'gpt', selects the image token cap.
+        messages (list[dict]): The messages of the request, in the provider's format.
+        system_prompt (str): The system prompt, if passed separately from the messages.
+    Returns:
+        int: The estimated number of input tokens.
+    '''
+    image_cap = IMAGE_TOKEN_CAP.get(provider, max(IMAGE_TOKEN_CAP.values()))
+    text_chars = len(system_prompt or '')
+    image_tokens = 0
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, str):
+            text_chars += len(content)
+            continue
+        for block in content:
+            if block.get("type") == "text":
+                text_chars += len(block.get("text", ""))
+                continue
+            # Base64 data of a Claude image block or a GPT data URL, 4 base64 characters encode 3 bytes
+            if block.get("type") == "image":
+                encoded = block.get("source", {}).get("data", "")
+            elif block.get("type") == "image_url":
+                encoded = block.get("image_url", {}).get("url", "").partition("base64,")[2]
+            else:
+                continue
+            image_tokens += min(image_cap, (len(encoded) * 3 // 4) // BYTES_PER_IMAGE_TOKEN)
+    return image_tokens + text_chars // CHARS_PER_TEXT_TOKEN
+
+def is_rate_limit_error(error: Exception) -> bool:
+    # Anthropic, OpenAI, Azure and Mistral SDK errors all expose the HTTP status code
+    return getattr(error, 'status_code', None) == 429
+
+def get_retry_after(error: Exception, default: float) -> float:
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after', default))
+    except (TypeError, ValueError):
+        return default
+
+def rate_limited_call(provider: str, model: str, request, estimated_input_tokens: int = 0, estimated_output_tokens: int = 0, read_usage=None, max_retries: int = 5, stats: dict | None = None):
+    '''
+    Send a request once the provider's quotas allow it, retrying after HTTP 429 responses.
+    Args:
+        provider (str): Provider key in RATE_LIMITS.
+        model (str): The model name.
+        request (callable): Sends the request and returns the response. It is called again on retries.
+        estimated_input_tokens (int): Input tokens reserved before the request is sent.
+        estimated_output_tokens (int): Output tokens reserved before the request is sent (usually max_tokens).
+        read_usage (callable): Optional, returns (input_tokens, output_tokens) from the response to correct the reservation.
+        max_retries (int): Number of retries after a 429 before the error is raised.
+        stats (dict | None): Optional, receives 'queue_time' (seconds waiting for the quotas), 'retries'
+            and 'request_latency' (seconds of the successful attempt).
+    Returns:
+        The response returned by the request.
+    '''
+    limiter = get_rate_limiter(provider, model)
+    stats = stats if stats is not None else {}
+    stats['retries'] = 0
+    for attempt in range(max_retries + 1):
+        queue_start = time.perf_counter()
+        reservation = limiter.acquire(estimated_input_tokens, estimated_output_tokens)
+        request_start = time.perf_counter()
+        stats['queue_time'] = stats.get('queue_time', 0) + request_start - queue_start
+        try:
+            response = request()
+        except BaseException as error:
+            # A failed request (rejected, timed out, cancelled...) is not charged for tokens, so they go back to the quotas
+            limiter.settle(reservation, 0, 0)
+            if not is_rate_limit_error(error) or attempt == max_retries:
+                raise
+            stats['retries'] += 1
+            # Everyone waits for the provider's retry-after
+            delay = get_retry_after(error, default=2 ** attempt)
+            print(f"\033[93mWARNING: {provider} rate limit reached, retrying in {delay:.1f}s...\033[0m")
+            limiter.pause(delay)
+            continue
+        stats['request_latency'] = time.perf_counter() - request_start
+        if read_usage:
+            limiter.settle(reservation, *read_usage(response))
+        return response
+
+async def rate_limited_call_async(provider: str, model: str, request, estimated_input_tokens: int = 0, estimated_output_tokens: int = 0, read_usage=None, max_retries: int = 5, stats: dict | None = None):
+    '''
+    Asyncio version of rate_limited_call: waiting for the quotas suspends the coroutine instead of blocking the thread.
+    It shares the rate limiters of rate_limited_call, so threaded and asyncio runners stay within the same quotas.
+    Args:
+        request (callable): Returns a new awaitable sending the request. It is called again on retries.
+        Other arguments as in rate_limited_call.
+    Returns:
+        The response returned by the request.
+    '''
+    limiter = get_rate_limiter(provider, model)
+    stats = stats if stats is not None else {}
+    stats['retries'] = 0
+    for attempt in range(max_retries + 1):
+        queue_start = time.perf_counter()
+        while True:
+            reservation, wait = limiter.try_acquire(estimated_input_tokens, estimated_output_tokens)
+            if reservation is not None:
+                break
+            await asyncio.sleep(wait)
+        request_start = time.perf_counter()
+        stats['queue_time'] = stats.get('queue_time', 0) + request_start - queue_start
+        try:
+            response = await request()
+        except BaseException as error:
+            # A failed request (rejected, timed out, cancelled...) is not charged for tokens, so they go back to the quotas
+            limiter.settle(reservation, 0, 0)
+            if not is_rate_limit_error(error) or attempt == max_retries:
+                raise
+            stats['retries'] += 1
+            # Everyone waits for the provider's retry-after
+            delay = get_retry_after(error, default=2 ** attempt)
+            print(f"\033[93mWARNING: {provider} rate limit reached, retrying in {delay:.1f}s...\033[0m")
+            limiter.pause(delay)
+            continue
+        stats['request_latency'] = time.perf_counter() - request_start
+        if read_usage:
+            limiter.settle(reservation, *read_usage(response))
+        return response
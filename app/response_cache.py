@@ -0,0 +1,81 @@
+# Import external modules
+import hashlib, json, os, threading
+from pathlib import Path
+
+# Default location and size bound of the on-disk response cache
+RESPONSE_CACHE_DIR = Path(__file__).resolve().parent.parent / 'results' / '.response_cache'
+RESPONSE_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 512 MB
+
+class ResponseCache:
+    '''
+    Persistent cache of API responses, stored as one JSON file per request.
+    Entries are addressed by a hash of the image content and the full request payload,
+    so a cached response is only reused for an identical request.
+    When the cache grows over max_bytes, the least recently used entries are removed
+    (a cache hit refreshes the modification time of its file).
+    '''
+    def __init__(self, cache_dir: Path = RESPONSE_CACHE_DIR, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.size = sum(path.stat().st_size for path in self.cache_dir.glob('*/*.json'))
+
+    @staticmethod
+    def make_key(provider: str, model: str, request_hash: str, image_hash: str) -> str:
+        '''
+        Build the cache key of a request.
+        Args:
+            provider (str): The provider the request is sent to (e.g., 'claude').
+            model (str): The model name.
+            request_hash (str): Hash of the request payload without the image (see run_manifest.hash_request).
+            image_hash (str): Hash of the image content (see run_manifest.hash_file).
+        Returns:
+            str: The cache key.
+        '''
+        return hashlib.sha256(f"{provider}|{model}|{request_hash}|{image_hash}".encode('utf-8')).hexdigest()
+
+    def entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> dict | None:
+        '''
+        Return the cached response of a request, or None if it is not cached.
+        '''
+        path = self.entry_path(key)
+        try:
+            value = json.loads(path.read_text(encoding='utf-8'))
+            # Mark the entry as recently used for the LRU eviction
+            os.utime(path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return value
+
+    def put(self, key: str, value: dict):
+        '''
+        Store the response of a request, evicting the least recently used entries if the cache is full.
+        '''
+        path = self.entry_path(key)
+        path.parent.mkdir(exist_ok=True)
+        data = json.dumps(value, ensure_ascii=False).encode('utf-8')
+        # Write to a temporary file first, so a concurrent reader never sees a half-written entry
+        tmp_path = path.with_suffix(f'.{threading.get_ident()}.tmp')
+        tmp_path.write_bytes(data)
+        with self.lock:
+            previous_size = path.stat().st_size if path.exists() else 0
+            os.replace(tmp_path, path)
+            self.size += len(data) - previous_size
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        # Remove the least recently used entries until the cache is back under its size bound
+        entries = sorted(
+            ((path.stat().st_mtime, path.stat().st_size, path) for path in self.cache_dir.glob('*/*.json')),
+            key=lambda entry: entry[0],
+        )
+        for _, size, path in entries:
+            if self.size <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            self.size -= size
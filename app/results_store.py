@@ -0,0 +1,100 @@
+# Import external modules
+import sqlite3, threading, time
+from pathlib import Path
+
+RESULTS_STORE_PATH = Path(__file__).resolve().parent.parent / 'results' / 'results.sqlite'
+
+# Token counts stored with every result (see utils.read_claude_usage / read_gpt_usage)
+TOKEN_COLUMNS = ('input_tokens', 'output_tokens', 'cache_write_tokens', 'cache_read_tokens')
+
+RESULTS_SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    service TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    image TEXT NOT NULL,
+    result_name TEXT NOT NULL,
+    text TEXT NOT NULL,
+    {', '.join(f'{column} INTEGER' for column in TOKEN_COLUMNS)},
+    latency REAL,
+    cached INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_by_service ON results (service, result_name, id);
+'''
+
+class ResultsStore:
+    '''
+    Append-only SQLite table of every OCR result, written by the runners next to the result text files.
+    A row holds the service, model, prompt hash, image, recognised text, token counts and request latency,
+    so the evaluation reads all results of all services with one indexed query instead of opening every text file.
+    Rerunning an image appends a new row, the latest row of every result file is the current one.
+    '''
+    def __init__(self, store_path: Path = RESULTS_STORE_PATH):
+        self.store_path = Path(store_path)
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def connect(self) -> sqlite3.Connection:
+        # One connection shared by the worker threads of a run, every write goes through the lock
+        if self.connection is None:
+            self.store_path.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(self.store_path, check_same_thread=False)
+            # Write-ahead logging lets the evaluation read while a runner is writing
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.executescript(RESULTS_SCHEMA)
+        return self.connection
+
+    def append(self, service_name: str, model: str, prompt_hash: str, image: str, result_name: str, text: str, usage: dict | None = None, latency: float | None = None, cached: bool = False):
+        '''
+        Record the result of one image.
+        Args:
+            service_name (str): The OCR service (results/<service>).
+            model (str): The model name.
+            prompt_hash (str): Hash of the request without the image (see run_manifest.hash_request).
+            image (str): File name of the image.
+            result_name (str): File name of the saved result text file.
+            text (str): The saved result text.
+            usage (dict | None): Token counts of the response (missing counts are stored as NULL).
+            latency (float | None): Request latency in seconds.
+            cached (bool): Whether the response came from the response cache.
+        '''
+        usage = usage or {}
+        tokens = [usage.get(column) if isinstance(usage.get(column), int) else None for column in TOKEN_COLUMNS]
+        row = (time.strftime('%Y-%m-%d %H:%M:%S'), str(service_name), model, prompt_hash, image, result_name, text, *tokens, latency, int(bool(cached)))
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute(
+                    f"INSERT INTO results (created_at, service, model, prompt_hash, image, result_name, text, {', '.join(TOKEN_COLUMNS)}, latency, cached) "
+                    f"VALUES ({', '.join(['?'] * len(row))})",
+                    row,
+                )
+
+    def latest_results(self, services: list) -> dict[str, dict[str, str]]:
+        '''
+        Return the current text of every result file of the given services.
+        Args:
+            services (list): The services to read.
+        Returns:
+            dict: {service: {result file name: text}}, services without any row are left out.
+        '''
+        if not self.store_path.exists():
+            return {}
+        services = [str(service) for service in services]
+        with self.lock:
+            rows = self.connect().execute(
+                "SELECT service, result_name, text FROM results WHERE id IN ("
+                f"SELECT MAX(id) FROM results WHERE service IN ({', '.join(['?'] * len(services))}) GROUP BY service, result_name)",
+                services,
+            ).fetchall()
+        results = {}
+        for service_name, result_name, text in rows:
+            results.setdefault(service_name, {})[result_name] = text
+        return results
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
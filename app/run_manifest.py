@@ -0,0 +1,127 @@
+# Import external modules
+import asyncio, hashlib, json, os, threading, time
+from pathlib import Path
+
+def hash_file(file_path) -> str:
+    '''
+    Compute the SHA-256 hash of a file's content.
+    Args:
+        file_path (str | Path): Path to the file.
+    Returns:
+        str: The hex digest.
+    '''
+    return hash_bytes(Path(file_path).read_bytes())
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def hash_request(payload) -> str:
+    '''
+    Compute a stable SHA-256 hash of a request payload (prompt, messages, parameters, ...).
+    Args:
+        payload: Any JSON-serialisable object, dictionary keys are sorted so their order does not matter.
+    Returns:
+        str: The hex digest.
+    '''
+    serialised = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serialised.encode('utf-8')).hexdigest()
+
+class RunManifest:
+    '''
+    Records the outcome of every image of a run in results/<service>/run_manifest.json,
+    so that a rerun only dispatches the images that are missing or failed.
+    An image is identified by the service, model, prompt hash and image content hash,
+    so changing any of them (or the image itself) makes the image run again.
+    The result file of an image is shared by all prompts, so every entry also holds the hash of the text it wrote:
+    once another run overwrites the file, the entry no longer counts as completed.
+    '''
+    def __init__(self, manifest_path: Path):
+        self.manifest_path = Path(manifest_path)
+        self.lock = threading.Lock()
+        self.entries = {}
+        if self.manifest_path.exists():
+            try:
+                self.entries = json.loads(self.manifest_path.read_text(encoding='utf-8'))
+            except json.JSONDecodeError:
+                print(f"\033[93mWARNING: {self.manifest_path} is corrupted, all images will be processed again.\033[0m")
+
+    @staticmethod
+    def make_key(service_name: str, model: str, prompt_hash: str, image_hash: str) -> str:
+        return f"{service_name}|{model}|{prompt_hash}|{image_hash}"
+
+    def is_completed(self, key: str) -> bool:
+        # A completed image only counts if its result file still holds the text written by that run
+        entry = self.entries.get(key)
+        if not entry or entry.get('status') != 'completed':
+            return False
+        result_path = self.manifest_path.parent / entry['result_file']
+        return result_path.exists() and hash_file(result_path) == entry.get('result_hash')
+
+    def pending(self, image_files: list, image_keys: dict) -> list:
+        '''
+        Filter out the images completed by a previous run.
+        Args:
+            image_files (list): Paths of the images to process.
+            image_keys (dict): Manifest key of every image path.
+        Returns:
+            list: The images that still need to be processed, in their original order.
+        '''
+        pending_files = []
+        for image_path in image_files:
+            if self.is_completed(image_keys[image_path]):
+                print(f"\nSkipping {Path(image_path).name}, already completed in a previous run.")
+                continue
+            pending_files.append(image_path)
+        return pending_files
+
+    def run_image(self, image_path, key: str, analyse):
+        '''
+        Analyse one image and record whether it completed or failed.
+        A failure is printed instead of raised, so the other images of the run still finish.
+        Args:
+            image_path (str): Path to the image.
+            key (str): Manifest key of the image.
+            analyse (callable): Analyses the image and returns a record containing its 'result_file'.
+        Returns:
+            dict | None: The record returned by analyse, or None if it failed.
+        '''
+        image_name = Path(image_path).name
+        try:
+            record = analyse(image_path)
+        except Exception as error:
+            print(f"\n\033[91mERROR: Failed to analyse {image_name}: {error}\033[0m")
+            self.update(key, {'image': image_name, 'status': 'failed', 'error': str(error)})
+            return None
+        self.record_completed(key, image_name, record)
+        return record
+
+    async def run_image_async(self, image_path, key: str, analyse):
+        '''
+        Asyncio version of run_image, analyse returns an awaitable.
+        The manifest is rewritten in a worker thread, so the other tasks keep running meanwhile.
+        '''
+        image_name = Path(image_path).name
+        try:
+            record = await analyse(image_path)
+        except Exception as error:
+            print(f"\n\033[91mERROR: Failed to analyse {image_name}: {error}\033[0m")
+            await asyncio.to_thread(self.update, key, {'image': image_name, 'status': 'failed', 'error': str(error)})
+            return None
+        await asyncio.to_thread(self.record_completed, key, image_name, record)
+        return record
+
+    def record_completed(self, key: str, image_name: str, record: dict):
+        result_file = Path(record['result_file'])
+        self.update(key, {'image': image_name, 'status': 'completed', 'result_file': result_file.name, 'result_hash': hash_file(result_file)})
+
+    def update(self, key: str, entry: dict):
+        entry['updated'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        with self.lock:
+            self.entries[key] = entry
+            # Write to a temporary file first, so a crash never leaves a half-written manifest
+            tmp_path = self.manifest_path.with_suffix('.tmp')
+            tmp_path.write_text(json.dumps(self.entries, indent=2), encoding='utf-8')
+            os.replace(tmp_path, self.manifest_path)
+
+    def failed_images(self, image_keys: dict) -> list:
+        return [Path(image_path).name for image_path, key in image_keys.items() if self.entries.get(key, {}).get('status') == 'failed']
@@ -0,0 +1,103 @@
+# Import external modules
+import numpy as np
+
+# Resamples of the bootstrap confidence intervals and of the permutation tests
+BOOTSTRAP_RESAMPLES = 10_000
+PERMUTATION_RESAMPLES = 10_000
+
+# Resamples drawn at once, so memory stays bounded by (RESAMPLE_CHUNK_SIZE x exams) whatever the number of resamples
+RESAMPLE_CHUNK_SIZE = 1000
+
+CONFIDENCE_LEVEL = 0.95
+
+# Below this p-value, the difference between two services is reported as significant
+SIGNIFICANCE_LEVEL = 0.05
+
+# Fixed seed, so the intervals and p-values of results.md only change when the scores change
+SIGNIFICANCE_SEED = 0
+
+def chunk_sizes(resamples: int) -> list[int]:
+    # e.g., 2500 resamples -> [1000, 1000, 500]
+    return [min(RESAMPLE_CHUNK_SIZE, resamples - start) for start in range(0, resamples, RESAMPLE_CHUNK_SIZE)]
+
+def bootstrap_confidence_interval(values, resamples: int = BOOTSTRAP_RESAMPLES, confidence: float = CONFIDENCE_LEVEL, seed: int = SIGNIFICANCE_SEED) -> tuple[float, float] | None:
+    '''
+    Percentile bootstrap confidence interval of the mean of per-exam scores.
+    The resamples are drawn as (RESAMPLE_CHUNK_SIZE x exams) index arrays, each averaged in a single operation.
+    Args:
+        values (array-like): The per-exam scores (NaN values are ignored).
+        resamples (int): Number of bootstrap resamples.
+        confidence (float): Confidence level of the interval.
+        seed (int): Seed of the random generator.
+    Returns:
+        tuple[float, float] | None: (lower bound, upper bound), or None without any score.
+    '''
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return None
+    rng = np.random.default_rng(seed)
+    means = np.concatenate([
+        values[rng.integers(0, values.size, size=(rows, values.size))].mean(axis=1)
+        for rows in chunk_sizes(resamples)
+    ])
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(means, [alpha, 1 - alpha])
+    return float(low), float(high)
+
+def paired_permutation_test(values_a, values_b, resamples: int = PERMUTATION_RESAMPLES, seed: int = SIGNIFICANCE_SEED) -> float | None:
+    '''
+    Two-sided paired permutation test of the mean difference between two services, over the exams scored by both.
+    Under the null hypothesis the sign of every per-exam difference is random, so the signs are flipped at random
+    (in (RESAMPLE_CHUNK_SIZE x exams) arrays) and the p-value is the share of flipped means at least as extreme as the observed one.
+    With few exams, all sign combinations are enumerated and the p-value is exact.
+    Args:
+        values_a (array-like), values_b (array-like): Per-exam scores of the two services, aligned by exam (NaN where missing).
+        resamples (int): Number of random sign flips.
+        seed (int): Seed of the random generator.
+    Returns:
+        float | None: The p-value, or None without any exam scored by both services.
+    '''
+    differences = np.asarray(values_a, dtype=float) - np.asarray(values_b, dtype=float)
+    differences = differences[~np.isnan(differences)]
+    n = differences.size
+    if n == 0:
+        return None
+    observed = abs(differences.mean())
+    if 2 ** n <= resamples:
+        # Every combination of signs, one per row
+        signs = 1 - 2 * ((np.arange(2 ** n)[:, None] >> np.arange(n)) & 1)
+        extreme = np.abs((signs * differences).mean(axis=1)) >= observed - 1e-12
+        return float(extreme.mean())
+    rng = np.random.default_rng(seed)
+    extreme = 0
+    for rows in chunk_sizes(resamples):
+        signs = 1 - 2 * rng.integers(0, 2, size=(rows, n), dtype=np.int8)
+        extreme += int((np.abs((signs * differences).mean(axis=1)) >= observed - 1e-12).sum())
+    # The observed signs count as one of the permutations, so the p-value is never 0
+    return float((extreme + 1) / (resamples + 1))
+
+def compare_with_best(nld_matrix: np.ndarray, averages: np.ndarray) -> tuple[int | None, list[float | None]]:
+    '''
+    Test every service against the service with the highest average NLD.
+    Args:
+        nld_matrix (np.ndarray): The (services x exams) NLD matrix, NaN where a service has no result.
+        averages (np.ndarray): The average NLD of every service.
+    Returns:
+        tuple: (row of the best service or None without any score, p-value of every service, None for the best one).
+    '''
+    scored = ~np.isnan(nld_matrix).all(axis=1)
+    if not scored.any():
+        return None, [None] * len(nld_matrix)
+    best = int(np.argmax(np.where(scored, averages, -np.inf)))
+    p_values = [None if i == best else paired_permutation_test(nld_matrix[i], nld_matrix[best]) for i in range(len(nld_matrix))]
+    return best, p_values
+
+def format_confidence_interval(interval: tuple[float, float] | None, digits: int = 3) -> str:
+    return "-" if interval is None else f"[{interval[0]:.{digits}f}, {interval[1]:.{digits}f}]"
+
+def format_p_value(p_value: float | None) -> str:
+    # Significant differences are marked with an asterisk
+    if p_value is None:
+        return "-"
+    return f"{p_value:.4f}" + ("*" if p_value < SIGNIFICANCE_LEVEL else "")
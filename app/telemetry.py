@@ -0,0 +1,190 @@
+# Import external modules
+import asyncio, json, sys, threading, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+import numpy as np
+
+RESULTS_DIR = Path(__file__).resolve().parent.parent / 'results'
+
+# Percentiles reported in the summaries
+TELEMETRY_PERCENTILES = (50, 95, 99)
+
+# Durations recorded for every image, in seconds
+TIMING_FIELDS = (
+    'image_load_time',  # Reading the image (from disk or the in-memory pipeline)
+    'encode_time',  # Base64-encoding the image into the request
+    'queue_time',  # Waiting for the rate limiter, including the pauses after HTTP 429 responses
+    'request_latency',  # From sending the request to receiving the full response (whole job for batches)
+    'time_to_first_token',  # From sending the request to the first streamed token (streaming runs only)
+    'time_to_answer',  # From sending the request to the closing </answer> tag, where the generation stops (streaming runs only)
+    'total_time',  # Everything above, plus saving the results
+)
+
+# Token counts recorded for every image
+TOKEN_FIELDS = ('input_tokens', 'output_tokens', 'cache_write_tokens', 'cache_read_tokens')
+
+class RunTelemetry:
+    '''
+    Per-image telemetry of a runner, appended to results/<service>/telemetry.jsonl (one JSON object per image).
+    Every image is tracked in the thread or asyncio task analysing it, so the stages of concurrent images are measured separately.
+    At the end of a run, summarise() prints the p50/p95/p99 of every duration and appends them to
+    results/<service>/telemetry_summary.md.
+    '''
+    def __init__(self, results_dir: Path, service_name: str, model: str, mode: str = 'sync'):
+        self.path = Path(results_dir) / 'telemetry.jsonl'
+        self.summary_path = Path(results_dir) / 'telemetry_summary.md'
+        self.service_name = str(service_name)
+        self.model = model
+        self.mode = mode
+        self.run_id = time.strftime('%Y%m%d-%H%M%S')
+        self.records = []
+        self.lock = threading.Lock()
+        # A context variable is local to every thread and to every asyncio task
+        self.record_var = ContextVar(f'telemetry_record_{id(self)}', default=None)
+
+    def current(self) -> dict | None:
+        # The record of the image analysed by the calling thread or task, passed to rate_limited_call as its stats
+        return self.record_var.get()
+
+    @contextmanager
+    def measure(self, field: str):
+        '''
+        Add the duration of the block to a timing field of the current image (no-op outside track()).
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = self.current()
+            if record is not None:
+                record[field] = record.get(field, 0) + time.perf_counter() - start
+
+    def track(self, image_path, analyse, **fields):
+        '''
+        Analyse one image and record its telemetry.
+        Args:
+            image_path (str): Path to the image.
+            analyse (callable): Analyses the image and returns its usage record, or None if it failed.
+            **fields: Values known before the analysis (e.g., the encode time of a batch request).
+        Returns:
+            The value returned by analyse.
+        '''
+        record = {'image': Path(image_path).name, **{field: value for field, value in fields.items() if value is not None}}
+        token = self.record_var.set(record)
+        start = time.perf_counter()
+        try:
+            result = analyse(image_path)
+        finally:
+            self.record_var.reset(token)
+        self.finish(record, result, time.perf_counter() - start + (fields.get('encode_time') or 0))
+        return result
+
+    async def track_async(self, image_path, analyse, **fields):
+        '''
+        Asyncio version of track, analyse returns an awaitable. The record is appended to the file in a worker thread.
+        '''
+        record = {'image': Path(image_path).name, **{field: value for field, value in fields.items() if value is not None}}
+        token = self.record_var.set(record)
+        start = time.perf_counter()
+        try:
+            result = await analyse(image_path)
+        finally:
+            self.record_var.reset(token)
+        await asyncio.to_thread(self.finish, record, result, time.perf_counter() - start + (fields.get('encode_time') or 0))
+        return result
+
+    def finish(self, record: dict, result, total_time: float):
+        # Complete the record of an image with its outcome and token counts, and write it
+        record['total_time'] = total_time
+        record['status'] = 'completed' if result is not None else 'failed'
+        if isinstance(result, dict):
+            record['cached'] = bool(result.get('cached'))
+            for field in TOKEN_FIELDS:
+                if isinstance(result.get(field), int):
+                    record[field] = result[field]
+        self.write(record)
+
+    def write(self, record: dict):
+        entry = {
+            'run_id': self.run_id,
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'service': self.service_name,
+            'model': self.model,
+            'mode': self.mode,
+            **{field: round(value, 4) if isinstance(value, float) else value for field, value in record.items()},
+        }
+        with self.lock:
+            self.records.append(entry)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    def summarise(self):
+        '''
+        Print the percentiles of this run and append them to the telemetry summary file.
+        '''
+        if not self.records:
+            return
+        table = format_summary_table(self.records)
+        print(f"\nTelemetry of run {self.run_id} ({self.service_name}, {self.model}):\n{table}")
+        with open(self.summary_path, 'a', encoding='utf-8') as f:
+            f.write(f"\n## Run {self.run_id}: {self.model} ({self.mode})\n\n{table}\n")
+
+def summarise_records(records: list[dict]) -> dict:
+    '''
+    Compute the percentiles of every timing field over the requests that reached the provider.
+    Args:
+        records (list[dict]): Telemetry records.
+    Returns:
+        dict: Percentile values by timing field (fields without values are left out),
+            plus the image, failure, retry and token counts.
+    '''
+    # Responses served from the response cache never reached the provider, they would hide its latency
+    sent = [record for record in records if not record.get('cached')]
+    summary = {'timings': {}}
+    for field in TIMING_FIELDS:
+        values = [record[field] for record in sent if isinstance(record.get(field), (int, float))]
+        if values:
+            summary['timings'][field] = np.percentile(values, TELEMETRY_PERCENTILES).tolist()
+    summary['images'] = len(records)
+    summary['failed'] = sum(record.get('status') == 'failed' for record in records)
+    summary['cached'] = len(records) - len(sent)
+    summary['retries'] = sum(record.get('retries', 0) for record in records)
+    summary['tokens'] = {field: sum(record.get(field, 0) for record in sent) for field in TOKEN_FIELDS}
+    return summary
+
+def format_summary_table(records: list[dict]) -> str:
+    summary = summarise_records(records)
+    lines = [
+        f"| Stage | {' | '.join(f'p{p} (s)' for p in TELEMETRY_PERCENTILES)} |",
+        f"|{'|'.join([':---:'] * (len(TELEMETRY_PERCENTILES) + 1))}|",
+    ]
+    for field, values in summary['timings'].items():
+        lines.append(f"| {field} | {' | '.join(f'{value:.3f}' for value in values)} |")
+    tokens = ', '.join(f"{field} {total}" for field, total in summary['tokens'].items() if total)
+    lines.append(
+        f"\n{summary['images']} image(s), {summary['failed']} failed, {summary['cached']} from the response cache, "
+        f"{summary['retries']} retried request(s)" + (f". Tokens: {tokens}" if tokens else "")
+    )
+    return '\n'.join(lines)
+
+def summarise_all_runs(results_dir: Path = RESULTS_DIR):
+    '''
+    Print the percentiles of every service/model over all recorded runs, to compare runs across days.
+    '''
+    groups = {}
+    for telemetry_path in sorted(Path(results_dir).glob('*/telemetry.jsonl')):
+        with open(telemetry_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    groups.setdefault((record['service'], record['model'], record.get('mode', 'sync')), []).append(record)
+    if not groups:
+        print(f"No telemetry found in {results_dir}.")
+        return
+    for (service_name, model, mode), records in groups.items():
+        runs = len({record['run_id'] for record in records})
+        print(f"\n{service_name} / {model} ({mode}, {runs} run(s)):\n{format_summary_table(records)}")
+
+if __name__ == "__main__":
+    summarise_all_runs(Path(sys.argv[1]) if len(sys.argv) > 1 else RESULTS_DIR)
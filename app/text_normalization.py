@@ -0,0 +1,91 @@
+# Import external modules
+import hashlib, re, threading
+from pathlib import Path
+
+# Java tokens: identifiers, numbers, string/char literals, multi-character operators, then any other single symbol
+JAVA_TOKEN_PATTERN = re.compile(r'''
+    [A-Za-z_$][\w$]*                        # identifiers and keywords
+  | \d[\w.]*                                # numeric literals (e.g., 10, 3.14, 0x1F, 10L)
+  | "(?:\\.|[^"\\\n])*"?                    # string literals (an unclosed quote runs to the end of the line)
+  | '(?:\\.|[^'\\\n])*'?                    # char literals
+  | >>>=|<<=|>>=|>>>|\+\+|--|&&|\|\||==|!=|<=|>=|\+=|-=|\*=|/=|%=|&=|\|=|\^=|->|::|<<|>>
+  | \S                                      # any other symbol
+''', re.VERBOSE)
+
+def normalize_whitespace(text: str) -> str:
+    '''
+    Remove indentation, line breaks and redundant spaces, keeping a single space between words.
+    '''
+    # str.split() without arguments splits on every Unicode whitespace run and drops empty parts,
+    # which strips, collapses and removes empty lines in a single pass
+    return ' '.join(text.split())
+
+def java_tokens(text: str) -> list[str]:
+    # The Java tokens of a text, in order (whitespace is dropped)
+    return JAVA_TOKEN_PATTERN.findall(text)
+
+def normalize_java_tokens(text: str) -> str:
+    '''
+    Split the text into Java tokens separated by a single space, so spacing around operators
+    and brackets (e.g., "a+b" and "a + b") does not count as an error.
+    '''
+    return ' '.join(java_tokens(text))
+
+def normalize_casefold(text: str) -> str:
+    '''
+    Whitespace normalisation, ignoring the letter case.
+    '''
+    return normalize_whitespace(text).casefold()
+
+# Normalisation profiles by name, new profiles can be added with register_profile
+NORMALIZATION_PROFILES = {
+    'whitespace': normalize_whitespace,
+    'java_tokens': normalize_java_tokens,
+    'casefold': normalize_casefold,
+}
+
+DEFAULT_PROFILE = 'whitespace'
+
+# Normalised texts by (content hash, profile), so a file is only normalised once per profile
+normalized_files = {}
+normalized_files_lock = threading.Lock()
+
+def register_profile(name: str, normalize):
+    '''
+    Add a normalisation profile.
+    Args:
+        name (str): Name of the profile.
+        normalize (callable): Takes the raw text and returns the normalised text.
+    '''
+    NORMALIZATION_PROFILES[name] = normalize
+
+def normalize_text(text: str, profile: str = DEFAULT_PROFILE) -> str:
+    '''
+    Normalise a text with one of the NORMALIZATION_PROFILES.
+    Args:
+        text (str): The raw text.
+        profile (str): Name of the profile.
+    Returns:
+        str: The normalised text.
+    '''
+    if profile not in NORMALIZATION_PROFILES:
+        raise ValueError(f"Unknown normalisation profile: {profile}. Available profiles: {', '.join(NORMALIZATION_PROFILES)}")
+    return NORMALIZATION_PROFILES[profile](text)
+
+def normalize_file(file_path, profile: str = DEFAULT_PROFILE) -> str:
+    '''
+    Read and normalise a text file, memoised by the hash of its content.
+    Args:
+        file_path (str | Path): Path to the UTF-8 text file.
+        profile (str): Name of the profile.
+    Returns:
+        str: The normalised text.
+    '''
+    data = Path(file_path).read_bytes()
+    key = (hashlib.sha256(data).hexdigest(), profile)
+    normalized = normalized_files.get(key)
+    if normalized is None:
+        normalized = normalize_text(data.decode('utf-8'), profile)
+        with normalized_files_lock:
+            normalized_files[key] = normalized
+    return normalized
@@ -1,4 +1,4 @@
-import base64, os
+import base64, copy, os, time
 from enum import StrEnum, auto
 from pathlib import Path
 
@@ -6,6 +6,15 @@ from pathlib import Path
 from anthropic import Anthropic
 from openai import OpenAI
 
+# Import self-made modules
+from rate_limiter import estimate_request_tokens, rate_limited_call
+from run_manifest import RunManifest, hash_bytes, hash_request
+from response_cache import ResponseCache
+from batch_jobs import BATCH_PRICE_MULTIPLIER, make_custom_id, run_claude_batch, run_gpt_batch
+from image_pipeline import is_prepared_image, prepare_images, read_image_bytes
+from telemetry import RunTelemetry
+from results_store import ResultsStore
+
 # Enum for OCR service names
 # This allows for easy reference to different OCR services used in the application.
 # All used services are listed here, and they can be extended in the future if needed.
@@ -137,33 +146,51 @@ PROCESSED_OCR_IMAGES = (
     # 'exam_153_comp.png',
 )
 
+# Set to True to encode the raw scans of PROCESSED_OCR_IMAGES in memory and send them straight to the runners,
+# instead of reading them from images/compressed (the compressed images are still saved in the background)
+IN_MEMORY_PIPELINE = False
+
+# Closing tag of the answer of the chain-of-thought prompts. Streaming runs stop the generation at this tag,
+# the tokens the model would write after the answer are never generated.
+ANSWER_END_TAG = '</answer>'
+
 CLAUDE_SERVICE_PRICES = {
     "claude-opus-4-0": {
         "input_token": 15/10**6,  # $15 per million input tokens
-        "output_token": 75/10**6  # $75 per million output tokens
+        "output_token": 75/10**6,  # $75 per million output tokens
+        "cache_write_token": 18.75/10**6,  # $18.75 per million tokens written to the prompt cache
+        "cache_read_token": 1.5/10**6  # $1.50 per million tokens read from the prompt cache
     },
     "claude-sonnet-4-0": {
         "input_token": 3/10**6,  # $3 per million input tokens
-        "output_token": 15/10**6  # $15 per million output tokens
+        "output_token": 15/10**6,  # $15 per million output tokens
+        "cache_write_token": 3.75/10**6,  # $3.75 per million tokens written to the prompt cache
+        "cache_read_token": 0.3/10**6  # $0.30 per million tokens read from the prompt cache
     },
     "claude-3-5-sonnet-latest": {
         "input_token": 3/10**6,
-        "output_token": 15/10**6
+        "output_token": 15/10**6,
+        "cache_write_token": 3.75/10**6,
+        "cache_read_token": 0.3/10**6
     },
     "claude-3-7-sonnet-latest": {
         "input_token": 3/10**6,
-        "output_token": 15/10**6
+        "output_token": 15/10**6,
+        "cache_write_token": 3.75/10**6,
+        "cache_read_token": 0.3/10**6
     },
 }
 
 GPT_SERVICE_PRICES = {
     "gpt-4.1": {
         "input_token": 2/10**6,  # $2 per million input tokens
-        "output_token": 8/10**6  # $8 per million output tokens
+        "output_token": 8/10**6,  # $8 per million output tokens
+        "cache_read_token": 0.5/10**6  # $0.50 per million cached input tokens
     },
     "gpt-4o-mini": {
         "input_token": 1.1/10**6,  # $1.1 per million input tokens
-        "output_token": 4.4/10**6  # $4.4 per million output tokens
+        "output_token": 4.4/10**6,  # $4.4 per million output tokens
+        "cache_read_token": 0.275/10**6  # $0.275 per million cached input tokens
     },
 }
 
@@ -197,7 +224,11 @@ def define_directories(ocr_name):
 
     # Define the directories
     images_dir = Path(__file__).resolve().parent.parent / 'images/compressed'
-    image_files = glob.glob(str(images_dir / '*'))  # Get all files in the images directory
+    if IN_MEMORY_PIPELINE:
+        # Encode the raw scans in memory instead of reading images/compressed
+        image_files = prepare_images(PROCESSED_OCR_IMAGES)
+    else:
+        image_files = glob.glob(str(images_dir / '*'))  # Get all files in the images directory
     results_dir = Path(__file__).resolve().parent.parent / 'results' / ocr_name
     results_dir.mkdir(parents=True, exist_ok=True)  # Create results directory if it doesn't exist
 
@@ -206,6 +237,19 @@ def define_directories(ocr_name):
 
     return images_dir, image_files, results_dir
 
+def is_processed_image(file_path):
+    '''
+    Check if the given image is listed in PROCESSED_OCR_IMAGES.
+    Args:
+        file_path (str): Path to the image.
+    Returns:
+        bool: True if the image should be processed, False otherwise.
+    '''
+    # The in-memory pipeline may encode a listed PNG as JPEG to fit the byte budget, so its images match by stem
+    if is_prepared_image(file_path):
+        return Path(file_path).stem in {Path(name).stem for name in PROCESSED_OCR_IMAGES}
+    return Path(file_path).name in PROCESSED_OCR_IMAGES
+
 def is_a_file_an_image(file_path):
     '''
     Check if the given file path is an image.
@@ -240,12 +284,13 @@ def save_results_to_file(ocr_name, results, file_name, results_dir):
         file_name (str): The name of the file to save the results in (without extension).
         results_dir (Path): The directory where the results will be saved.
     Returns:
-        None
+        Path: The path of the saved result file.
     '''
     result_file_path = results_dir / f"{ocr_name}_{file_name}.txt"
     with open(result_file_path, 'w', encoding='utf-8') as f:
         f.write(results)
     print(f"Results saved to {result_file_path}")
+    return result_file_path
 
 def read_an_OCR_output_file(ocr_filename, ocr_filepath):
     ocr_output = None
@@ -261,11 +306,14 @@ def natural_sort_files(file_list):
     return sorted(file_list, key=lambda s: [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', Path(s).name)])
 
 def get_base64_encoded_image(image_path):
-    with open(image_path, "rb") as image_file:
-        binary_data = image_file.read()
-        base_64_encoded_data = base64.b64encode(binary_data)
-        base64_string = base_64_encoded_data.decode('utf-8')
-        return base64_string
+    # Images prepared by the in-memory pipeline are not read from disk
+    binary_data = read_image_bytes(image_path)
+    base_64_encoded_data = base64.b64encode(binary_data)
+    base64_string = base_64_encoded_data.decode('utf-8')
+    return base64_string
+
+def get_image_media_type(image_path) -> str:
+    return 'image/png' if Path(image_path).suffix.lower() == '.png' else 'image/jpeg'
 
 def extract_answer_from_tag(text: str) -> str:
     """
@@ -278,7 +326,300 @@ def extract_answer_from_tag(text: str) -> str:
         return match.group(1).strip()
     return text.strip()
 
-def claude_analyse_read(service_name: OcrService, model: str, max_tokens: int, temperature: int, message_list: list[dict], system_prompt: str, idx_to_insert_image: int):
+def stream_claude_message(client: Anthropic, stats: dict | None = None, **request) -> tuple[str, object]:
+    '''
+    Send a Claude request as a stream, stopped by the API at the first ANSWER_END_TAG.
+    Args:
+        client (Anthropic): The Claude client.
+        stats (dict | None): Filled with 'time_to_first_token' and, if the answer was closed, 'time_to_answer'.
+        **request: The arguments of client.messages.create.
+    Returns:
+        tuple: (the response text, ending with ANSWER_END_TAG if the answer was closed, the final message with its usage)
+    '''
+    stats = stats if stats is not None else {}
+    start = time.perf_counter()
+    text_parts = []
+    with client.messages.stream(stop_sequences=[ANSWER_END_TAG], **request) as stream:
+        for text in stream.text_stream:
+            if not text_parts:
+                stats['time_to_first_token'] = time.perf_counter() - start
+            text_parts.append(text)
+        message = stream.get_final_message()
+    # The stop sequence is not part of the text, it is put back so extract_answer_from_tag finds the answer
+    if message.stop_reason == 'stop_sequence':
+        stats['time_to_answer'] = time.perf_counter() - start
+        text_parts.append(ANSWER_END_TAG)
+    return ''.join(text_parts), message
+
+def stream_gpt_completion(client: OpenAI, stats: dict | None = None, **request) -> tuple[str, object]:
+    '''
+    Send an OpenAI chat completion as a stream, stopped by the API at the first ANSWER_END_TAG.
+    Args:
+        client (OpenAI): The OpenAI client.
+        stats (dict | None): Filled with 'time_to_first_token' and, if the answer was closed, 'time_to_answer'.
+        **request: The arguments of client.chat.completions.create.
+    Returns:
+        tuple: (the response text, ending with ANSWER_END_TAG if the answer was closed, the usage of the completion)
+    '''
+    stats = stats if stats is not None else {}
+    start = time.perf_counter()
+    text_parts, usage, finish_reason = [], None, None
+    # The usage comes in a last chunk without choices
+    stream = client.chat.completions.create(stream=True, stream_options={"include_usage": True}, stop=[ANSWER_END_TAG], **request)
+    for chunk in stream:
+        if chunk.usage:
+            usage = chunk.usage
+        if not chunk.choices:
+            continue
+        if chunk.choices[0].delta.content:
+            if not text_parts:
+                stats['time_to_first_token'] = time.perf_counter() - start
+            text_parts.append(chunk.choices[0].delta.content)
+        finish_reason = chunk.choices[0].finish_reason or finish_reason
+    text = ''.join(text_parts)
+    # 'stop' is also the finish reason of a response ending by itself, so the tag is only put back after an open <answer>
+    if finish_reason == 'stop' and text.rfind('<answer>') > text.rfind(ANSWER_END_TAG):
+        stats['time_to_answer'] = time.perf_counter() - start
+        text += ANSWER_END_TAG
+    return text, usage
+
+def parse_token_count(value):
+    '''
+    Convert a token count reported by an API usage object to an integer.
+    Args:
+        value: The raw token count (int, numeric string or empty string).
+    Returns:
+        int | None: The token count, or None if it is missing or not numeric.
+    '''
+    if isinstance(value, int):
+        return value
+    if str(value).isdigit():
+        return int(value)
+    return None
+
+def run_concurrently(func, items, max_workers: int = 1, warm_up: bool = False):
+    '''
+    Apply a function to every item, running at most max_workers calls at the same time.
+    Args:
+        func (callable): The function to call for each item.
+        items (list): The items to process.
+        max_workers (int): Maximum number of calls in flight. 1 runs the items sequentially.
+        warm_up (bool): Run the first item alone before the others, so that a provider-side
+            prompt cache is written once by the first request and read by all the following ones.
+    Returns:
+        list: The results, in the same order as the input items.
+    '''
+    if max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    first_results = [func(items[0])] if warm_up else []
+    items = items[len(first_results):]
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        # executor.map yields results in submission order, whichever worker finishes first
+        return first_results + list(executor.map(func, items))
+
+def add_prompt_cache_breakpoint(message_list: list[dict], idx_to_insert_image: int) -> list[dict]:
+    '''
+    Mark the end of the static prompt prefix (the system prompt and the few-shot example messages
+    before the message of the analysed image) for Claude prompt caching.
+    The prefix is then written to the cache by the first request and read by the following ones.
+    Args:
+        message_list (list[dict]): The Claude message list.
+        idx_to_insert_image (int): Index of the message that receives the analysed image.
+    Returns:
+        list[dict]: A copy of the message list with a cache breakpoint (only the marked message is copied).
+    '''
+    prefix_end = idx_to_insert_image % len(message_list)
+    # Without example messages the prefix is too short to be cached
+    if prefix_end == 0:
+        return message_list
+
+    messages = list(message_list)
+    last_message = copy.deepcopy(messages[prefix_end - 1])
+    if isinstance(last_message["content"], str):
+        last_message["content"] = [{"type": "text", "text": last_message["content"]}]
+    last_message["content"][-1]["cache_control"] = {"type": "ephemeral"}
+    messages[prefix_end - 1] = last_message
+    return messages
+
+def read_claude_usage(usage) -> dict:
+    '''
+    Read the token counts of a Claude response.
+    Args:
+        usage: The usage object of the response (may be None).
+    Returns:
+        dict: 'input_tokens', 'output_tokens', 'cache_write_tokens' and 'cache_read_tokens'.
+            Claude's input tokens do not include the tokens written to or read from the prompt cache.
+    '''
+    if not usage:
+        return {"input_tokens": '', "output_tokens": '', "cache_write_tokens": '', "cache_read_tokens": ''}
+    return {
+        "input_tokens": getattr(usage, 'input_tokens', ''),
+        "output_tokens": getattr(usage, 'output_tokens', ''),
+        "cache_write_tokens": getattr(usage, 'cache_creation_input_tokens', None) or 0,
+        "cache_read_tokens": getattr(usage, 'cache_read_input_tokens', None) or 0,
+    }
+
+def read_claude_rate_usage(response) -> tuple[int | None, int | None]:
+    # Input and output tokens counted by the rate limiter (prompt cache reads do not count towards the quota)
+    if not response.usage:
+        return None, None
+    return response.usage.input_tokens + (response.usage.cache_creation_input_tokens or 0), response.usage.output_tokens
+
+def read_gpt_usage(usage) -> dict:
+    '''
+    Read the token counts of an OpenAI response.
+    Args:
+        usage: The usage object of the response (may be None).
+    Returns:
+        dict: 'input_tokens', 'output_tokens' and 'cache_read_tokens'. OpenAI includes the cached tokens
+            in prompt_tokens, they are moved to 'cache_read_tokens' so both providers' tables read the same way.
+    '''
+    if not usage:
+        return {"input_tokens": '', "output_tokens": '', "cache_read_tokens": ''}
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached_tokens = getattr(details, 'cached_tokens', None) or 0
+    input_tokens = getattr(usage, 'prompt_tokens', '')
+    if isinstance(input_tokens, int):
+        input_tokens -= cached_tokens
+    return {
+        "input_tokens": input_tokens,
+        "output_tokens": getattr(usage, 'completion_tokens', ''),
+        "cache_read_tokens": cached_tokens,
+    }
+
+def analyse_images_in_batch(image_files: list, cache_keys: dict, response_cache, build_request, submit_batch, save_response, manifest, image_keys: dict, telemetry: RunTelemetry) -> list:
+    '''
+    Analyse images with one asynchronous batch job instead of one synchronous request per image.
+    Images found in the response cache are not sent, the others are submitted together and the
+    results are saved exactly like the synchronous responses.
+    Args:
+        image_files (list): Paths of the images to analyse.
+        cache_keys (dict): Response cache key of every image path.
+        response_cache (ResponseCache | None): The response cache, or None if it is bypassed.
+        build_request (callable): Returns the API parameters of the request for an image path.
+        submit_batch (callable): Sends requests (by custom id) as batch jobs and returns their results by custom id.
+        save_response (callable): Saves the response of an image and returns its usage record.
+        manifest (RunManifest): The run manifest recording completed and failed images.
+        image_keys (dict): Manifest key of every image path.
+        telemetry (RunTelemetry): Records the request building time and the batch job duration of every image.
+    Returns:
+        list: The usage records of the completed images, in image order.
+    '''
+    cached_responses = {image_path: response_cache.get(cache_keys[image_path]) for image_path in image_files} if response_cache else {}
+    batch_files = [image_path for image_path in image_files if not cached_responses.get(image_path)]
+
+    batch_results, encode_times, batch_time = {}, {}, None
+    if batch_files:
+        print(f"\nSending {len(batch_files)} image(s) as a batch job ({len(image_files) - len(batch_files)} answered from the response cache)...")
+        requests = {}
+        for image_path in batch_files:
+            start = time.perf_counter()
+            requests[make_custom_id(image_path)] = build_request(image_path)
+            encode_times[image_path] = time.perf_counter() - start
+        start = time.perf_counter()
+        batch_results = submit_batch(requests)
+        batch_time = time.perf_counter() - start
+
+    def analyse_image(image_path):
+        cached = cached_responses.get(image_path)
+        response = cached or batch_results.get(make_custom_id(image_path), {"error": "no result returned by the batch job"})
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        if not cached and response_cache:
+            response_cache.put(cache_keys[image_path], response)
+        usage = {key: value for key, value in response.items() if key != "text"}
+        return save_response(image_path, response["text"], usage, cached is not None)
+
+    usage_records = [
+        telemetry.track(
+            image_path, lambda image_path: manifest.run_image(image_path, image_keys[image_path], analyse_image),
+            encode_time=encode_times.get(image_path), request_latency=batch_time if image_path in encode_times else None,
+        )
+        for image_path in image_files
+    ]
+    return [record for record in usage_records if record is not None]
+
+# Columns of the token usage tables: (column title, usage record key, price key)
+TOKEN_USAGE_COLUMNS = (
+    ("Input Tokens", "input_tokens", "input_token"),
+    ("Output Tokens", "output_tokens", "output_token"),
+    ("Cache Write Tokens", "cache_write_tokens", "cache_write_token"),
+    ("Cache Read Tokens", "cache_read_tokens", "cache_read_token"),
+)
+
+def write_token_usage_table(token_usage_path: Path, usage_records: list[dict], model: str, service_prices: dict, prices_name: str, price_multiplier: float = 1.0):
+    '''
+    Append per-image token usage, averages and the total price of a run to a Markdown file.
+    Args:
+        token_usage_path (Path): The Markdown file to append to (the header is written if it does not exist).
+        usage_records (list[dict]): One record per image with 'image', 'input_tokens', 'output_tokens',
+            optionally 'cache_write_tokens' / 'cache_read_tokens' and 'cached'.
+        model (str): The model name used for the run.
+        service_prices (dict): Price table for the provider (e.g., CLAUDE_SERVICE_PRICES).
+        prices_name (str): Name of the price table, used in the message for unknown models.
+        price_multiplier (float): Discount applied to the prices (e.g., BATCH_PRICE_MULTIPLIER for batch jobs).
+    Returns:
+        None
+    '''
+    # Nothing to report if every image was skipped or failed
+    if not usage_records:
+        return
+
+    # Only show the prompt cache columns reported by the provider
+    columns = [column for column in TOKEN_USAGE_COLUMNS if any(column[1] in record for record in usage_records)]
+    header = f"| OCR Input File | {' | '.join(title for title, _, _ in columns)} |\n"
+
+    # Write header if file does not exist, or start a new table if the columns changed
+    if not token_usage_path.exists():
+        with open(token_usage_path, 'w', encoding='utf-8') as f:
+            f.write(header + f"|{'|'.join([':---:'] * (len(columns) + 1))}|\n")
+    else:
+        with open(token_usage_path, 'r', encoding='utf-8') as f:
+            headers = [line for line in f if line.startswith('| OCR Input File |')]
+        if headers and headers[-1] != header:
+            with open(token_usage_path, 'a', encoding='utf-8') as f:
+                f.write("\n" + header + f"|{'|'.join([':---:'] * (len(columns) + 1))}|\n")
+    # Append rows
+    with open(token_usage_path, 'a', encoding='utf-8') as f:
+        for record in usage_records:
+            f.write(f"| {record['image']} | {' | '.join(str(record.get(key, '')) for _, key, _ in columns)} |\n")
+
+    # Accumulate totals for averages and price calculation
+    counted = [[parse_token_count(record.get(key, '')) for _, key, _ in columns] for record in usage_records]
+    # Responses served from the response cache were not charged again
+    charged = [counts for counts, record in zip(counted, usage_records) if not record.get('cached')]
+    totals = [sum(counts[i] for counts in charged if counts[i] is not None) for i in range(len(columns))]
+
+    # Compute and append averages over the rows that have every token count
+    complete = [counts for counts in counted if None not in counts]
+    if complete:
+        averages = [round(sum(counts[i] for counts in complete) / len(complete), 1) for i in range(len(columns))]
+        with open(token_usage_path, 'a', encoding='utf-8') as f:
+            f.write(f"| **Average** | {' | '.join(str(average) for average in averages)} |\n")
+
+    # Calculate and append total price usage
+    price_info = service_prices.get(model, None)
+    if price_info:
+        # Prompt cache tokens without a listed price are charged as regular input tokens
+        total_price = sum(
+            total * price_info.get(price_key, price_info.get("input_token", 0))
+            for total, (_, _, price_key) in zip(totals, columns)
+        ) * price_multiplier
+        with open(token_usage_path, 'a', encoding='utf-8') as f:
+            f.write(f"\n**Total price usage for model '{model}': ${total_price:.4f}**\n")
+            if price_multiplier != 1.0:
+                f.write(f"\n*Prices multiplied by {price_multiplier} (batch job discount).*\n")
+            cached_count = len(usage_records) - len(charged)
+            if cached_count:
+                f.write(f"\n*{cached_count} response(s) served from the response cache were not charged.*\n")
+    else:
+        with open(token_usage_path, 'a', encoding='utf-8') as f:
+            f.write(f"\n**Total price usage for model '{model}': Unknown (model not in {prices_name})**\n")
+
+def claude_analyse_read(service_name: OcrService, model: str, max_tokens: int, temperature: int, message_list: list[dict], system_prompt: str, idx_to_insert_image: int, max_workers: int = 1, resume: bool = True, use_cache: bool = True, batch: bool = False, prompt_caching: bool = True, stream: bool = False):
     # Check if the service_name is a valid OcrService enum
     if not isinstance(service_name, OcrService):
         raise ValueError(f"Invalid OCR service name: {service_name}. Must be an instance of OcrService enum.")
@@ -298,7 +639,7 @@ def claude_analyse_read(service_name: OcrService, model: str, max_tokens: int, t
         print("CLAUDE_API_KEY is not set in the .env file.")
         exit(1)
 
-    # Create a Claude client
+    # Create a Claude client (the SDK client is thread-safe and shared by all workers)
     print("Connecting to Claude AI service...\n")
     client = Anthropic(api_key=api_key)
 
@@ -306,99 +647,139 @@ def claude_analyse_read(service_name: OcrService, model: str, max_tokens: int, t
     images_dir, image_files, results_dir = define_directories(service_name)
 
     # Only process images in PROCESSED_OCR_IMAGES and sort them naturally
-    image_files = [f for f in image_files if Path(f).name in PROCESSED_OCR_IMAGES]
+    image_files = [f for f in image_files if is_processed_image(f)]
     image_files = natural_sort_files(image_files)
 
     if not image_files:
         print(f"No images found in {images_dir}.")
         return
 
-    print('---------- Claude service analysis started ----------')
-
-    token_usage_rows = []
-    total_input_tokens = 0
-    total_output_tokens = 0
+    # Check if the files are images
+    supported_files = []
     for image_path in image_files:
-        # Check if the file is an image
         if not is_a_file_an_image(image_path):
             print(f"\nSkipping {Path(image_path).name}, not a supported image format.")
             continue
+        supported_files.append(image_path)
 
-        # Insert the image to the prompt
-        message_list[idx_to_insert_image]["content"][0]["source"]["data"] = get_base64_encoded_image(image_path)
+    # Skip images already completed by a previous run with the same service, model, prompt and image content
+    manifest = RunManifest(results_dir / 'run_manifest.json')
+    prompt_hash = hash_request({"system": system_prompt, "messages": message_list, "max_tokens": max_tokens, "temperature": temperature})
+    image_hashes = {image_path: hash_bytes(read_image_bytes(image_path)) for image_path in supported_files}
+    image_keys = {image_path: RunManifest.make_key(service_name, model, prompt_hash, image_hashes[image_path]) for image_path in supported_files}
+    pending_files = manifest.pending(supported_files, image_keys) if resume else supported_files
 
-        print(f"\nAnalysing {Path(image_path).name} by {model}...")
+    # Only deterministic (temperature 0) requests are cached, use_cache=False bypasses the cache
+    response_cache = ResponseCache() if use_cache and temperature == 0 else None
 
-        # Send the request to the Claude API
-        response = client.messages.create(
-            model=model,
-            system=system_prompt,
-            messages=message_list,
-            max_tokens=max_tokens,
-            temperature=temperature,
-        )
+    # Streaming only applies to requests sent one by one
+    if batch and stream:
+        print("\033[93mWARNING: Batch jobs are not streamed, stream is ignored.\033[0m")
+        stream = False
+
+    # Per-image timings, retries and tokens, written to telemetry.jsonl
+    telemetry = RunTelemetry(results_dir, service_name, model, 'batch' if batch else 'stream' if stream else 'sync')
+
+    # Every result is also appended to the results store read by measure_errors.py
+    results_store = ResultsStore()
+
+    # Cache the few-shot example prefix on Claude's side, it is identical for every image
+    request_message_list = add_prompt_cache_breakpoint(message_list, idx_to_insert_image) if prompt_caching else message_list
 
+    print('---------- Claude service analysis started ----------')
+
+    def build_messages(image_path):
+        # Insert the image into a copy of the prompt, so concurrent requests never share the target message
+        messages = list(request_message_list)
+        messages[idx_to_insert_image] = copy.deepcopy(request_message_list[idx_to_insert_image])
+        with telemetry.measure('image_load_time'):
+            image_bytes = read_image_bytes(image_path)
+        with telemetry.measure('encode_time'):
+            messages[idx_to_insert_image]["content"][0]["source"]["data"] = base64.b64encode(image_bytes).decode('utf-8')
+        messages[idx_to_insert_image]["content"][0]["source"]["media_type"] = get_image_media_type(image_path)
+        return messages
+
+    def save_response(image_path, response_text, usage, cached):
         # Clean and save recognised text to file
-        cleaned_text = extract_answer_from_tag(response.content[0].text)
-        save_results_to_file(service_name, cleaned_text, Path(image_path).stem, results_dir)
-
-        # Track token usage
-        usage = getattr(response, 'usage', None)
-        input_tokens = output_tokens = ''
-        if usage:
-            input_tokens = getattr(usage, 'input_tokens', '')
-            output_tokens = getattr(usage, 'output_tokens', '')
-            # Accumulate totals for price calculation
-            if isinstance(input_tokens, int):
-                total_input_tokens += input_tokens
-            elif str(input_tokens).isdigit():
-                total_input_tokens += int(input_tokens)
-            if isinstance(output_tokens, int):
-                total_output_tokens += output_tokens
-            elif str(output_tokens).isdigit():
-                total_output_tokens += int(output_tokens)
-        token_usage_rows.append(f"| {Path(image_path).name} | {input_tokens} | {output_tokens} |\n")
+        cleaned_text = extract_answer_from_tag(response_text)
+        result_file = save_results_to_file(service_name, cleaned_text, Path(image_path).stem, results_dir)
+        latency = (telemetry.current() or {}).get('request_latency')
+        results_store.append(service_name, model, prompt_hash, Path(image_path).name, result_file.name, cleaned_text, usage, latency, cached)
+        return {"image": Path(image_path).name, **usage, "result_file": result_file, "cached": cached}
 
-    # Write token usage table to Markdown file in the Claude results directory
-    token_usage_path = results_dir / 'claude_token_usage.md'
-    # Write header if file does not exist
-    if not token_usage_path.exists():
-        with open(token_usage_path, 'w', encoding='utf-8') as f:
-            f.write("| OCR Input File | Input Tokens | Output Tokens |\n|:---:|:---:|:---:|\n")
-    # Append rows
-    with open(token_usage_path, 'a', encoding='utf-8') as f:
-        for row in token_usage_rows:
-            f.write(row)
-    # Compute and append averages if any rows were written
-    if token_usage_rows:
-        try:
-            input_sum = sum(int(row.split('|')[2].strip()) for row in token_usage_rows if row.split('|')[2].strip().isdigit())
-            output_sum = sum(int(row.split('|')[3].strip()) for row in token_usage_rows if row.split('|')[3].strip().isdigit())
-            count = len([row for row in token_usage_rows if row.split('|')[2].strip().isdigit() and row.split('|')[3].strip().isdigit()])
-            if count > 0:
-                avg_input = round(input_sum / count, 1)
-                avg_output = round(output_sum / count, 1)
-                with open(token_usage_path, 'a', encoding='utf-8') as f:
-                    f.write(f"| **Average** | {avg_input} | {avg_output} |\n")
-        except Exception as e:
-            print(f"Error calculating averages for token usage: {e}")
+    cache_keys = {image_path: ResponseCache.make_key('claude', model, prompt_hash, image_hashes[image_path]) for image_path in pending_files}
 
-    # Calculate and append total price usage
-    price_info = CLAUDE_SERVICE_PRICES.get(model, None)
-    total_price = None
-    if price_info:
-        input_price = price_info.get("input_token", 0)
-        output_price = price_info.get("output_token", 0)
-        total_price = (total_input_tokens * input_price) + (total_output_tokens * output_price)
-        with open(token_usage_path, 'a', encoding='utf-8') as f:
-            f.write(f"\n**Total price usage for model '{model}': ${total_price:.4f}**\n")
+    def analyse_image(image_path):
+        print(f"\nAnalysing {Path(image_path).name} by {model}...")
+
+        # Answer a request identical to a previous one from the response cache
+        cached = response_cache.get(cache_keys[image_path]) if response_cache else None
+        if cached:
+            print(f"Using cached response for {Path(image_path).name}.")
+            return save_response(image_path, cached["text"], {key: value for key, value in cached.items() if key != "text"}, True)
+
+        # Send the request to the Claude API, paced by the shared rate limiter.
+        # Prompt cache reads do not count towards the input tokens per minute quota.
+        messages = build_messages(image_path)
+        request = {"model": model, "system": system_prompt, "messages": messages, "max_tokens": max_tokens, "temperature": temperature}
+        if stream:
+            # The generation stops at the closing answer tag instead of running on after the answer
+            response_text, response = rate_limited_call(
+                'claude', model,
+                lambda: stream_claude_message(client, telemetry.current(), **request),
+                estimated_input_tokens=estimate_request_tokens('claude', messages, system_prompt),
+                estimated_output_tokens=max_tokens,
+                read_usage=lambda streamed: read_claude_rate_usage(streamed[1]),
+                stats=telemetry.current(),
+            )
+        else:
+            response = rate_limited_call(
+                'claude', model,
+                lambda: client.messages.create(**request),
+                estimated_input_tokens=estimate_request_tokens('claude', messages, system_prompt),
+                estimated_output_tokens=max_tokens,
+                read_usage=read_claude_rate_usage,
+                stats=telemetry.current(),
+            )
+            response_text = response.content[0].text
+
+        # Track token usage, including the prompt cache writes and reads
+        usage = read_claude_usage(getattr(response, 'usage', None))
+
+        if response_cache:
+            response_cache.put(cache_keys[image_path], {"text": response_text, **usage})
+        return save_response(image_path, response_text, usage, False)
+
+    if batch:
+        # Bulk mode: all images go into asynchronous Message Batches jobs, billed at half price
+        usage_records = analyse_images_in_batch(
+            pending_files, cache_keys, response_cache,
+            build_request=lambda image_path: {"model": model, "system": system_prompt, "messages": build_messages(image_path), "max_tokens": max_tokens, "temperature": temperature},
+            submit_batch=lambda requests: run_claude_batch(client, requests, results_dir / 'claude_batch.json', prompt_hash, read_claude_usage),
+            save_response=save_response, manifest=manifest, image_keys=image_keys, telemetry=telemetry,
+        )
     else:
-        with open(token_usage_path, 'a', encoding='utf-8') as f:
-            f.write(f"\n**Total price usage for model '{model}': Unknown (model not in CLAUDE_SERVICE_PRICES)**\n")
+        # Usage records come back in image order and are only aggregated here, after all workers finished.
+        # With prompt caching, the first image runs alone so the other workers read its cached prefix.
+        usage_records = run_concurrently(
+            lambda image_path: telemetry.track(image_path, lambda image_path: manifest.run_image(image_path, image_keys[image_path], analyse_image)),
+            pending_files, max_workers, warm_up=prompt_caching,
+        )
+        usage_records = [record for record in usage_records if record is not None]
+
+    # Write token usage table to Markdown file in the Claude results directory
+    write_token_usage_table(results_dir / 'claude_token_usage.md', usage_records, model, CLAUDE_SERVICE_PRICES, 'CLAUDE_SERVICE_PRICES', BATCH_PRICE_MULTIPLIER if batch else 1.0)
+
+    telemetry.summarise()
+    results_store.close()
+
+    failed_images = manifest.failed_images(image_keys)
+    if failed_images:
+        print(f"\n\033[93mWARNING: {len(failed_images)} image(s) failed: {', '.join(failed_images)}. Run again to retry them.\033[0m")
 
     print('\n---------- Claude service analysis finished ----------')
 
-def gpt_analyse_read(service_name: OcrService, model: str, max_tokens: int, temperature: int, messages: list[dict], idx_to_insert_image: int):
+def gpt_analyse_read(service_name: OcrService, model: str, max_tokens: int, temperature: int, messages: list[dict], idx_to_insert_image: int, max_workers: int = 1, resume: bool = True, use_cache: bool = True, batch: bool = False, prompt_caching: bool = True, stream: bool = False):
     # Check if the service_name is a valid OcrService enum
     if not isinstance(service_name, OcrService):
         raise ValueError(f"Invalid OCR service name: {service_name}. Must be an instance of OcrService enum.")
@@ -414,7 +795,7 @@ def gpt_analyse_read(service_name: OcrService, model: str, max_tokens: int, temp
         print("OPENAI_API_KEY is not set in the .env file.")
         exit(1)
 
-    # Create a GPT client
+    # Create a GPT client (the SDK client is thread-safe and shared by all workers)
     print("Connecting to GPT AI service...\n")
     client = OpenAI(api_key=api_key)
 
@@ -422,94 +803,136 @@ def gpt_analyse_read(service_name: OcrService, model: str, max_tokens: int, temp
     images_dir, image_files, results_dir = define_directories(service_name)
 
     # Only process images in PROCESSED_OCR_IMAGES and sort them naturally
-    image_files = [f for f in image_files if Path(f).name in PROCESSED_OCR_IMAGES]
+    image_files = [f for f in image_files if is_processed_image(f)]
     image_files = natural_sort_files(image_files)
 
     if not image_files:
         print(f"No images found in {images_dir}.")
         return
 
-    print('---------- OpenAI service analysis started ----------')
-
-    token_usage_rows = []
-    total_input_tokens = 0
-    total_output_tokens = 0
+    # Check if the files are images
+    supported_files = []
     for image_path in image_files:
-        # Check if the file is an image
         if not is_a_file_an_image(image_path):
             print(f"\nSkipping {Path(image_path).name}, not a supported image format.")
             continue
+        supported_files.append(image_path)
 
-        # Insert the image to the prompt
-        messages[idx_to_insert_image]["content"][0]["image_url"]["url"] = f"data:image/png;base64,{get_base64_encoded_image(image_path)}"
+    # Skip images already completed by a previous run with the same service, model, prompt and image content
+    manifest = RunManifest(results_dir / 'run_manifest.json')
+    prompt_hash = hash_request({"messages": messages, "max_tokens": max_tokens, "temperature": temperature})
+    image_hashes = {image_path: hash_bytes(read_image_bytes(image_path)) for image_path in supported_files}
+    image_keys = {image_path: RunManifest.make_key(service_name, model, prompt_hash, image_hashes[image_path]) for image_path in supported_files}
+    pending_files = manifest.pending(supported_files, image_keys) if resume else supported_files
 
-        print(f"\nAnalysing {Path(image_path).name} by {model}...")
+    # Only deterministic (temperature 0) requests are cached, use_cache=False bypasses the cache
+    response_cache = ResponseCache() if use_cache and temperature == 0 else None
 
-        # Send the request to the OpenAI API
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-        )
+    # OpenAI caches prompt prefixes of 1024+ tokens automatically, as long as the static
+    # example messages come first and the analysed image is in the last message
+    if prompt_caching and idx_to_insert_image % len(messages) != len(messages) - 1:
+        print("\033[93mWARNING: The analysed image is not in the last message, the few-shot prefix cannot be cached.\033[0m")
 
+    # Streaming only applies to requests sent one by one
+    if batch and stream:
+        print("\033[93mWARNING: Batch jobs are not streamed, stream is ignored.\033[0m")
+        stream = False
+
+    # Per-image timings, retries and tokens, written to telemetry.jsonl
+    telemetry = RunTelemetry(results_dir, service_name, model, 'batch' if batch else 'stream' if stream else 'sync')
+
+    # Every result is also appended to the results store read by measure_errors.py
+    results_store = ResultsStore()
+
+    print('---------- OpenAI service analysis started ----------')
+
+    def build_messages(image_path):
+        # Insert the image into a copy of the prompt, so concurrent requests never share the target message
+        request_messages = list(messages)
+        request_messages[idx_to_insert_image] = copy.deepcopy(messages[idx_to_insert_image])
+        with telemetry.measure('image_load_time'):
+            image_bytes = read_image_bytes(image_path)
+        with telemetry.measure('encode_time'):
+            encoded = base64.b64encode(image_bytes).decode('utf-8')
+        request_messages[idx_to_insert_image]["content"][0]["image_url"]["url"] = f"data:{get_image_media_type(image_path)};base64,{encoded}"
+        return request_messages
+
+    def save_response(image_path, response_text, usage, cached):
         # Clean and save recognised text to file
-        cleaned_text = extract_answer_from_tag(response.choices[0].message.content)
-        save_results_to_file(service_name, cleaned_text, Path(image_path).stem, results_dir)
-
-        # Track token usage
-        usage = getattr(response, 'usage', None)
-        input_tokens = output_tokens = ''
-        if usage:
-            input_tokens = getattr(usage, 'prompt_tokens', '')
-            output_tokens = getattr(usage, 'completion_tokens', '')
-            # Accumulate totals for price calculation
-            if isinstance(input_tokens, int):
-                total_input_tokens += input_tokens
-            elif str(input_tokens).isdigit():
-                total_input_tokens += int(input_tokens)
-            if isinstance(output_tokens, int):
-                total_output_tokens += output_tokens
-            elif str(output_tokens).isdigit():
-                total_output_tokens += int(output_tokens)
-        token_usage_rows.append(f"| {Path(image_path).name} | {input_tokens} | {output_tokens} |\n")
+        cleaned_text = extract_answer_from_tag(response_text)
+        result_file = save_results_to_file(service_name, cleaned_text, Path(image_path).stem, results_dir)
+        latency = (telemetry.current() or {}).get('request_latency')
+        results_store.append(service_name, model, prompt_hash, Path(image_path).name, result_file.name, cleaned_text, usage, latency, cached)
+        return {"image": Path(image_path).name, **usage, "result_file": result_file, "cached": cached}
 
-    # Write token usage table to Markdown file in the GPT results directory
-    token_usage_path = results_dir / 'gpt_token_usage.md'
-    # Write header if file does not exist
-    if not token_usage_path.exists():
-        with open(token_usage_path, 'w', encoding='utf-8') as f:
-            f.write("| OCR Input File | Input Tokens | Output Tokens |\n|:---:|:---:|:---:|\n")
-    # Append rows
-    with open(token_usage_path, 'a', encoding='utf-8') as f:
-        for row in token_usage_rows:
-            f.write(row)
-    # Compute and append averages if any rows were written
-    if token_usage_rows:
-        try:
-            input_sum = sum(int(row.split('|')[2].strip()) for row in token_usage_rows if row.split('|')[2].strip().isdigit())
-            output_sum = sum(int(row.split('|')[3].strip()) for row in token_usage_rows if row.split('|')[3].strip().isdigit())
-            count = len([row for row in token_usage_rows if row.split('|')[2].strip().isdigit() and row.split('|')[3].strip().isdigit()])
-            if count > 0:
-                avg_input = round(input_sum / count, 1)
-                avg_output = round(output_sum / count, 1)
-                with open(token_usage_path, 'a', encoding='utf-8') as f:
-                    f.write(f"| **Average** | {avg_input} | {avg_output} |\n")
-        except Exception as e:
-            print(f"Error calculating averages for token usage: {e}")
+    cache_keys = {image_path: ResponseCache.make_key('gpt', model, prompt_hash, image_hashes[image_path]) for image_path in pending_files}
 
-    # Calculate and append total price usage
-    price_info = GPT_SERVICE_PRICES.get(model, None)
-    total_price = None
-    if price_info:
-        input_price = price_info.get("input_token", 0)
-        output_price = price_info.get("output_token", 0)
-        total_price = (total_input_tokens * input_price) + (total_output_tokens * output_price)
-        with open(token_usage_path, 'a', encoding='utf-8') as f:
-            f.write(f"\n**Total price usage for model '{model}': ${total_price:.4f}**\n")
+    def analyse_image(image_path):
+        print(f"\nAnalysing {Path(image_path).name} by {model}...")
+
+        # Answer a request identical to a previous one from the response cache
+        cached = response_cache.get(cache_keys[image_path]) if response_cache else None
+        if cached:
+            print(f"Using cached response for {Path(image_path).name}.")
+            return save_response(image_path, cached["text"], {key: value for key, value in cached.items() if key != "text"}, True)
+
+        # Send the request to the OpenAI API, paced by the shared rate limiter.
+        # OpenAI counts max_tokens against the same TPM quota as the input tokens.
+        request_messages = build_messages(image_path)
+        request = {"model": model, "messages": request_messages, "temperature": temperature, "max_tokens": max_tokens}
+        if stream:
+            # The generation stops at the closing answer tag instead of running on after the answer
+            response_text, response_usage = rate_limited_call(
+                'gpt', model,
+                lambda: stream_gpt_completion(client, telemetry.current(), **request),
+                estimated_input_tokens=estimate_request_tokens('gpt', request_messages) + max_tokens,
+                read_usage=lambda streamed: (streamed[1].total_tokens, None) if streamed[1] else (None, None),
+                stats=telemetry.current(),
+            )
+        else:
+            response = rate_limited_call(
+                'gpt', model,
+                lambda: client.chat.completions.create(**request),
+                estimated_input_tokens=estimate_request_tokens('gpt', request_messages) + max_tokens,
+                read_usage=lambda response: (response.usage.total_tokens, None) if response.usage else (None, None),
+                stats=telemetry.current(),
+            )
+            response_text = response.choices[0].message.content
+            response_usage = getattr(response, 'usage', None)
+
+        # Track token usage, including the automatically cached prompt tokens
+        usage = read_gpt_usage(response_usage)
+
+        if response_cache:
+            response_cache.put(cache_keys[image_path], {"text": response_text, **usage})
+        return save_response(image_path, response_text, usage, False)
+
+    if batch:
+        # Bulk mode: all images go into asynchronous Batch API jobs, billed at half price
+        usage_records = analyse_images_in_batch(
+            pending_files, cache_keys, response_cache,
+            build_request=lambda image_path: {"model": model, "messages": build_messages(image_path), "temperature": temperature, "max_tokens": max_tokens},
+            submit_batch=lambda requests: run_gpt_batch(client, requests, results_dir / 'gpt_batch.json', prompt_hash, read_gpt_usage),
+            save_response=save_response, manifest=manifest, image_keys=image_keys, telemetry=telemetry,
+        )
     else:
-        with open(token_usage_path, 'a', encoding='utf-8') as f:
-            f.write(f"\n**Total price usage for model '{model}': Unknown (model not in GPT_SERVICE_PRICES)**\n")
+        # Usage records come back in image order and are only aggregated here, after all workers finished.
+        # With prompt caching, the first image runs alone so the other workers read its cached prefix.
+        usage_records = run_concurrently(
+            lambda image_path: telemetry.track(image_path, lambda image_path: manifest.run_image(image_path, image_keys[image_path], analyse_image)),
+            pending_files, max_workers, warm_up=prompt_caching,
+        )
+        usage_records = [record for record in usage_records if record is not None]
+
+    # Write token usage table to Markdown file in the GPT results directory
+    write_token_usage_table(results_dir / 'gpt_token_usage.md', usage_records, model, GPT_SERVICE_PRICES, 'GPT_SERVICE_PRICES', BATCH_PRICE_MULTIPLIER if batch else 1.0)
+
+    telemetry.summarise()
+    results_store.close()
+
+    failed_images = manifest.failed_images(image_keys)
+    if failed_images:
+        print(f"\n\033[93mWARNING: {len(failed_images)} image(s) failed: {', '.join(failed_images)}. Run again to retry them.\033[0m")
 
     print('\n---------- GPT service analysis finished ----------')
 
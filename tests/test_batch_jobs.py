@@ -0,0 +1,71 @@
+# Import external modules
+import sys
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'app'))
+
+# Import self-made modules
+import batch_jobs, batch_stand_in_server, results_store, utils
+from batch_jobs import make_custom_id
+
+# Round trip of claude_analyse_read / gpt_analyse_read (batch=True) through the local stand-in batch server:
+# submit -> poll -> results, and the mapping of custom ids back to the result files.
+
+IMAGE_STEMS = ('exam_1_comp', 'exam-2_comp', 'exam.2_comp')
+
+@pytest.fixture
+def stand_in_run(tmp_path, monkeypatch):
+    server = batch_stand_in_server.serve(0)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setenv('ANTHROPIC_BASE_URL', base_url)
+    monkeypatch.setenv('OPENAI_BASE_URL', f"{base_url}/v1")
+    monkeypatch.setenv('CLAUDE_API_KEY', 'stand-in')
+    monkeypatch.setenv('OPENAI_API_KEY', 'stand-in')
+
+    images_dir = tmp_path / 'images'
+    images_dir.mkdir()
+    for stem in IMAGE_STEMS:
+        Image.new('RGB', (20, 20), 'white').save(images_dir / f'{stem}.png')
+    results_dir = tmp_path / 'results'
+    results_dir.mkdir()
+
+    monkeypatch.setattr(utils, 'load_env_file', lambda: None)
+    monkeypatch.setattr(utils, 'define_directories', lambda service_name: (images_dir, [str(path) for path in images_dir.iterdir()], results_dir))
+    monkeypatch.setattr(utils, 'is_processed_image', lambda file_path: True)
+    monkeypatch.setattr(utils, 'ResultsStore', lambda: results_store.ResultsStore(tmp_path / 'results.sqlite'))
+    # The stand-in server answers the first status check with "in progress", skip the wait between checks
+    monkeypatch.setattr(batch_jobs.time, 'sleep', lambda seconds: None)
+
+    yield results_dir
+    server.shutdown()
+    server.server_close()
+
+def assert_results_written(results_dir: Path, service_name):
+    for stem in IMAGE_STEMS:
+        result_text = (results_dir / f'{service_name}_{stem}.txt').read_text(encoding='utf-8')
+        assert result_text == f'stand-in transcription of {make_custom_id(f"{stem}.png")}'
+
+def test_claude_batch_round_trip(stand_in_run):
+    service_name = list(utils.OcrService)[0]
+    message_list = [
+        {"role": "user", "content": [{"type": "image", "source": {"type": "base64", "media_type": "", "data": ""}}]},
+        {"role": "assistant", "content": "Let's think step by step."},
+    ]
+    utils.claude_analyse_read(service_name, 'claude-3-5-sonnet-latest', 100, 0, message_list, 'Transcribe the code.', -2, use_cache=False, batch=True)
+    assert_results_written(stand_in_run, service_name)
+
+def test_gpt_batch_round_trip(stand_in_run):
+    service_name = list(utils.OcrService)[0]
+    messages = [{"role": "user", "content": [{"type": "image_url", "image_url": {"url": ""}}]}]
+    utils.gpt_analyse_read(service_name, 'gpt-4.1', 100, 0, messages, -1, use_cache=False, batch=True)
+    assert_results_written(stand_in_run, service_name)
+
+def test_custom_ids_are_unique():
+    stems = ('exam-2_comp', 'exam.2_comp', 'exam 2_comp', 'a' * 70, 'a' * 64 + 'b')
+    custom_ids = [make_custom_id(f'{stem}.png') for stem in stems]
+    assert len(set(custom_ids)) == len(stems)
+    assert custom_ids[0] == 'exam-2_comp'
+    assert all(len(custom_id) <= 64 for custom_id in custom_ids)
@@ -0,0 +1,44 @@
+# Import external modules
+import random, sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'app'))
+
+# Import self-made modules
+from markdown_text import fast_markdown_to_text, markdown_to_text, random_page, reference_markdown_to_text
+
+# The direct conversion must give the same text as markdown() + BeautifulSoup whenever it converts a page.
+
+# Markdown of the constructs and edge cases of both conversions
+EQUIVALENCE_CASES = [
+    '', '   \n\n', 'public class Main {\n}', '# Exam 1\n\npublic class Main {', '## Question 2 ##\nint x = 0;',
+    '#no space heading', 'text\n# heading\nmore text', '```java\npublic class A {\n    int x;\n}\n```',
+    '```java\npublic class A {\n\n    int x;\n}\n```', '`a` and ``b ` c``', '``` ```', 'line one  \nline two',
+    'trailing spaces  ', 'a   \nb', '    int x = 0;\n    x++;\n\n\n    return x;\nnot code',
+    '    code\n\n\n\nparagraph', '\tint tab = 1;', 'x\n\ty = 2;', ' leading space\n  two', 'a * b * c', 'a*b*c',
+    '/* comment */', '**bold**', '*', '* item', '- item', '1. first', '> quote', 'a > b', 'a >= b && c < d',
+    'List<String> names', 'if (i<n && j>0)', '<div>block</div>', 'x < y', '&amp; &lt;', 'a && b || c', '&#123;',
+    'args[0] = 1;', 'int[] a = new int[5];', '[link](http://example.com)', '![img-0.jpeg](img-0.jpeg)', '[a]: http://x',
+    'my_var = other_var;', '_private = 1;', 'a __init__ b', 'path\\to\\file', 'System.out.println("a\\n");', 'a \\* b',
+    'Title\n=====', 'Title\n---', '---', '***', '___', 'a\r\nb\rc', '\ufeffBOM', 'x\x02y\x03z', '<http://example.com>',
+    '<me@example.com>', 'see `List<String>` here', '`&lt;` and `a  \nb`', '# `code` heading', '#', '#\n#', 'é ü 日本',
+    'tab\tin\tline', '  \n  \ntext', 'text\n    indented continuation', '    code\n# heading', 'a\n\n\n\n\nb',
+    # A multiplication split over a line break: the line break is replaced before the asterisks open emphasis
+    'x = a *  \nb*c;', 'a *  \nb', 'a * b  \nc * d', 'x = a *  \n`b`*c;',
+]
+
+@pytest.mark.parametrize('markdown_text', EQUIVALENCE_CASES)
+def test_edge_case_gives_reference_text(markdown_text):
+    assert markdown_to_text(markdown_text) == reference_markdown_to_text(markdown_text)
+
+def test_random_pages_give_reference_text():
+    rng = random.Random(0)
+    for _ in range(500):
+        page = random_page(rng)
+        fast_text = fast_markdown_to_text(page)
+        assert fast_text is None or fast_text == reference_markdown_to_text(page), page
+
+def test_plain_java_is_converted_directly():
+    assert fast_markdown_to_text('# Exam 1\n\npublic class Main {\n    int x = a * b;\n}') is not None
@@ -0,0 +1,88 @@
+# Import external modules
+import random, sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'app'))
+
+# Import self-made modules
+from measure_errors import compute_nld, evaluate_services, normalize_text_for_comparison, score_splits, summary_matrix
+
+# The bounded scoring (score cutoffs, length bounds, cache seeds) must pick the same ground truth split,
+# with the same NLD and LD, as scoring every split exactly.
+
+WORDS = 'public static void main String args int for while if else return System out println new class'.split()
+SERVICES = ['svc_a', '[ex][svc_b]']
+
+def random_text(rng: random.Random) -> str:
+    return '\n'.join(' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 8))) for _ in range(rng.randint(1, 10)))
+
+def mutate(rng: random.Random, text: str, rate: float) -> str:
+    return ''.join(rng.choice('xyz;{ ') if rng.random() < rate else ch for ch in text if rng.random() >= rate / 2)
+
+def exact_best(gt_texts: list[tuple[str, str]], ocr_text: str) -> tuple:
+    # The first ground truth split with the highest NLD, scoring every split
+    best = None
+    for gt_name, gt_text in gt_texts:
+        nld, lev_dist = compute_nld(gt_text, ocr_text)
+        if best is None or nld > best[2]:
+            best = (gt_name, lev_dist, nld)
+    return best
+
+def write_corpus(root: Path, rng: random.Random) -> dict:
+    # Exams with up to four ground truth splits and one result file per service, some of them identical to a split
+    gt_dir = root / 'ground_truth'
+    gt_dir.mkdir()
+    gt_texts = {}
+    for n in range(1, 16):
+        text = random_text(rng)
+        names = [f'exam_{n}.txt'] + [f'exam_{n}_{k}.txt' for k in range(1, rng.randint(1, 4))]
+        gt_texts[f'exam_{n}'] = []
+        for k, name in enumerate(names):
+            split_text = text if k == 0 else mutate(rng, text, 0.1 * k)
+            (gt_dir / name).write_text(split_text, encoding='utf-8')
+            gt_texts[f'exam_{n}'].append((name, normalize_text_for_comparison(split_text)))
+    for service in SERVICES:
+        results_dir = root / 'results' / service / 'testing'
+        results_dir.mkdir(parents=True)
+        for n in range(1, 16):
+            split_texts = [gt_text for _, gt_text in gt_texts[f'exam_{n}']]
+            text = rng.choice(split_texts) if rng.random() < 0.2 else mutate(rng, split_texts[0], rng.choice([0.05, 0.2, 0.5]))
+            (results_dir / f'{service}_exam_{n}_comp.txt').write_text(text, encoding='utf-8')
+    return gt_texts
+
+def test_score_splits_keeps_the_exact_best():
+    rng = random.Random(0)
+    for _ in range(300):
+        gt_text = random_text(rng)
+        gt_texts = [(f'split_{k}', mutate(rng, gt_text, rng.random() * 0.5)) for k in range(rng.randint(1, 5))]
+        ocr_text = mutate(rng, gt_text, rng.random() * 0.5)
+        candidates = [(position, gt_name, text) for position, (gt_name, text) in enumerate(gt_texts)]
+        scores = score_splits(ocr_text, candidates)
+        best = max(scores.items(), key=lambda item: (item[1][0], -[name for name, _ in gt_texts].index(item[0])))
+        gt_name, lev_dist, nld = exact_best(gt_texts, ocr_text)
+        assert (best[0], best[1][1], best[1][0]) == (gt_name, lev_dist, nld)
+        # Every kept score is exact
+        for name, (split_nld, split_lev_dist) in scores.items():
+            assert (split_nld, split_lev_dist) == compute_nld(dict(gt_texts)[name], ocr_text)
+
+def test_evaluate_services_matches_exact_scores(tmp_path):
+    gt_texts = write_corpus(tmp_path, random.Random(1))
+    cache_path = tmp_path / 'nld_cache.json'
+    # The second run is seeded by the scores cached by the first one
+    for _ in range(2):
+        _, evaluation = evaluate_services(SERVICES, gt_dir=tmp_path / 'ground_truth', results_root=tmp_path / 'results', max_workers=1, cache_path=cache_path)
+        for service in SERVICES:
+            for base, splits in gt_texts.items():
+                ocr_text = normalize_text_for_comparison((tmp_path / 'results' / service / 'testing' / f'{service}_{base}_comp.txt').read_text(encoding='utf-8'))
+                gt_name, lev_dist, nld = exact_best(splits, ocr_text)
+                assert evaluation[service][base] == [(f'{service}_{base}_comp.txt', gt_name, lev_dist, nld)]
+
+def test_summary_matrix_holds_the_best_scores(tmp_path):
+    write_corpus(tmp_path, random.Random(2))
+    gt_grouped, evaluation = evaluate_services(SERVICES, gt_dir=tmp_path / 'ground_truth', results_root=tmp_path / 'results', max_workers=1, use_cache=False)
+    gt_names, nld_matrix, ld_matrix = summary_matrix(gt_grouped, evaluation, SERVICES)
+    assert gt_names == [f'exam_{n}.txt' for n in range(1, 16)]
+    for i, service in enumerate(SERVICES):
+        for j, base in enumerate(gt_grouped):
+            (_, _, lev_dist, nld), = evaluation[service][base]
+            assert (nld_matrix[i, j], ld_matrix[i, j]) == (nld, lev_dist)
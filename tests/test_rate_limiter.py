@@ -0,0 +1,113 @@
+# Import external modules
+import asyncio, sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'app'))
+
+# Import self-made modules
+import rate_limiter
+from rate_limiter import RateLimiter, TokenBucket, get_rate_limiter, rate_limited_call, rate_limited_call_async
+
+class FakeClock:
+    '''Stands in for the time module of rate_limiter, the time only moves when a test advances it.'''
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+class ProviderError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers={'retry-after': '0'})
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, 'time', clock)
+    # Every test starts with fresh shared limiters
+    monkeypatch.setattr(rate_limiter, '_rate_limiters', {})
+    return clock
+
+def test_token_bucket_refills_up_to_its_capacity(clock):
+    bucket = TokenBucket(60)
+    bucket.consume(60)
+    assert bucket.wait_time(10) == pytest.approx(10)
+    bucket.refill(clock.now + 5)
+    assert bucket.tokens == pytest.approx(5)
+    bucket.refill(clock.now + 600)
+    assert bucket.tokens == 60
+    # A request larger than the bucket only waits for a full bucket
+    bucket.consume(60)
+    assert bucket.wait_time(500) == pytest.approx(60)
+
+def test_requests_wait_for_the_quota(clock):
+    limiter = RateLimiter(rpm=2)
+    assert limiter.try_acquire()[0] is not None
+    assert limiter.try_acquire()[0] is not None
+    reservation, wait = limiter.try_acquire()
+    assert reservation is None and wait == pytest.approx(30)
+    clock.now += 30
+    assert limiter.try_acquire()[0] is not None
+
+def test_settle_refunds_and_charges_the_real_usage(clock):
+    limiter = RateLimiter(input_tpm=1000, output_tpm=100)
+    reservation = limiter.acquire(600, 80)
+    limiter.settle(reservation, 100, None)
+    assert limiter.buckets['input_tokens'].tokens == pytest.approx(900)
+    # None keeps the estimate
+    assert limiter.buckets['output_tokens'].tokens == pytest.approx(20)
+    # An under-estimate leaves the bucket in debt, the next request waits until it is refilled
+    reservation = limiter.acquire(100, 0)
+    limiter.settle(reservation, 1500, 0)
+    assert limiter.buckets['input_tokens'].tokens == pytest.approx(-600)
+    assert limiter.try_acquire(100, 0)[1] == pytest.approx(700 / (1000 / 60))
+
+def test_pause_stops_every_request(clock):
+    limiter = RateLimiter(rpm=100)
+    limiter.pause(5)
+    reservation, wait = limiter.try_acquire()
+    assert reservation is None and wait == pytest.approx(5)
+    clock.now += 5
+    assert limiter.try_acquire()[0] is not None
+
+@pytest.mark.parametrize('error', [TimeoutError('read timeout'), ProviderError(500), ProviderError(429)])
+def test_failed_request_refunds_its_tokens(clock, error):
+    def request():
+        raise error
+    with pytest.raises(type(error)):
+        rate_limited_call('claude', 'test-model', request, estimated_input_tokens=30_000, estimated_output_tokens=4_000, max_retries=0)
+    limiter = get_rate_limiter('claude', 'test-model')
+    assert limiter.buckets['input_tokens'].tokens == limiter.buckets['input_tokens'].capacity
+    assert limiter.buckets['output_tokens'].tokens == limiter.buckets['output_tokens'].capacity
+    # The request itself was sent, it stays counted
+    assert limiter.buckets['requests'].tokens == limiter.buckets['requests'].capacity - 1
+
+def test_rate_limited_request_is_retried_and_settled(clock):
+    responses = iter([ProviderError(429), 'response'])
+    def request():
+        response = next(responses)
+        if isinstance(response, Exception):
+            raise response
+        return response
+    stats = {}
+    response = rate_limited_call('claude', 'test-model', request, 30_000, 4_000, read_usage=lambda response: (1_000, 200), stats=stats)
+    limiter = get_rate_limiter('claude', 'test-model')
+    assert response == 'response' and stats['retries'] == 1
+    assert limiter.buckets['input_tokens'].tokens == limiter.buckets['input_tokens'].capacity - 1_000
+    assert limiter.buckets['output_tokens'].tokens == limiter.buckets['output_tokens'].capacity - 200
+
+def test_failed_async_request_refunds_its_tokens(clock):
+    async def request():
+        raise TimeoutError('read timeout')
+    with pytest.raises(TimeoutError):
+        asyncio.run(rate_limited_call_async('claude', 'test-model', lambda: request(), estimated_input_tokens=30_000))
+    limiter = get_rate_limiter('claude', 'test-model')
+    assert limiter.buckets['input_tokens'].tokens == limiter.buckets['input_tokens'].capacity
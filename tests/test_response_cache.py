@@ -0,0 +1,56 @@
+# Import external modules
+import json, os, sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'app'))
+
+# Import self-made modules
+from response_cache import ResponseCache
+
+# Entries are evicted least recently used first once the cache grows over its size bound.
+
+ENTRY = {'text': 'x' * 100}
+ENTRY_BYTES = len(json.dumps(ENTRY).encode('utf-8'))
+
+def make_keys(count: int) -> list[str]:
+    return [ResponseCache.make_key('claude', 'model', 'prompt', f'image_{i}') for i in range(count)]
+
+def test_hit_and_miss(tmp_path):
+    cache = ResponseCache(tmp_path)
+    key, other_key = make_keys(2)
+    assert cache.get(key) is None
+    cache.put(key, ENTRY)
+    assert cache.get(key) == ENTRY
+    assert cache.get(other_key) is None
+    # The key covers the provider, model, request and image
+    assert len({ResponseCache.make_key('claude', 'model', 'prompt', 'image'), ResponseCache.make_key('gpt', 'model', 'prompt', 'image'),
+                ResponseCache.make_key('claude', 'model', 'other prompt', 'image'), ResponseCache.make_key('claude', 'model', 'prompt', 'other image')}) == 4
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = ResponseCache(tmp_path, max_bytes=3 * ENTRY_BYTES)
+    keys = make_keys(4)
+    for age, key in enumerate(keys[:3]):
+        cache.put(key, ENTRY)
+        os.utime(cache.entry_path(key), (1000 + age, 1000 + age))
+    # Reading the oldest entry makes it the most recently used
+    assert cache.get(keys[0]) == ENTRY
+    cache.put(keys[3], ENTRY)
+    assert cache.get(keys[1]) is None
+    assert all(cache.get(key) == ENTRY for key in (keys[0], keys[2], keys[3]))
+    assert cache.size == 3 * ENTRY_BYTES
+
+def test_overwrite_and_reload_keep_the_size(tmp_path):
+    cache = ResponseCache(tmp_path)
+    key, other_key = make_keys(2)
+    cache.put(key, ENTRY)
+    cache.put(key, ENTRY)
+    cache.put(other_key, {'text': ''})
+    assert cache.size == ENTRY_BYTES + len(json.dumps({'text': ''}))
+    assert ResponseCache(tmp_path).size == cache.size
+
+def test_corrupted_entry_is_a_miss(tmp_path):
+    cache = ResponseCache(tmp_path)
+    key, = make_keys(1)
+    cache.put(key, ENTRY)
+    cache.entry_path(key).write_text('{half written', encoding='utf-8')
+    assert cache.get(key) is None
@@ -0,0 +1,61 @@
+# Import external modules
+import asyncio, sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'app'))
+
+# Import self-made modules
+from run_manifest import RunManifest, hash_request
+
+# An image counts as completed only while its result file still holds the text its run wrote.
+
+def run(manifest: RunManifest, results_dir: Path, key: str, text: str):
+    def analyse(image_path):
+        result_file = results_dir / 'svc_exam_1_comp.txt'
+        result_file.write_text(text, encoding='utf-8')
+        return {'result_file': result_file}
+    return manifest.run_image('exam_1_comp.png', key, analyse)
+
+def test_completed_image_is_skipped_after_a_reload(tmp_path):
+    manifest = RunManifest(tmp_path / 'run_manifest.json')
+    key = RunManifest.make_key('svc', 'model', hash_request({'prompt': 'A'}), 'image')
+    run(manifest, tmp_path, key, 'text of prompt A')
+    reloaded = RunManifest(tmp_path / 'run_manifest.json')
+    assert reloaded.is_completed(key)
+    assert reloaded.pending(['exam_1_comp.png'], {'exam_1_comp.png': key}) == []
+
+def test_result_overwritten_by_another_prompt_runs_again(tmp_path):
+    manifest = RunManifest(tmp_path / 'run_manifest.json')
+    key_a = RunManifest.make_key('svc', 'model', hash_request({'prompt': 'A'}), 'image')
+    key_b = RunManifest.make_key('svc', 'model', hash_request({'prompt': 'B'}), 'image')
+    run(manifest, tmp_path, key_a, 'text of prompt A')
+    run(manifest, tmp_path, key_b, 'text of prompt B')
+    # The shared result file holds the text of prompt B, going back to prompt A runs the image again
+    assert not manifest.is_completed(key_a)
+    assert manifest.is_completed(key_b)
+    run(manifest, tmp_path, key_a, 'text of prompt A')
+    assert manifest.is_completed(key_a) and not manifest.is_completed(key_b)
+
+def test_missing_or_edited_result_runs_again(tmp_path):
+    manifest = RunManifest(tmp_path / 'run_manifest.json')
+    key = RunManifest.make_key('svc', 'model', 'prompt', 'image')
+    run(manifest, tmp_path, key, 'text')
+    (tmp_path / 'svc_exam_1_comp.txt').write_text('edited', encoding='utf-8')
+    assert not manifest.is_completed(key)
+    (tmp_path / 'svc_exam_1_comp.txt').unlink()
+    assert not manifest.is_completed(key)
+
+def test_failed_image_is_pending(tmp_path):
+    manifest = RunManifest(tmp_path / 'run_manifest.json')
+    def analyse(image_path):
+        raise RuntimeError('boom')
+    async def analyse_async(image_path):
+        raise RuntimeError('boom')
+    assert manifest.run_image('exam_1_comp.png', 'key', analyse) is None
+    assert asyncio.run(manifest.run_image_async('exam_2_comp.png', 'key_2', analyse_async)) is None
+    assert manifest.failed_images({'exam_1_comp.png': 'key', 'exam_2_comp.png': 'key_2'}) == ['exam_1_comp.png', 'exam_2_comp.png']
+    assert manifest.pending(['exam_1_comp.png'], {'exam_1_comp.png': 'key'}) == ['exam_1_comp.png']
+
+def test_corrupted_manifest_runs_everything(tmp_path):
+    (tmp_path / 'run_manifest.json').write_text('{not json', encoding='utf-8')
+    assert RunManifest(tmp_path / 'run_manifest.json').pending(['a.png'], {'a.png': 'key'}) == ['a.png']
@@ -0,0 +1,64 @@
+# Import external modules
+import itertools, sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'app'))
+
+# Import self-made modules
+import significance
+from significance import bootstrap_confidence_interval, chunk_sizes, compare_with_best, format_p_value, paired_permutation_test
+
+# Drawing the resamples in chunks must give the same intervals and p-values as drawing them all at once.
+
+def reference_bootstrap(values, resamples: int, confidence: float = 0.95, seed: int = 0) -> tuple[float, float]:
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    means = values[np.random.default_rng(seed).integers(0, values.size, size=(resamples, values.size))].mean(axis=1)
+    low, high = np.quantile(means, [(1 - confidence) / 2, 1 - (1 - confidence) / 2])
+    return float(low), float(high)
+
+def reference_permutation(differences, resamples: int, seed: int = 0) -> float:
+    signs = 1 - 2 * np.random.default_rng(seed).integers(0, 2, size=(resamples, differences.size), dtype=np.int8)
+    extreme = int((np.abs((signs * differences).mean(axis=1)) >= abs(differences.mean()) - 1e-12).sum())
+    return (extreme + 1) / (resamples + 1)
+
+@pytest.fixture(params=[7, 1000])
+def chunk_size(request, monkeypatch):
+    monkeypatch.setattr(significance, 'RESAMPLE_CHUNK_SIZE', request.param)
+    return request.param
+
+def test_chunk_sizes_cover_every_resample(chunk_size):
+    for resamples in (1, chunk_size, chunk_size + 1, 2500):
+        sizes = chunk_sizes(resamples)
+        assert sum(sizes) == resamples and max(sizes) <= chunk_size
+
+def test_chunked_bootstrap_matches_one_draw(chunk_size):
+    values = np.random.default_rng(1).random(57)
+    values[[3, 10]] = np.nan
+    assert bootstrap_confidence_interval(values, resamples=2500) == reference_bootstrap(values, 2500)
+
+def test_chunked_permutation_test_matches_one_draw(chunk_size):
+    rng = np.random.default_rng(2)
+    values_a, values_b = rng.random(40), rng.random(40) * 0.9
+    assert paired_permutation_test(values_a, values_b, resamples=2500) == reference_permutation(values_a - values_b, 2500)
+
+def test_exact_permutation_test_enumerates_every_sign():
+    differences = np.array([0.3, -0.1, 0.2, 0.05, 0.4])
+    flipped_means = [abs(np.mean(np.array(signs) * differences)) for signs in itertools.product([1, -1], repeat=differences.size)]
+    expected = np.mean([mean >= abs(differences.mean()) - 1e-12 for mean in flipped_means])
+    assert paired_permutation_test(differences, np.zeros(5)) == pytest.approx(expected)
+
+def test_missing_scores():
+    assert bootstrap_confidence_interval([np.nan, np.nan]) is None
+    assert paired_permutation_test([1.0, np.nan], [np.nan, 0.5]) is None
+    assert compare_with_best(np.full((2, 3), np.nan), np.full(2, np.nan)) == (None, [None, None])
+
+def test_services_are_compared_with_the_best():
+    nld_matrix = np.array([[0.5] * 20, [0.9] * 20, [0.89] * 19 + [np.nan]])
+    best, p_values = compare_with_best(nld_matrix, np.nanmean(nld_matrix, axis=1))
+    assert best == 1 and p_values[1] is None
+    assert p_values[0] < significance.SIGNIFICANCE_LEVEL
+    assert format_p_value(p_values[0]).endswith('*') and format_p_value(None) == '-'